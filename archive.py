@@ -0,0 +1,204 @@
+# archive.py - Compressed, append-only archive segments for old chat
+#
+# Messages of expired rooms are moved out of the hot SQLite file into
+# segment files under ARCHIVE_DIR:
+#
+#   segment-000001.seg   zlib-compressed JSON blocks, appended back to back
+#   segment-000001.idx   one JSON line per block: room, the room's created_at,
+#                        offset, length, crc, message count and id range
+#
+# A room ID can be taken again once its room has expired, so each block
+# records which incarnation of the room (its created_at) it came from, and
+# reads return it with every message. Only the admin reads the archive.
+#
+# Data is fsynced before its index line is written, so a crash can at worst
+# leave an unreferenced block behind. The per-room index is held in memory;
+# reads decompress only that room's blocks, straight out of an mmap of the
+# segment. A segment is sealed once it grows past `segment_max_bytes`.
+#
+# Only one process archives (the sweeping worker), but every worker reads.
+# Reads first pick up index lines appended since the last look, so a block
+# is readable everywhere as soon as its index line is written.
+#
+# Everything here is blocking file IO: call it from the DB writer thread
+# (archiving) or through run_in_executor (reads), never on the event loop.
+import glob
+import json
+import mmap
+import os
+import threading
+import zlib
+
+
+class ChatArchive:
+    def __init__(self, directory, segment_max_bytes=64 * 1024 * 1024, compress_level=6):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._index = {}  # room_id -> [(segment, offset, length, crc, count, min_id, max_id, created_at)]
+        self._maps = {}  # segment -> (mmap, mapped size)
+        self._indexed = {}  # segment -> bytes of its .idx already in _index
+        self._segment = 0
+        self._segment_size = 0
+
+        self.blocks = 0
+        self.messages = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, segment, ext):
+        return os.path.join(self.directory, f'segment-{segment:06d}.{ext}')
+
+    def _load(self):
+        self._refresh()
+        if self._segment:
+            self._segment_size = os.path.getsize(self._path(self._segment, 'seg'))
+        else:
+            self._segment = 1
+
+    def _refresh(self):
+        # Index whatever was appended to the .idx files since the last look
+        for idx_path in sorted(glob.glob(os.path.join(self.directory, 'segment-*.idx'))):
+            segment = int(os.path.basename(idx_path)[8:14])
+            self._scan(segment)
+            self._segment = max(self._segment, segment)
+
+    def _scan(self, segment):
+        done = self._indexed.get(segment, 0)
+        try:
+            with open(self._path(segment, 'idx'), 'rb') as f:
+                if os.fstat(f.fileno()).st_size <= done:
+                    return
+                f.seek(done)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break  # still being written
+            done += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn by a crash
+            self._add_entry(segment, entry)
+        self._indexed[segment] = done
+
+    def _add_entry(self, segment, entry):
+        self._index.setdefault(entry['room'], []).append((
+            segment, entry['offset'], entry['length'], entry['crc'],
+            entry['count'], entry['min_id'], entry['max_id'], entry.get('created')
+        ))
+        self.blocks += 1
+        self.messages += entry['count']
+        self.raw_bytes += entry.get('raw', 0)
+        self.stored_bytes += entry['length']
+
+    # -----------------------------
+    # Writing
+    # -----------------------------
+    def append(self, rows):
+        """Archive message dicts (id, room_id, client_id, username, message, timestamp, room_created_at).
+
+        Writes one block per room incarnation; returns the number of messages archived.
+        """
+        by_room = {}
+        for row in rows:
+            by_room.setdefault((row['room_id'], row.get('room_created_at')), []).append(row)
+
+        with self._lock:
+            for (room_id, created_at), messages in by_room.items():
+                messages.sort(key=lambda m: m['id'])
+                raw = json.dumps(messages, separators=(',', ':')).encode()
+                block = zlib.compress(raw, self.compress_level)
+
+                if self._segment_size and self._segment_size + len(block) > self.segment_max_bytes:
+                    self._segment += 1
+                    self._segment_size = 0
+
+                offset = self._segment_size
+                with open(self._path(self._segment, 'seg'), 'ab') as f:
+                    f.write(block)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._segment_size += len(block)
+
+                entry = {
+                    'room': room_id, 'created': created_at, 'offset': offset, 'length': len(block), 'crc': zlib.crc32(block),
+                    'count': len(messages), 'min_id': messages[0]['id'], 'max_id': messages[-1]['id'],
+                    'raw': len(raw),
+                }
+                with open(self._path(self._segment, 'idx'), 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._scan(self._segment)
+        return len(rows)
+
+    # -----------------------------
+    # Reading
+    # -----------------------------
+    def _read_block(self, segment, offset, length, crc):
+        mapped = self._maps.get(segment)
+        if mapped is None or mapped[1] < offset + length:
+            if mapped is not None:
+                mapped[0].close()
+            with open(self._path(segment, 'seg'), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                mapped = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size)
+            self._maps[segment] = mapped
+        block = mapped[0][offset:offset + length]
+        if zlib.crc32(block) != crc:
+            raise ValueError(f'corrupt archive block in segment {segment} at offset {offset}')
+        return json.loads(zlib.decompress(block))
+
+    def read(self, room_id, before_id=None, limit=100):
+        """Newest `limit` archived messages of a room ID with id < before_id.
+
+        Returns {'messages': [...], 'has_more': bool} with messages oldest
+        first, in the shape of Storage.get_history plus room_created_at, the
+        incarnation of the room each message belongs to.
+        """
+        with self._lock:
+            self._refresh()
+            blocks = sorted(self._index.get(room_id, ()), key=lambda b: b[6], reverse=True)
+            page, seen = [], set()
+            has_more = False
+            for segment, offset, length, crc, count, min_id, max_id, created_at in blocks:
+                if before_id is not None and min_id >= before_id:
+                    continue
+                if len(page) >= limit:
+                    has_more = True
+                    break
+                for m in reversed(self._read_block(segment, offset, length, crc)):
+                    if (before_id is not None and m['id'] >= before_id) or m['id'] in seen:
+                        continue
+                    if len(page) >= limit:
+                        has_more = True
+                        break
+                    seen.add(m['id'])
+                    page.append({'id': m['id'], 'username': m['username'], 'message': m['message'],
+                                 'timestamp': m['timestamp'], 'room_created_at': created_at})
+        page.sort(key=lambda m: m['id'])
+        return {'messages': page, 'has_more': has_more}
+
+    def close(self):
+        with self._lock:
+            for mapped, _ in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    def stats(self):
+        return {
+            'segments': self._segment if self.blocks else 0,
+            'rooms': len(self._index),
+            'blocks': self.blocks,
+            'messages': self.messages,
+            'stored_bytes': self.stored_bytes,
+            'raw_bytes': self.raw_bytes,
+            'compression_ratio': round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else 0.0,
+        }
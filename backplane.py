@@ -0,0 +1,373 @@
+# backplane.py - Room state shared between worker processes
+#
+# With WORKERS > 1 the supervisor (supervisor.py) starts several copies of
+# the server on the same port (SO_REUSEPORT), and the kernel spreads
+# connections across them. Members of one room can therefore be connected to
+# different workers. A Broker in the supervisor process owns what has to be
+# agreed on across workers:
+#
+#   redeemed join tokens    a token works once, whichever worker it is shown to
+#   membership              the room size limit, binary handles, who is on which worker
+#   resume tokens           a reconnect may land on another worker (handoff)
+#   live workers            the hash ring that gives each room an owner (hash_ring.py);
+#                           a draining worker (drain.py) is left out of it
+#
+# Each worker holds a BackplaneClient. Its local room registry lists members
+# on other workers as RemoteParticipants, whose send() publishes the frame to
+# the broker, which forwards it to the member's worker. Everything else
+# (relay, ICE coalescing, broadcasts) works as in a single process.
+#
+# The connection is a Unix socket carrying length-prefixed messages: a JSON
+# header and a raw body, so relayed frame text is forwarded without being
+# re-encoded.
+import asyncio
+import os
+import struct
+import time
+
+import codec
+from frames import as_frame
+from hash_ring import HashRing
+
+_LENGTHS = struct.Struct('>II')
+
+
+class Channel:
+    """One end of a broker connection: one-way messages plus request/reply."""
+
+    def __init__(self, reader, writer, handler):
+        self.reader = reader
+        self.writer = writer
+        self.handler = handler  # handler(channel, header, body), may be a coroutine function
+        self.worker = None
+        self.closed = False
+        self._pending = {}  # request id -> Future
+        self._next_id = 1
+
+    def send(self, header, body=b''):
+        data = codec.dumps(header).encode()
+        self.writer.write(_LENGTHS.pack(len(data), len(body)) + data + body)
+
+    async def request(self, header, body=b''):
+        if self.closed:
+            raise ConnectionError('backplane connection lost')
+        rid = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[rid] = future
+        try:
+            self.send({**header, 'rid': rid}, body)
+            return await future
+        finally:
+            self._pending.pop(rid, None)
+
+    def reply(self, header, fields):
+        self.send({**fields, 're': header['rid']})
+
+    async def run(self):
+        try:
+            while True:
+                header_len, body_len = _LENGTHS.unpack(await self.reader.readexactly(_LENGTHS.size))
+                data = await self.reader.readexactly(header_len + body_len)
+                header, body = codec.loads(data[:header_len]), data[header_len:]
+                future = self._pending.get(header.pop('re', None))
+                if future is not None:
+                    if not future.done():
+                        future.set_result(header)
+                    # Let the requester act on the reply before anything sent after it
+                    await asyncio.sleep(0)
+                    continue
+                result = self.handler(self, header, body)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.closed = True
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('backplane connection lost'))
+            self.writer.close()
+
+
+class Broker:
+    def __init__(self, path, replay_filter):
+        self.path = path
+        self.replay_filter = replay_filter  # join_tokens.ReplayFilter
+        self._server = None
+        self._workers = {}  # worker id -> Channel
+        self._draining = set()  # worker ids
+        self._rooms = {}  # room_id -> {'members': {client_id: member}, 'next_handle': int}
+        self._resume = {}  # resume token -> (room_id, client_id)
+
+        # Metrics
+        self.forwarded = 0
+        self.handoffs = 0
+        self.lost_members = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._accept, self.path)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _accept(self, reader, writer):
+        channel = Channel(reader, writer, self._handle)
+        await channel.run()
+        if channel.worker is not None and self._workers.get(channel.worker) is channel:
+            del self._workers[channel.worker]
+            self._draining.discard(channel.worker)
+            self._worker_gone(channel.worker)
+            self._announce_workers()
+
+    def _room(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = {'members': {}, 'next_handle': 1}
+        return room
+
+    def _hosts(self, room, exclude=None):
+        return {m['worker'] for m in room['members'].values()} - {exclude}
+
+    def _notify(self, workers, header):
+        for worker in workers:
+            channel = self._workers.get(worker)
+            if channel is not None:
+                channel.send(header)
+
+    def _announce_workers(self):
+        # Every worker keeps the same hash ring of room owners (hash_ring.py)
+        self._notify(self._workers, {'op': 'workers', 'workers': sorted(set(self._workers) - self._draining)})
+
+    def ready(self, worker):
+        """Whether `worker` is connected and taking rooms."""
+        return worker in self._workers and worker not in self._draining
+
+    def _members_except(self, room, client_id):
+        return [[cid, m['username'], m['handle']] for cid, m in room['members'].items() if cid != client_id]
+
+    def _handle(self, channel, header, body):
+        op = header['op']
+        if op == 'send':
+            member = self._rooms.get(header['room'], {}).get('members', {}).get(header['to'])
+            target = self._workers.get(member['worker']) if member else None
+            if target is not None:
+                self.forwarded += 1
+                target.send({'op': 'deliver', 'room': header['room'], 'to': header['to'], 'type': header['type']},
+                            body)
+        elif op == 'hello':
+            channel.worker = header['worker']
+            self._workers[channel.worker] = channel
+            self._draining.discard(channel.worker)
+            for room_id, room in self._rooms.items():
+                if room['members']:
+                    channel.send({'op': 'active', 'room': room_id, 'on': True})
+            self._announce_workers()
+        elif op == 'claim':
+            self._claim(channel, header)
+        elif op == 'leave':
+            self._leave(header['room'], header['client_id'])
+        elif op == 'resume':
+            return self._resume_elsewhere(channel, header)
+        elif op == 'drain':
+            # Its rooms get new owners; its members stay until they have moved
+            self._draining.add(channel.worker)
+            self._announce_workers()
+            channel.reply(header, {})
+        elif op == 'stats':
+            channel.reply(header, self.stats())
+
+    def _claim(self, channel, header):
+        # The worker has checked the token's signature; here it is used up
+        if not self.replay_filter.add(bytes.fromhex(header['signature'])):
+            channel.reply(header, {'error': 'token_used'})
+            return
+        room_id = header['room']
+        room = self._room(room_id)
+        if len(room['members']) >= header['limit']:
+            channel.reply(header, {'error': 'room_full'})
+            return
+
+        client_id = header['client_id']
+        username = header['username']
+        handle = room['next_handle']
+        room['next_handle'] += 1
+        others = self._hosts(room, exclude=channel.worker)
+        if not room['members']:
+            self._notify(self._workers, {'op': 'active', 'room': room_id, 'on': True})
+        room['members'][client_id] = {'worker': channel.worker, 'username': username, 'handle': handle,
+                                      'resume_token': header['resume_token']}
+        self._resume[header['resume_token']] = (room_id, client_id)
+        channel.reply(header, {'username': username, 'handle': handle,
+                               'members': self._members_except(room, client_id)})
+        self._notify(others, {'op': 'joined', 'room': room_id, 'client_id': client_id,
+                              'username': username, 'handle': handle})
+
+    def _leave(self, room_id, client_id, lost=False):
+        room = self._rooms.get(room_id)
+        member = room['members'].pop(client_id, None) if room else None
+        if member is None:
+            return
+        self._resume.pop(member['resume_token'], None)
+        # A worker that died could not tell its room; the others do it for it
+        self._notify(self._hosts(room, exclude=member['worker']),
+                     {'op': 'left', 'room': room_id, 'client_id': client_id, 'lost': lost})
+        if not room['members']:
+            self._notify(self._workers, {'op': 'active', 'room': room_id, 'on': False})
+            del self._rooms[room_id]
+
+    async def _resume_elsewhere(self, channel, header):
+        room_id, client_id = self._resume.get(header['resume_token'], (None, None))
+        member = self._rooms[room_id]['members'].get(client_id) if room_id else None
+        holder = self._workers.get(member['worker']) if member else None
+        if holder is None or holder is channel:
+            channel.reply(header, {'error': 'unknown_session'})
+            return
+        try:
+            state = await holder.request({'op': 'handoff', 'room': room_id, 'client_id': client_id,
+                                          'last_seq': header['last_seq']})
+        except ConnectionError:
+            state = {'error': 'holder_gone'}
+        if state.get('error') or room_id not in self._rooms or client_id not in self._rooms[room_id]['members']:
+            channel.reply(header, {'error': state.get('error', 'unknown_session')})
+            return
+
+        self.handoffs += 1
+        room = self._rooms[room_id]
+        member['worker'] = channel.worker
+        channel.reply(header, {'client_id': client_id, 'username': member['username'], 'handle': member['handle'],
+                               'frames': state['frames'], 'members': self._members_except(room, client_id)})
+
+    def _worker_gone(self, worker):
+        for room_id, room in list(self._rooms.items()):
+            for client_id in [cid for cid, m in room['members'].items() if m['worker'] == worker]:
+                self.lost_members += 1
+                self._leave(room_id, client_id, lost=True)
+
+    def stats(self):
+        return {
+            'workers': sorted(self._workers),
+            'draining': sorted(self._draining),
+            'rooms': sum(1 for room in self._rooms.values() if room['members']),
+            'members': sum(len(room['members']) for room in self._rooms.values()),
+            'join_tokens': self.replay_filter.stats(),
+            'forwarded': self.forwarded,
+            'handoffs': self.handoffs,
+            'lost_members': self.lost_members,
+        }
+
+
+class BackplaneClient:
+    def __init__(self, path, worker, handler, vnodes=160):
+        self.path = path
+        self.worker = worker
+        self.handler = handler  # handler(header, body) for frames and membership changes
+        self.active_rooms = set()  # rooms with members on any worker
+        self.ring = HashRing(vnodes=vnodes)  # live workers, for room_owner()
+        self._channel = None
+        self._task = None
+
+        # Metrics
+        self.published = 0
+        self.delivered = 0
+        self.requests = 0
+        self.total_request_ms = 0.0
+        self.max_request_ms = 0.0
+
+    async def connect(self, on_lost=None):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self._channel = Channel(reader, writer, self._handle)
+        self._channel.send({'op': 'hello', 'worker': self.worker})
+        self._task = asyncio.create_task(self._run(on_lost))
+
+    async def _run(self, on_lost):
+        await self._channel.run()
+        if on_lost is not None and self._task is not None:
+            on_lost()
+
+    async def close(self):
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        self._channel.writer.close()
+        await task
+
+    def _handle(self, channel, header, body):
+        if header['op'] == 'active':
+            (self.active_rooms.add if header['on'] else self.active_rooms.discard)(header['room'])
+            return
+        if header['op'] == 'workers':
+            live = set(header['workers'])
+            for worker in self.ring.nodes - live:
+                self.ring.remove(worker)
+            for worker in live - self.ring.nodes:
+                self.ring.add(worker)
+            return
+        if header['op'] == 'deliver':
+            self.delivered += 1
+        result = self.handler(header, body)
+        if header.get('rid') is not None:
+            channel.reply(header, result or {})
+
+    def room_owner(self, room_id):
+        """The worker a room's members should connect to, or None before the first worker list."""
+        return self.ring.node_for(room_id)
+
+    def publish(self, room_id, client_id, frame):
+        """Hand a Frame to a member connected to another worker."""
+        self.published += 1
+        self._channel.send({'op': 'send', 'room': room_id, 'to': client_id, 'type': frame.type},
+                           frame.text.encode())
+
+    def notify(self, op, **fields):
+        self._channel.send({'op': op, **fields})
+
+    async def request(self, op, **fields):
+        started = time.perf_counter()
+        reply = await self._channel.request({'op': op, **fields})
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.requests += 1
+        self.total_request_ms += elapsed_ms
+        self.max_request_ms = max(self.max_request_ms, elapsed_ms)
+        return reply
+
+    def stats(self):
+        return {
+            'worker': self.worker,
+            'published': self.published,
+            'delivered': self.delivered,
+            'requests': self.requests,
+            'avg_request_ms': round(self.total_request_ms / self.requests, 3) if self.requests else 0.0,
+            'max_request_ms': round(self.max_request_ms, 3),
+            'active_rooms': len(self.active_rooms),
+            'ring_workers': sorted(self.ring.nodes),
+        }
+
+
+class RemoteParticipant:
+    """A room member connected to another worker; frames for it go over the backplane."""
+
+    remote = True
+    closed = False
+    suspended = False
+
+    def __init__(self, backplane, room_id, client_id, username):
+        self.backplane = backplane
+        self.room_id = room_id
+        self.id = client_id
+        self.username = username
+        self.handle = 0
+
+    def __repr__(self):
+        return f'<RemoteParticipant {self.id[:8]} {self.username!r}>'
+
+    def send(self, frame):
+        self.backplane.publish(self.room_id, self.id, as_frame(frame))
+        return True
@@ -0,0 +1,107 @@
+# benchmarks/bench_codec.py - JSON codec cost on realistic signalling payloads
+#
+# Times decode and encode of the frames the server actually handles: a
+# multi-kilobyte SDP offer, a trickle ICE candidate and a chat broadcast.
+# Compares stdlib json against orjson (when installed) and shows the
+# regex routing used for relayed signalling (frames.RELAY_ROUTE), which
+# skips decoding entirely, and the size and decode cost of the same frames
+# in the binary subprotocol (binary_protocol.py, when msgpack is installed).
+#
+#   python benchmarks/bench_codec.py [--iterations 20000]
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import binary_protocol  # noqa: E402
+import codec  # noqa: E402
+from frames import RELAY_ROUTE  # noqa: E402
+from participants import ParticipantRegistry  # noqa: E402
+
+SENDER, TARGET = str(uuid.uuid4()), str(uuid.uuid4())
+
+
+def sdp_offer(tracks=2, candidates=12):
+    lines = [
+        'v=0', 'o=- 4611731400430051336 2 IN IP4 127.0.0.1', 's=-', 't=0 0',
+        'a=group:BUNDLE ' + ' '.join(str(t) for t in range(tracks)), 'a=msid-semantic: WMS stream',
+    ]
+    for t in range(tracks):
+        kind = 'audio' if t == 0 else 'video'
+        lines += [
+            f'm={kind} 9 UDP/TLS/RTP/SAVPF 111 63 103 104 9 0 8 106 105 13 110 112 113 126',
+            'c=IN IP4 0.0.0.0', 'a=rtcp:9 IN IP4 0.0.0.0',
+            'a=ice-ufrag:Xk3b', 'a=ice-pwd:Qb8yD2x0nVvW9hK4mE1rT6uA', 'a=ice-options:trickle',
+            'a=fingerprint:sha-256 ' + ':'.join(f'{(i * 37) % 256:02X}' for i in range(32)),
+            'a=setup:actpass', f'a=mid:{t}', 'a=sendrecv', 'a=rtcp-mux',
+        ]
+        lines += [f'a=rtpmap:{pt} opus/48000/2' for pt in (111, 63, 103, 104, 9, 0, 8)]
+        lines += [f'a=rtcp-fb:{pt} transport-cc' for pt in (111, 63, 103, 104)]
+        lines += [f'a=ssrc:{1000 + t} cname:user{t}@host' for _ in range(2)]
+        lines += [f'a=candidate:{i} 1 udp 2122260223 192.168.1.{i} {50000 + i} typ host generation 0'
+                  for i in range(candidates)]
+    return {'type': 'offer', 'sender_id': SENDER, 'target_id': TARGET,
+            'offer': {'type': 'offer', 'sdp': '\r\n'.join(lines) + '\r\n'}}
+
+
+PAYLOADS = {
+    'sdp_offer': sdp_offer(),
+    'ice_candidate': {
+        'type': 'ice_candidate', 'sender_id': SENDER, 'target_id': TARGET,
+        'candidate': {'candidate': 'candidate:842163049 1 udp 1677729535 203.0.113.7 61664 typ srflx '
+                                   'raddr 0.0.0.0 rport 0 generation 0 ufrag Xk3b network-cost 999',
+                      'sdpMid': '0', 'sdpMLineIndex': 0, 'usernameFragment': 'Xk3b'},
+    },
+    'chat': {'type': 'chat', 'username': 'alice', 'message': 'Can everyone see my screen? 👀',
+             'timestamp': '2026-01-01T12:00:00.000000'},
+}
+
+
+class _Peer:
+    def __init__(self, client_id):
+        self.id = client_id
+
+
+def timeit(fn, arg, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON codec microbenchmark')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    codecs = [('json', codec._stdlib_dumps, json.loads)]
+    if codec.orjson is not None:
+        codecs.append(('orjson', codec._orjson_dumps, codec.orjson.loads))
+    print(f'active codec: {codec.NAME}   iterations={args.iterations}')
+
+    handles = ParticipantRegistry()
+    handles.add(_Peer(SENDER))
+    handles.add(_Peer(TARGET))
+
+    for name, payload in PAYLOADS.items():
+        # Browsers send compact JSON.stringify output
+        text = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+        print(f'\n{name} ({len(text.encode())} bytes)')
+        for codec_name, dumps, loads in codecs:
+            print(f'  {codec_name:<8} loads {timeit(loads, text, args.iterations):8.2f}us   '
+                  f'dumps {timeit(dumps, payload, args.iterations):8.2f}us')
+        if RELAY_ROUTE.match(text):
+            print(f'  {"route":<8} match {timeit(RELAY_ROUTE.match, text, args.iterations):8.2f}us')
+        if binary_protocol.available():
+            data = binary_protocol.pack(payload, handles)
+            print(f'  {"msgpack":<8} loads {timeit(binary_protocol.unpack_header, data, args.iterations):8.2f}us   '
+                  f'dumps {timeit(lambda p: binary_protocol.pack(p, handles), payload, args.iterations):8.2f}us   '
+                  f'{len(data)} bytes')
+
+
+if __name__ == '__main__':
+    main()
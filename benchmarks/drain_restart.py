@@ -0,0 +1,134 @@
+# benchmarks/drain_restart.py - What a drain (SIGTERM) does to connected clients
+#
+# Starts main.py, fills --rooms rooms with two chatting participants each and
+# sends it SIGTERM. Checks that, while it drains:
+#
+#   - /create_room and /join_room answer 503 with retry_after_ms
+#   - every client gets a migrate frame, the rooms spread over
+#     DRAIN_STAGGER_SECONDS
+#   - the chat sent before the signal is in the database
+#   - the server exits once the clients have moved on
+#
+# Clients leave when their migrate frame says so. Reports how long the drain
+# took and how the migrations were spread.
+#
+#   python benchmarks/drain_restart.py [--rooms 10] [--stagger 3]
+import argparse
+import asyncio
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+URL = 'http://127.0.0.1:9080'
+
+
+async def wait_for_server(session, timeout=15):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(URL + '/admin/metrics') as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError('server did not start')
+        await asyncio.sleep(0.2)
+
+
+async def connect(session, room_id, username):
+    async with session.post(URL + '/join_room', json={'room_id': room_id, 'password': '',
+                                                      'username': username}) as resp:
+        joined = await resp.json()
+    ws = await session.ws_connect(f"ws://127.0.0.1:9080/ws/{room_id}?token={joined['token']}")
+    assert (await ws.receive_json())['type'] == 'room_ready'
+    return ws
+
+
+async def follow_migrate(ws):
+    """Wait for the migrate frame, then leave after its delay; returns after_ms."""
+    async for msg in ws:
+        data = msg.json()
+        if data['type'] == 'migrate':
+            await asyncio.sleep(data['after_ms'] / 1000)
+            await ws.close()
+            return data['after_ms']
+    raise AssertionError('connection closed without a migrate frame')
+
+
+async def refused(session, path, payload):
+    async with session.post(URL + path, json=payload) as resp:
+        data = await resp.json()
+    assert resp.status == 503 and data.get('retry_after_ms'), f'{path} during a drain: {resp.status} {data}'
+
+
+async def run(args, server, db_path):
+    async with aiohttp.ClientSession() as session:
+        await wait_for_server(session)
+        sockets = []
+        for r in range(args.rooms):
+            room_id = f'drain-{r}'
+            await session.post(URL + '/create_room', json={'room_id': room_id, 'password': ''})
+            a = await connect(session, room_id, 'a')
+            b = await connect(session, room_id, 'b')
+            assert (await a.receive_json())['type'] == 'new_participant'
+            await b.send_json({'type': 'chat', 'message': f'hello {room_id}'})
+            for ws in (a, b):
+                assert (await ws.receive_json())['type'] == 'chat'
+            sockets += [a, b]
+
+        followers = [asyncio.create_task(follow_migrate(ws)) for ws in sockets]
+        started = time.monotonic()
+        server.send_signal(signal.SIGTERM)
+        await asyncio.sleep(0.3)
+        await refused(session, '/create_room', {'room_id': 'drain-new', 'password': ''})
+        await refused(session, '/join_room', {'room_id': 'drain-0', 'password': '', 'username': 'late'})
+
+        delays = await asyncio.gather(*followers)
+    await asyncio.get_running_loop().run_in_executor(None, server.wait, args.stagger + 30)
+    elapsed = time.monotonic() - started
+
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        created = conn.execute("SELECT COUNT(*) FROM rooms WHERE room_id = 'drain-new'").fetchone()[0]
+    assert stored == args.rooms, f'{stored} of {args.rooms} chat messages stored'
+    assert not created, 'a room was created during the drain'
+    assert max(delays) <= args.stagger * 1000, f'migrations spread over {max(delays)} ms'
+    assert server.returncode == 0, f'server exited with {server.returncode}'
+
+    print(f'✅ {len(sockets)} clients in {args.rooms} rooms migrated; new rooms and joins refused; chat kept')
+    print(f'migrate delays: {min(delays)} .. {max(delays)} ms (stagger {args.stagger}s)')
+    print(f'SIGTERM to exit: {elapsed:.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--stagger', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, 'drain.db')
+    env = dict(os.environ, DB_PATH=db_path, DRAIN_STAGGER_SECONDS=str(args.stagger),
+               DRAIN_TIMEOUT_SECONDS=str(args.stagger + 10), HEARTBEAT_INTERVAL_SECONDS='0')
+    server = subprocess.Popen([sys.executable, MAIN], cwd=tmp, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(run(args, server, db_path))
+    except AssertionError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
+    finally:
+        if server.poll() is None:
+            server.kill()
+
+
+if __name__ == '__main__':
+    main()
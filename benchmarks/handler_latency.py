@@ -0,0 +1,124 @@
+# benchmarks/handler_latency.py - join_room / websocket_handler latency in-process
+#
+# Boots the real aiohttp app on a local test server, fills a number of rooms
+# with participants and measures:
+#   join   - POST /join_room round trip
+#   relay  - offer sent by one participant until its target receives it
+#   chat   - chat sent by one participant until every participant has it
+#
+# Run with --storage memory to take the disk out of the picture.
+#
+#   python benchmarks/handler_latency.py [--storage memory|sqlite] [--rooms 20] [--rounds 50]
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+SDP = 'v=0\r\n' + ''.join(f'a=candidate:{i} 1 udp 2122260223 192.168.1.{i} 5{i:04d} typ host\r\n' for i in range(40))
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+
+
+def report(label, samples):
+    print(f'{label:<6} n={len(samples):>6}  p50={percentile(samples, 0.5):7.2f}ms  '
+          f'p95={percentile(samples, 0.95):7.2f}ms  p99={percentile(samples, 0.99):7.2f}ms')
+
+
+class Peer:
+    def __init__(self, ws):
+        self.ws = ws
+        self.inbox = asyncio.Queue()
+        self.id = None
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for msg in self.ws:
+            if msg.type.name == 'TEXT':
+                self.inbox.put_nowait((time.perf_counter(), json.loads(msg.data)))
+
+    async def expect(self, msg_type):
+        while True:
+            received_at, data = await self.inbox.get()
+            if data.get('type') == msg_type:
+                return received_at, data
+
+    async def close(self):
+        await self.ws.close()
+        self._reader.cancel()
+
+
+async def run(args):
+    import main
+    from aiohttp.test_utils import TestClient, TestServer
+
+    main.init_db()
+    joins, relays, chats = [], [], []
+
+    async with TestClient(TestServer(main.app)) as client:
+        rooms = []
+        for r in range(args.rooms):
+            room_id = f'bench-{r}'
+            await client.post('/create_room', json={'room_id': room_id, 'password': ''})
+            peers = []
+            for p in range(args.participants):
+                started = time.perf_counter()
+                resp = await client.post('/join_room', json={'room_id': room_id, 'password': '', 'username': f'u{p}'})
+                data = await resp.json()
+                joins.append(time.perf_counter() - started)
+                peer = Peer(await client.ws_connect(f"/ws/{room_id}?token={data['token']}"))
+                peer.id = (await peer.expect('room_ready'))[1]['my_id']
+                peers.append(peer)
+            rooms.append(peers)
+
+        async def exercise(peers):
+            for i in range(args.rounds):
+                sender, target = peers[i % len(peers)], peers[(i + 1) % len(peers)]
+                started = time.perf_counter()
+                await sender.ws.send_str(json.dumps({
+                    'type': 'offer', 'sender_id': sender.id, 'target_id': target.id,
+                    'offer': {'type': 'offer', 'sdp': SDP}
+                }))
+                received_at, _ = await target.expect('offer')
+                relays.append(received_at - started)
+
+                started = time.perf_counter()
+                await sender.ws.send_str(json.dumps({'type': 'chat', 'message': f'hello {i}'}))
+                received = [(await peer.expect('chat'))[0] for peer in peers]
+                chats.append(max(received) - started)
+
+        await asyncio.gather(*[exercise(peers) for peers in rooms])
+        for peers in rooms:
+            for peer in peers:
+                await peer.close()
+
+    report('join', joins)
+    report('relay', relays)
+    report('chat', chats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='join_room / websocket_handler latency')
+    parser.add_argument('--storage', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--participants', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['STORAGE_BACKEND'] = args.storage
+        os.environ['DB_PATH'] = os.path.join(tmp, 'bench.db')
+        os.environ['ARCHIVE_DIR'] = os.path.join(tmp, 'archive')
+        print(f'storage={args.storage} rooms={args.rooms} participants={args.participants} rounds={args.rounds}')
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
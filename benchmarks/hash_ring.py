@@ -0,0 +1,59 @@
+# benchmarks/hash_ring.py - Balance and churn of the room hash ring
+#
+# For a few virtual-node counts, places a set of room ids (generated like
+# create_room's `room-xxxxxxxx` ones) on a ring of workers and reports:
+#
+#   spread    busiest worker's share of rooms relative to a perfect split
+#   +1 moved  rooms that change owner when a worker joins (ideal 1/(N+1))
+#   -1 moved  rooms that change owner when a worker leaves (ideal 1/N)
+#   lookup    cost of node_for() per room
+#
+#   python benchmarks/hash_ring.py [--workers 4] [--rooms 100000]
+import argparse
+import collections
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hash_ring import HashRing  # noqa: E402
+
+
+def owners(ring, rooms):
+    return [ring.node_for(room_id) for room_id in rooms]
+
+
+def moved(before, after):
+    return sum(1 for a, b in zip(before, after) if a != b) / len(before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='consistent hash ring benchmark')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rooms', type=int, default=100000)
+    args = parser.parse_args()
+
+    rooms = [f'room-{uuid.uuid4().hex[:8]}' for _ in range(args.rooms)]
+    workers = list(range(1, args.workers + 1))
+    print(f'{args.rooms} rooms, {args.workers} workers   '
+          f'ideal moved: +1 {1 / (args.workers + 1):.3f}  -1 {1 / args.workers:.3f}\n')
+    print(f'{"vnodes":>7} {"spread":>8} {"+1 moved":>9} {"-1 moved":>9} {"lookup":>10}')
+    for vnodes in (1, 16, 64, 160, 512):
+        ring = HashRing(workers, vnodes=vnodes)
+        started = time.perf_counter()
+        base = owners(ring, rooms)
+        lookup_us = (time.perf_counter() - started) / len(rooms) * 1e6
+        spread = max(collections.Counter(base).values()) / (len(rooms) / len(workers))
+
+        ring.add(len(workers) + 1)
+        grown = moved(base, owners(ring, rooms))
+        ring.remove(len(workers) + 1)
+        ring.remove(workers[0])
+        shrunk = moved(base, owners(ring, rooms))
+        print(f'{vnodes:>7} {spread:>8.2f} {grown:>9.3f} {shrunk:>9.3f} {lookup_us:>8.2f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/join_latency.py - join_room latency under chat write load
+#
+# Compares the original data path (one shared connection, rollback journal,
+# queries and a commit per chat message run directly on the event loop)
+# against the current one (WAL, read-only reader pool, write-behind chat
+# queue, indexed schema). Each run seeds a database, starts chat writers that hammer the
+# messages table and measures how long the two join queries take.
+#
+# Joins arrive open-loop on a fixed schedule, so latency is measured from the
+# moment a join *should* have started: time spent waiting for a blocked event
+# loop counts, just as it would for a real HTTP request.
+#
+#   python benchmarks/join_latency.py [--seconds 5] [--chat-rate 1000] [--rooms 50]
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import migrations  # noqa: E402
+from chat_persister import ChatPersister  # noqa: E402
+from db import SQLiteStorage  # noqa: E402
+
+
+SCHEMA = [
+    'CREATE TABLE rooms (room_id TEXT PRIMARY KEY, password TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, room_id TEXT, client_id TEXT, username TEXT, '
+    'message TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)',
+    'CREATE TABLE recordings (id INTEGER PRIMARY KEY AUTOINCREMENT, room_id TEXT, started_at DATETIME, '
+    'ended_at DATETIME, duration_seconds INTEGER, participants TEXT)',
+]
+
+
+def seed(path, rooms, messages_per_room):
+    conn = sqlite3.connect(path)
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    conn.executemany('INSERT INTO rooms (room_id, password) VALUES (?, ?)',
+                     [(f'room-{i}', '') for i in range(rooms)])
+    conn.executemany('INSERT INTO messages (room_id, client_id, username, message) VALUES (?, ?, ?, ?)',
+                     [(f'room-{i % rooms}', 'seed', 'seed', 'x' * 40) for i in range(rooms * messages_per_room)])
+    conn.commit()
+    conn.close()
+
+
+async def arrivals(stop, interval):
+    """Yield scheduled arrival times every `interval` seconds until `stop`."""
+    scheduled = time.perf_counter()
+    while scheduled < stop:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield scheduled
+        scheduled = max(scheduled + interval, time.perf_counter() - interval)
+
+
+def summarize(label, samples, chat_count, seconds):
+    samples = sorted(samples)
+    p = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000  # noqa: E731
+    print(f'{label:<8} joins={len(samples):>6}  p50={p(0.50):8.2f}ms  p95={p(0.95):8.2f}ms  '
+          f'p99={p(0.99):8.2f}ms  max={samples[-1] * 1000:8.2f}ms  mean={statistics.mean(samples) * 1000:7.2f}ms  '
+          f'chat/s={chat_count / seconds:8.0f}')
+
+
+async def run_legacy(path, args):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    stop = time.perf_counter() + args.seconds
+    samples, chats = [], 0
+
+    async def writer():
+        nonlocal chats
+        async for _ in arrivals(stop, args.writers / args.chat_rate):
+            cur = conn.cursor()
+            cur.execute('INSERT INTO messages (room_id, client_id, username, message) VALUES (?, ?, ?, ?)',
+                        (f'room-{random.randrange(args.rooms)}', 'c', 'u', 'hello'))
+            conn.commit()
+            chats += 1
+
+    async def joiner():
+        async for started in arrivals(stop, args.join_interval):
+            room_id = f'room-{random.randrange(args.rooms)}'
+            cur = conn.cursor()
+            cur.execute('SELECT password, created_at FROM rooms WHERE room_id = ?', (room_id,))
+            cur.fetchone()
+            cur.execute('SELECT username, message, timestamp FROM messages WHERE room_id = ? ORDER BY id ASC LIMIT 100',
+                        (room_id,))
+            cur.fetchall()
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[writer() for _ in range(args.writers)], *[joiner() for _ in range(args.joiners)])
+    conn.close()
+    summarize('legacy', samples, chats, args.seconds)
+
+
+async def run_current(path, args):
+    migrations.migrate(path)  # upgrade the seeded legacy schema in place
+    db = SQLiteStorage(path, read_pool_size=args.readers)
+    persister = ChatPersister(db)
+    persister.start()
+    stop = time.perf_counter() + args.seconds
+    samples, chats = [], 0
+
+    async def writer():
+        nonlocal chats
+        async for _ in arrivals(stop, args.writers / args.chat_rate):
+            await persister.put(f'room-{random.randrange(args.rooms)}', 'c', 'u', 'hello')
+            chats += 1
+
+    async def joiner():
+        async for started in arrivals(stop, args.join_interval):
+            room_id = f'room-{random.randrange(args.rooms)}'
+            await db.get_room(room_id)
+            await db.get_history(room_id, limit=100)
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*[writer() for _ in range(args.writers)], *[joiner() for _ in range(args.joiners)])
+    await persister.close()
+    db.close()
+    summarize('current', samples, chats, args.seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='join_room latency under chat write load')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--chat-rate', type=float, default=1000, help='chat messages per second, all writers')
+    parser.add_argument('--joiners', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--rooms', type=int, default=50)
+    parser.add_argument('--messages-per-room', type=int, default=200)
+    parser.add_argument('--join-interval', type=float, default=0.005)
+    args = parser.parse_args()
+
+    for label, runner in (('legacy', run_legacy), ('current', run_current)):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f'{label}.db')
+            seed(path, args.rooms, args.messages_per_room)
+            asyncio.run(runner(path, args))
+
+
+if __name__ == '__main__':
+    main()
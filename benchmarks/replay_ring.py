@@ -0,0 +1,198 @@
+# benchmarks/replay_ring.py - Exactly-once delivery across resumes
+#
+# Drives a Participant (participants.py) through a scripted socket that can
+# hold a frame mid-write, and checks that every frame reaches the client
+# exactly once and in order however the connection is cut:
+#
+#   inflight   resume while a frame is being written, with the client
+#              having received it or not (the reviewed F/G/H case)
+#   suspended  the socket drops first (suspend), the client resumes later
+#   fuzz       random sends, cuts and resumes, in both of the ways above
+#
+# Also times resume() for a full replay ring.
+#
+#   python benchmarks/replay_ring.py [--rounds 2000] [--seed 1]
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from participants import Participant  # noqa: E402
+
+
+class Client:
+    """What the browser has received, across all of its sockets."""
+
+    def __init__(self):
+        self.received = []
+
+    @property
+    def last_seq(self):
+        return len(self.received)
+
+
+class Socket:
+    """A websocket whose writes can be held open until release()."""
+
+    def __init__(self, client, hold=False):
+        self.client = client
+        self.hold = hold
+        self.gate = None
+        self.writing = None  # text of the write being held
+        self.dead = False
+
+    async def send_str(self, data, compress=None):
+        if self.hold:
+            self.writing = data
+            self.gate = asyncio.get_running_loop().create_future()
+            arrives_first = await self.gate
+            self.writing = None
+            if arrives_first is False:
+                return
+        if not self.dead:
+            self.client.received.append(data)
+
+    def release(self):
+        if self.gate is not None and not self.gate.done():
+            self.gate.set_result(True)
+
+    def cut(self, arrived):
+        """The connection dies mid-write; `arrived` says whether the held frame got through."""
+        self.dead = True
+        if arrived and self.writing is not None:
+            self.client.received.append(self.writing)
+
+
+def new_participant(ws, replay_size=256):
+    participant = Participant('c' * 36, 'tester', ws, replay_size=replay_size)
+    participant.start()
+    return participant
+
+
+def frame(i):
+    return {'type': 'chat', 'message': f'm{i}'}
+
+
+def texts(start, stop):
+    return [f'{{"type":"chat","message":"m{i}"}}' for i in range(start, stop)]
+
+
+async def settle():
+    # Let the writer run until it blocks on a held write or an empty queue
+    for _ in range(50):
+        await asyncio.sleep(0)
+
+
+async def check_inflight(arrived, takeover):
+    # F in flight, G and H queued; then the client comes back
+    client = Client()
+    ws = Socket(client, hold=True)
+    participant = new_participant(ws)
+    for i in range(3):
+        participant.send(frame(i))
+    await settle()
+    assert ws.writing is not None, 'F should be in flight'
+    ws.cut(arrived)
+    if not takeover:
+        participant.suspend()
+    await settle()
+    participant.resume(Socket(client), None, client.last_seq)
+    await settle()
+    assert client.received == texts(0, 3), f'arrived={arrived} takeover={takeover}: got {client.received}'
+    participant.close()
+
+
+async def check_suspended():
+    client = Client()
+    participant = new_participant(Socket(client))
+    participant.send(frame(0))
+    await settle()
+    participant.suspend()
+    for i in range(1, 4):
+        participant.send(frame(i))
+    participant.resume(Socket(client), None, client.last_seq)
+    await settle()
+    assert client.received == texts(0, 4), f'got {client.received}'
+    participant.close()
+
+
+async def fuzz(rounds, rng):
+    for round_no in range(rounds):
+        client = Client()
+        ws = Socket(client, hold=True)
+        participant = new_participant(ws)
+        sent = 0
+        for _ in range(rng.randint(1, 6)):
+            for _ in range(rng.randint(0, 5)):
+                participant.send(frame(sent))
+                sent += 1
+            await settle()
+            for _ in range(rng.randint(0, 3)):
+                ws.release()
+                await settle()
+            ws.cut(rng.random() < 0.5)
+            if rng.random() < 0.5:
+                participant.suspend()
+            ws = Socket(client, hold=True)
+            assert participant.resume(ws, None, client.last_seq), f'round {round_no}: resume refused'
+            await settle()
+        ws.hold = False
+        ws.release()
+        for _ in range(sent + 5):
+            await settle()
+            if client.last_seq >= sent:
+                break
+        assert client.received == texts(0, sent), f'round {round_no}: got {client.received}'
+        participant.close()
+
+
+async def time_resume(replay_size, repeats=200):
+    samples = []
+    for _ in range(repeats):
+        client = Client()
+        participant = new_participant(Socket(client), replay_size=replay_size)
+        for i in range(replay_size):
+            participant.send(frame(i))
+        await settle()
+        participant.suspend()
+        started = time.perf_counter()
+        participant.resume(Socket(client), None, 0)
+        samples.append(time.perf_counter() - started)
+        participant.close()
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6
+
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    checks = [
+        ('inflight', lambda: asyncio.gather(*(check_inflight(arrived, takeover)
+                                              for arrived in (False, True) for takeover in (False, True)))),
+        ('suspended', check_suspended),
+        ('fuzz', lambda: fuzz(args.rounds, rng)),
+    ]
+    failed = 0
+    for name, check in checks:
+        try:
+            await check()
+            print(f'✅ {name}')
+        except AssertionError as e:
+            failed += 1
+            print(f'❌ {name}: {e}')
+    print(f'resume() replaying a full ring of 256 frames: {await time_resume(256):.1f} µs (median)')
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    sys.exit(1 if asyncio.run(main_async(parser.parse_args())) else 0)
+
+
+if __name__ == '__main__':
+    main()
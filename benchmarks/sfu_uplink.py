@@ -0,0 +1,214 @@
+# benchmarks/sfu_uplink.py - Client uplink and server CPU, mesh vs SFU, by room size
+#
+# Starts main.py with SFU=1 (needs aiortc) and, for each room size, fills
+# one room with aiortc clients that send a synthetic camera and microphone
+# (aiortc.mediastreams). Up to three members the room is a mesh and each
+# client sends its media once per peer; above that it switches to the
+# server's relay (sfu.py) and each client sends it once. After a warm-up,
+# reports per client the bytes sent per second (outbound RTP, all of its
+# connections) and how many media streams it sends, plus the server's CPU
+# use. Clients and server share the machine, so with few cores the media
+# rates drop as rooms grow; the stream counts are what stays constant.
+#
+#   python benchmarks/sfu_uplink.py [--sizes 2,3,4,6] [--seconds 10] [--warmup 5]
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiortc import RTCConfiguration, RTCPeerConnection, RTCSessionDescription
+from aiortc.mediastreams import AudioStreamTrack, VideoStreamTrack
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+URL = 'http://127.0.0.1:9080'
+NO_STUN = RTCConfiguration(iceServers=[])
+
+
+async def wait_for_server(timeout=15):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(URL + '/admin/metrics') as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError('server did not start')
+            await asyncio.sleep(0.2)
+
+
+def cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def description(desc):
+    return {'sdp': desc.sdp, 'type': desc.type}
+
+
+class Client:
+    """A participant speaking the web client's signalling, mesh and SFU."""
+
+    def __init__(self, session, room_id, username):
+        self.session = session
+        self.room_id = room_id
+        self.username = username
+        self.mesh = {}  # peer client id -> RTCPeerConnection
+        self.sfu = None
+        self.ws = None
+        self.my_id = None
+        self.task = None
+
+    def connections(self):
+        return list(self.mesh.values()) + ([self.sfu] if self.sfu else [])
+
+    async def join(self):
+        async with self.session.post(URL + '/join_room', json={'room_id': self.room_id, 'password': '',
+                                                               'username': self.username}) as resp:
+            joined = await resp.json()
+        self.ws = await self.session.ws_connect(f"ws://127.0.0.1:9080/ws/{self.room_id}?token={joined['token']}")
+        self.task = asyncio.create_task(self.run())
+
+    def new_pc(self):
+        pc = RTCPeerConnection(NO_STUN)
+        pc.addTrack(AudioStreamTrack())
+        pc.addTrack(VideoStreamTrack())
+
+        @pc.on('track')
+        def on_track(track):
+            asyncio.ensure_future(self.drain(track))
+
+        return pc
+
+    @staticmethod
+    async def drain(track):
+        while True:
+            try:
+                await track.recv()
+            except Exception:
+                return
+
+    async def run(self):
+        async for msg in self.ws:
+            data = json.loads(msg.data)
+            kind = data['type']
+            if kind == 'room_ready':
+                self.my_id = data['my_id']
+                if data['media'] == 'sfu':
+                    await self.start_sfu()
+            elif kind == 'media_mode' and self.sfu is None:
+                for pc in self.mesh.values():
+                    await pc.close()
+                self.mesh.clear()
+                await self.start_sfu()
+            elif kind == 'new_participant' and self.sfu is None:
+                pc = self.mesh[data['new_id']] = self.new_pc()
+                await pc.setLocalDescription(await pc.createOffer())
+                await self.ws.send_json({'type': 'offer', 'sender_id': self.my_id, 'target_id': data['new_id'],
+                                         'offer': description(pc.localDescription)})
+            elif kind == 'offer' and self.sfu is None:
+                pc = self.mesh[data['sender_id']] = self.new_pc()
+                await pc.setRemoteDescription(RTCSessionDescription(**data['offer']))
+                await pc.setLocalDescription(await pc.createAnswer())
+                await self.ws.send_json({'type': 'answer', 'sender_id': self.my_id, 'target_id': data['sender_id'],
+                                         'answer': description(pc.localDescription)})
+            elif kind == 'answer' and data['sender_id'] in self.mesh:
+                await self.mesh[data['sender_id']].setRemoteDescription(RTCSessionDescription(**data['answer']))
+            elif kind == 'sfu_answer':
+                await self.sfu.setRemoteDescription(RTCSessionDescription(**data['answer']))
+            elif kind == 'sfu_offer':
+                await self.sfu.setRemoteDescription(RTCSessionDescription(**data['offer']))
+                await self.sfu.setLocalDescription(await self.sfu.createAnswer())
+                await self.ws.send_json({'type': 'sfu_answer', 'answer': description(self.sfu.localDescription)})
+
+    async def start_sfu(self):
+        self.sfu = self.new_pc()
+        await self.sfu.setLocalDescription(await self.sfu.createOffer())
+        await self.ws.send_json({'type': 'sfu_offer', 'offer': description(self.sfu.localDescription)})
+
+    async def uplink(self):
+        """(bytes sent, media streams sent) over all of this client's connections."""
+        sent = streams = 0
+        for pc in self.connections():
+            for stat in (await pc.getStats()).values():
+                # Transceivers the server added only receive; their senders stay idle
+                if stat.type == 'outbound-rtp' and stat.packetsSent:
+                    sent += stat.bytesSent
+                    streams += 1
+        return sent, streams
+
+    async def close(self):
+        for pc in self.connections():
+            await pc.close()
+        await self.ws.close()
+        if self.task is not None:
+            self.task.cancel()
+
+
+async def measure(size, seconds, warmup, server_pid):
+    async with aiohttp.ClientSession() as session:
+        room_id = f'bench-{size}'
+        await session.post(URL + '/create_room', json={'room_id': room_id, 'password': ''})
+        clients = []
+        for i in range(size):
+            client = Client(session, room_id, f'user{i}')
+            await client.join()
+            clients.append(client)
+            await asyncio.sleep(0.5)
+        await asyncio.sleep(warmup)
+
+        before = [await c.uplink() for c in clients]
+        server_before = cpu_seconds(server_pid)
+        started = time.monotonic()
+        await asyncio.sleep(seconds)
+        elapsed = time.monotonic() - started
+        after = [await c.uplink() for c in clients]
+        server_cpu = (cpu_seconds(server_pid) - server_before) / elapsed
+
+        async with session.get(URL + '/admin/metrics') as resp:
+            metrics = await resp.json()
+        mode = 'sfu' if metrics['sfu'] and metrics['sfu']['peers'] else 'mesh'
+        for client in clients:
+            await client.close()
+
+    rates = [(a[0] - b[0]) / elapsed / 1000 for a, b in zip(after, before)]
+    streams = [a[1] for a in after]
+    return mode, sum(rates) / len(rates), sum(streams) / len(streams), server_cpu
+
+
+async def main_async(args):
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, DB_PATH=os.path.join(tmp, 'bench.db'), SFU='1', SFU_STUN_SERVER='',
+               SFU_MAX_PARTICIPANTS=str(max(args.sizes)), HEARTBEAT_INTERVAL_SECONDS='0')
+    server = subprocess.Popen([sys.executable, MAIN], cwd=tmp, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_for_server()
+        print(f"{'size':>4}  {'mode':>4}  {'uplink kB/s per client':>22}  {'streams sent':>12}  {'server CPU':>10}")
+        for size in args.sizes:
+            mode, rate, streams, server_cpu = await measure(size, args.seconds, args.warmup, server.pid)
+            print(f'{size:>4}  {mode:>4}  {rate:>22.1f}  {streams:>12.1f}  {server_cpu:>9.0%}')
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='2,3,4,6', type=lambda v: [int(x) for x in v.split(',')])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=5)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
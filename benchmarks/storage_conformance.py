@@ -0,0 +1,162 @@
+# benchmarks/storage_conformance.py - Behaviour every Storage backend must share
+#
+# Runs the same checks against SQLiteStorage (on a fresh, migrated file) and
+# MemoryStorage. A new backend is only usable by the handlers, the chat
+# persister and the sweeper once it passes here.
+#
+#   python benchmarks/storage_conformance.py [sqlite] [memory]
+import asyncio
+import os
+import sys
+import tempfile
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import migrations  # noqa: E402
+from db import SQLiteStorage  # noqa: E402
+from storage import MemoryStorage  # noqa: E402
+
+
+async def check_rooms(storage):
+    assert await storage.create_room('room-a', 'secret', 24) is True
+    assert await storage.create_room('room-a', 'other', 24) is False, 'duplicate room IDs must be rejected'
+    assert await storage.get_room('missing') is None
+
+    password, expires_at, expired = await storage.get_room('room-a')
+    assert password == 'secret'
+    assert isinstance(expires_at, str) and len(expires_at) == 19, 'expires_at uses the SQL timestamp format'
+    assert expired is False
+
+    await storage.create_room('room-old', '', 0)
+    assert (await storage.get_room('room-old'))[2] is True, 'a zero TTL room is expired immediately'
+
+
+async def check_history(storage):
+    await storage.create_room('room-h', '', 24)
+    await storage.add_messages([('room-h', 'c1', 'alice', f'm{i}') for i in range(25)])
+    await storage.add_messages([('room-other', 'c2', 'bob', 'elsewhere')])
+
+    latest = await storage.get_history('room-h', limit=10)
+    assert [m['message'] for m in latest['messages']] == [f'm{i}' for i in range(15, 25)], 'latest page, oldest first'
+    assert latest['has_more'] is True
+    assert set(latest['messages'][0]) == {'id', 'username', 'message', 'timestamp'}
+
+    older = await storage.get_history('room-h', before_id=latest['messages'][0]['id'], limit=10)
+    assert [m['message'] for m in older['messages']] == [f'm{i}' for i in range(5, 15)]
+    assert older['has_more'] is True
+
+    oldest = await storage.get_history('room-h', before_id=older['messages'][0]['id'], limit=10)
+    assert [m['message'] for m in oldest['messages']] == [f'm{i}' for i in range(5)]
+    assert oldest['has_more'] is False
+
+    newer = await storage.get_history('room-h', after_id=oldest['messages'][-1]['id'], limit=3)
+    assert [m['message'] for m in newer['messages']] == ['m5', 'm6', 'm7']
+    assert newer['has_more'] is True
+
+    ids = [m['id'] for m in latest['messages']]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids), 'message IDs increase monotonically'
+
+    empty = await storage.get_history('nobody-here')
+    assert empty == {'messages': [], 'has_more': False}
+
+
+async def check_recordings_and_admin(storage):
+    await storage.save_recording('room-a', '2024-01-01T00:00:00', 61, 'alice, bob')
+    data = await storage.admin_data()
+    assert set(data) == {'rooms', 'messages', 'recordings'}
+    assert {'room_id': 'room-a', 'started_at': '2024-01-01T00:00:00', 'duration_seconds': 61,
+            'participants': 'alice, bob'}.items() <= data['recordings'][0].items()
+    assert data['recordings'][0]['ended_at']
+    assert any(r['room_id'] == 'room-a' and r['has_password'] for r in data['rooms'])
+    assert data['messages'][0]['message'] == 'elsewhere', 'newest message first'
+
+
+async def check_purge(storage):
+    await storage.create_room('room-x1', '', 0)
+    await storage.create_room('room-x2', '', 0)
+    await storage.create_room('room-busy', '', 0)
+    await storage.add_messages([('room-x1', 'c', 'u', 'x')] * 7 + [('room-x2', 'c', 'u', 'y')] * 3
+                               + [('room-busy', 'c', 'u', 'z')] * 2)
+    await storage.save_recording('room-x1', 'then', 1, 'u')
+
+    archived = []
+    totals = {'rooms': 0, 'messages': 0, 'recordings': 0}
+    for _ in range(100):
+        result = await storage.purge_expired(batch_size=4, rooms_per_batch=2, exclude=['room-busy'],
+                                             archive=archived.extend)
+        assert result['messages'] <= 4 and result['recordings'] <= 4
+        for key in totals:
+            totals[key] += result[key]
+        if result['done']:
+            break
+    else:
+        raise AssertionError('purge_expired never reported done')
+
+    # room-old from check_rooms is expired too
+    assert totals == {'rooms': 3, 'messages': 10, 'recordings': 1}, totals
+    assert len(archived) == 10, 'every purged message is handed to the archive first'
+    assert set(archived[0]) == {'id', 'room_id', 'client_id', 'username', 'message', 'timestamp', 'room_created_at'}
+    assert all(m['room_created_at'] for m in archived), 'archived rows name the incarnation of their room'
+    assert sorted(m['message'] for m in archived) == ['x'] * 7 + ['y'] * 3
+    for room_id in ('room-x1', 'room-x2', 'room-old'):
+        assert await storage.get_room(room_id) is None
+    assert (await storage.get_history('room-x1'))['messages'] == []
+    assert await storage.get_room('room-busy') is not None, 'excluded rooms survive'
+    assert len((await storage.get_history('room-busy'))['messages']) == 2
+    assert await storage.get_room('room-a') is not None, 'live rooms survive'
+    assert isinstance(await storage.incremental_vacuum(100), int)
+
+    def failing_archive(rows):
+        raise OSError('disk full')
+
+    await storage.create_room('room-keep', '', 0)
+    await storage.add_messages([('room-keep', 'c', 'u', 'keep me')])
+    try:
+        await storage.purge_expired(batch_size=10, exclude=['room-busy'], archive=failing_archive)
+    except OSError:
+        pass
+    assert len((await storage.get_history('room-keep'))['messages']) == 1, 'a failed archive keeps the messages'
+
+
+CHECKS = [check_rooms, check_history, check_recordings_and_admin, check_purge]
+
+
+async def check_storage(storage):
+    """Run every conformance check, in order, against one fresh backend."""
+    for check in CHECKS:
+        await check(storage)
+
+
+def _make_sqlite(tmp):
+    path = os.path.join(tmp, 'conformance.db')
+    migrations.migrate(path)
+    return SQLiteStorage(path)
+
+
+BACKENDS = {
+    'sqlite': _make_sqlite,
+    'memory': lambda tmp: MemoryStorage(),
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BACKENDS)
+    failed = False
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = BACKENDS[name](tmp)
+            try:
+                asyncio.run(check_storage(storage))
+                print(f'✅ {name}: all {len(CHECKS)} checks passed')
+            except AssertionError as e:
+                failed = True
+                print(f'❌ {name}: {e or "assertion failed"}')
+                traceback.print_exc()
+            finally:
+                storage.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
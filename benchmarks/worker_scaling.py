@@ -0,0 +1,151 @@
+# benchmarks/worker_scaling.py - Relay throughput vs number of worker processes
+#
+# Starts main.py with WORKERS=1, 2, 4 ... on an empty database, fills it with
+# 3-person rooms and has every participant relay offers to the other two as
+# fast as they are delivered (closed loop, --window frames in flight per
+# client). Reports frames delivered per second across the server. Load is
+# generated by several client processes so the clients are not the
+# bottleneck; on a machine with fewer cores than workers + client processes
+# the numbers will not scale.
+#
+# With affinity (WORKER_PORT_BASE=9080), clients follow the ws_url join_room returns, so each room
+# lives on the worker owning it on the hash ring (hash_ring.py). Without it
+# they connect to the shared port and a room's members spread over workers,
+# so part of the traffic crosses the backplane (backplane.py). The broker's
+# forwarded count is printed alongside.
+#
+#   python benchmarks/worker_scaling.py [--workers 1,2,4] [--rooms 60] [--seconds 5]
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+URL = 'http://127.0.0.1:9080'
+SDP = 'a=candidate:1 1 udp 2122260223 192.168.1.7 50000 typ host generation 0\r\n' * 12
+
+
+async def wait_for_server(timeout=15):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(URL + '/admin/metrics') as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError('server did not start')
+            await asyncio.sleep(0.2)
+
+
+async def run_rooms(room_ids, seconds, window, affinity):
+    async with aiohttp.ClientSession() as session:
+        members = []
+        for room_id in room_ids:
+            await session.post(URL + '/create_room', json={'room_id': room_id, 'password': ''})
+            sockets = []
+            for username in ('a', 'b', 'c'):
+                async with session.post(URL + '/join_room', json={'room_id': room_id, 'password': '',
+                                                                  'username': username}) as resp:
+                    joined = await resp.json()
+                ws_url = joined.get('ws_url') if affinity else None
+                ws_url = ws_url or f'{URL.replace("http", "ws")}/ws/{room_id}'
+                ws = await session.ws_connect(f'{ws_url}?token={joined["token"]}')
+                client_id = (await ws.receive_json())['my_id']
+                sockets.append((ws, client_id))
+            members.append(sockets)
+        await asyncio.sleep(0.5)  # new_participant notices
+
+        received = 0
+        stop = time.perf_counter() + seconds
+
+        async def client(ws, client_id, peers):
+            nonlocal received
+            frames = [json.dumps({'type': 'offer', 'sender_id': client_id, 'target_id': peer,
+                                  'offer': {'type': 'offer', 'sdp': SDP}}, separators=(',', ':')) for peer in peers]
+            for i in range(window):
+                await ws.send_str(frames[i % len(frames)])
+            i = 0
+            while True:
+                try:
+                    msg = await asyncio.wait_for(ws.receive(), stop - time.perf_counter())
+                except (asyncio.TimeoutError, ValueError):
+                    return
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    return
+                if json.loads(msg.data).get('type') != 'offer':
+                    continue
+                received += 1
+                await ws.send_str(frames[i % len(frames)])
+                i += 1
+
+        tasks = [client(ws, client_id, [other for _, other in sockets if other != client_id])
+                 for sockets in members for ws, client_id in sockets]
+        await asyncio.gather(*tasks)
+        for sockets in members:
+            for ws, _ in sockets:
+                await ws.close()
+        return received
+
+
+def load_process(args):
+    return asyncio.run(run_rooms(*args))
+
+
+async def broker_stats():
+    async with aiohttp.ClientSession() as session:
+        async with session.get(URL + '/admin/metrics') as resp:
+            backplane = (await resp.json())['backplane']
+    return backplane['broker'] if backplane else None
+
+
+def measure(workers, rooms, seconds, window, load_procs, affinity):
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, WORKERS=str(workers), DB_PATH=os.path.join(tmp, 'bench.db'),
+               WORKER_PORT_BASE='9080' if affinity else '0', ICE_COALESCE_MS='0', HEARTBEAT_INTERVAL_SECONDS='0')
+    server = subprocess.Popen([sys.executable, MAIN], cwd=tmp, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_server())
+        time.sleep(1)  # let every worker bind
+        room_ids = [f'bench-{workers}-{i}' for i in range(rooms)]
+        chunks = [(room_ids[i::load_procs], seconds, window, affinity) for i in range(load_procs)]
+        with multiprocessing.Pool(load_procs) as pool:
+            received = sum(pool.map(load_process, chunks))
+        broker = asyncio.run(broker_stats())
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(15)
+    return received / seconds, broker['forwarded'] if broker else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='worker process scaling benchmark')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--rooms', type=int, default=60)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--window', type=int, default=4)
+    parser.add_argument('--load-procs', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = parser.parse_args()
+
+    print(f'{args.rooms} rooms x 3 participants, {args.seconds}s, {args.load_procs} load processes, '
+          f'{os.cpu_count()} cpus\n')
+    print(f'{"workers":>8} {"affinity":>9} {"frames/s":>12} {"forwarded":>12}')
+    for workers in (int(w) for w in args.workers.split(',')):
+        for affinity in ((True, False) if workers > 1 else (True,)):
+            rate, forwarded = measure(workers, args.rooms, args.seconds, args.window, args.load_procs, affinity)
+            print(f'{workers:>8} {"on" if affinity else "off":>9} {rate:>12.0f} {forwarded:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/ws_compression.py - permessage-deflate settings vs bytes and CPU
+#
+# Replays signalling traffic through the same deflate setup aiohttp uses for
+# permessage-deflate (raw deflate at Z_BEST_SPEED, sync flush, trailing
+# 00 00 ff ff stripped) and reports, per setting:
+#
+#   wire      bytes on the wire including websocket frame headers
+#   ratio     wire bytes relative to sending uncompressed
+#   deflate   server CPU per frame
+#   inflate   receiving client's CPU per frame
+#
+# Settings mirror config.py: WS_COMPRESS_WBITS with WS_COMPRESS_MIN_BYTES = 0
+# (every frame, one shared window per connection), and min-bytes thresholds
+# (only large frames, each deflated on its own, the rest sent plain). The
+# server answers the handshake with server_max_window_bits=WS_COMPRESS_WBITS,
+# so every wbits row can be deployed; a client offering a smaller window
+# gets that one instead.
+#
+# By default the traffic is a synthetic 3-way mesh join: an offer and an
+# answer per pair, trickled candidates in both directions and some chat,
+# split into each recipient's stream. --trace replays recorded frames
+# instead, one JSON text frame per line, as a single connection.
+#
+#   python benchmarks/ws_compression.py [--trace frames.jsonl] [--repeat 20]
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_codec import sdp_offer  # noqa: E402
+
+TRAILER = b'\x00\x00\xff\xff'
+ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def compact(payload):
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def session_sdp(rng):
+    """An SDP with its own session id, ICE credentials, fingerprint and SSRCs, like a real one."""
+    sdp = sdp_offer()['offer']['sdp']
+    sdp = sdp.replace('4611731400430051336', str(rng.getrandbits(62)))
+    sdp = sdp.replace('Xk3b', ''.join(rng.choices(ALPHABET, k=4)))
+    sdp = sdp.replace('Qb8yD2x0nVvW9hK4mE1rT6uA', ''.join(rng.choices(ALPHABET, k=24)))
+    sdp = re.sub(r'sha-256 \S+', 'sha-256 ' + ':'.join(f'{rng.getrandbits(8):02X}' for _ in range(32)), sdp)
+    return re.sub(r'ssrc:\d+', lambda _: f'ssrc:{rng.getrandbits(32)}', sdp)
+
+
+def mesh_join(participants=3, candidates=12, chat=10, seed=1):
+    """Frames each participant receives while a mesh call is set up."""
+    rng = random.Random(seed)
+    ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(participants)]
+    streams = {client_id: [] for client_id in ids}
+    for i, sender in enumerate(ids):
+        for target in ids[i + 1:]:
+            streams[target].append(compact({'type': 'offer', 'sender_id': sender, 'target_id': target,
+                                            'offer': {'type': 'offer', 'sdp': session_sdp(rng)}}))
+            streams[sender].append(compact({'type': 'answer', 'sender_id': target, 'target_id': sender,
+                                            'answer': {'type': 'answer', 'sdp': session_sdp(rng)}}))
+            for a, b in ((sender, target), (target, sender)):
+                for c in range(candidates):
+                    streams[b].append(compact({
+                        'type': 'ice_candidate', 'sender_id': a, 'target_id': b,
+                        'candidate': {'candidate': f'candidate:{842163049 + c} 1 udp {2122260223 - c} '
+                                                   f'192.168.{c}.{7 + c} {50000 + c} typ host generation 0 '
+                                                   f'ufrag Xk3b network-id {c}',
+                                      'sdpMid': str(c % 2), 'sdpMLineIndex': c % 2, 'usernameFragment': 'Xk3b'},
+                    }))
+    for n in range(chat):
+        frame = compact({'type': 'chat', 'username': f'user{n % participants}', 'message': f'message number {n}',
+                         'timestamp': f'2026-01-01T12:00:{n:02d}.000000'})
+        for stream in streams.values():
+            stream.append(frame)
+    return list(streams.values())
+
+
+def header_size(length):
+    return 2 if length < 126 else 4 if length < 65536 else 10
+
+
+def run_stream(frames, wbits, min_bytes):
+    """Deflate one connection's frames; returns (wire bytes, deflate s, inflate s)."""
+    wire, deflate_s, inflate_s = 0, 0.0, 0.0
+    shared = zlib.compressobj(1, zlib.DEFLATED, -wbits) if wbits and not min_bytes else None
+    inflater = zlib.decompressobj(-wbits) if wbits else None
+    for data in frames:
+        if not wbits or len(data) < min_bytes:
+            wire += header_size(len(data)) + len(data)
+            continue
+        started = time.perf_counter()
+        comp = shared or zlib.compressobj(1, zlib.DEFLATED, -wbits)
+        out = comp.compress(data) + comp.flush(zlib.Z_SYNC_FLUSH)
+        out = out[:-4] if out.endswith(TRAILER) else out
+        deflate_s += time.perf_counter() - started
+
+        started = time.perf_counter()
+        assert inflater.decompress(out + TRAILER) == data
+        inflate_s += time.perf_counter() - started
+        wire += header_size(len(out)) + len(out)
+    return wire, deflate_s, inflate_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description='permessage-deflate settings benchmark')
+    parser.add_argument('--trace', help='recorded frames, one JSON text frame per line')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace, 'rb') as f:
+            streams = [[line.rstrip(b'\n') for line in f if line.strip()]]
+    else:
+        streams = mesh_join()
+    frames = sum(len(s) for s in streams)
+    raw = sum(len(f) for s in streams for f in s)
+    print(f'{len(streams)} connections, {frames} frames, {raw} payload bytes, repeat={args.repeat}\n')
+
+    settings = [('off', 0, 0)]
+    settings += [(f'wbits={wbits}', wbits, 0) for wbits in (9, 12, 15)]
+    settings += [(f'wbits=15 min={min_bytes}', 15, min_bytes) for min_bytes in (256, 1024)]
+
+    baseline = None
+    print(f'{"setting":<20} {"wire":>10} {"ratio":>7} {"deflate":>12} {"inflate":>12}')
+    for label, wbits, min_bytes in settings:
+        wire, deflate_s, inflate_s = 0, 0.0, 0.0
+        for _ in range(args.repeat):
+            wire = 0
+            for stream in streams:
+                w, d, i = run_stream(stream, wbits, min_bytes)
+                wire += w
+                deflate_s += d
+                inflate_s += i
+        baseline = baseline or wire
+        per_frame = frames * args.repeat
+        print(f'{label:<20} {wire:>10} {wire / baseline:>7.2f} '
+              f'{deflate_s / per_frame * 1e6:>9.2f}us {inflate_s / per_frame * 1e6:>9.2f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# binary_protocol.py - Optional MessagePack signalling, negotiated per websocket
+#
+# A client that offers the `signal.msgpack.v1` websocket subprotocol gets
+# binary frames instead of JSON text. Each frame is a MessagePack array
+#
+#   [type code, sender handle, target handle, body]
+#
+# where the handles are small per-room integers standing in for the
+# 36-character client UUIDs (0 means "none"), and body is a map of the
+# frame's remaining fields. Which JSON field a handle replaces depends on the
+# frame type (ID_FIELDS): a room_ready's target is the client's own id, a
+# new_participant's sender is the newcomer, and so on. An ice_candidates
+# batch carries its candidates' bodies without the repeated ids.
+#
+# Handles are assigned by the room's ParticipantRegistry. JSON and binary
+# clients can share a room: frames are converted only when the sender and
+# the recipient speak different protocols (frames.Frame caches both forms).
+#
+# Needs `pip install msgpack`; without it the subprotocol is not offered and
+# every client uses JSON.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SUBPROTOCOL = 'signal.msgpack.v1'
+
+TYPE_CODES = {
+    'room_ready': 1,
+    'new_participant': 2,
+    'participant_left': 3,
+    'offer': 4,
+    'answer': 5,
+    'ice_candidate': 6,
+    'ice_candidates': 7,
+    'chat': 8,
+    'room_full': 9,
+    'error': 10,
+    'ping': 11,
+    'pong': 12,
+    'resumed': 13,
+    'resume_failed': 14,
+    'leave': 15,
+    'migrate': 16,
+    'media_mode': 17,
+    'sfu_offer': 18,
+    'sfu_answer': 19,
+}
+TYPES = {code: frame_type for frame_type, code in TYPE_CODES.items()}
+
+# frame type -> (field carried as the sender handle, field carried as the target handle)
+ID_FIELDS = {
+    'room_ready': (None, 'my_id'),
+    'resumed': (None, 'my_id'),
+    'new_participant': ('new_id', None),
+    'participant_left': ('left_id', None),
+    'offer': ('sender_id', 'target_id'),
+    'answer': ('sender_id', 'target_id'),
+    'ice_candidate': ('sender_id', 'target_id'),
+    'ice_candidates': ('sender_id', 'target_id'),
+}
+ROUTING_KEYS = ('type', 'sender_id', 'target_id')
+
+
+def available():
+    return msgpack is not None
+
+
+def pack(payload, handles=None):
+    """Encode a JSON-shaped payload dict; `handles` maps client ids to handles."""
+    frame_type = payload['type']
+    sender_field, target_field = ID_FIELDS.get(frame_type, (None, None))
+    body = {k: v for k, v in payload.items() if k != 'type' and k != sender_field and k != target_field}
+    if frame_type == 'ice_candidates':
+        body['frames'] = [{k: v for k, v in f.items() if k not in ROUTING_KEYS} for f in body['frames']]
+    sender = handles.handle_of(payload.get(sender_field)) if sender_field else 0
+    target = handles.handle_of(payload.get(target_field)) if target_field else 0
+    return msgpack.packb([TYPE_CODES[frame_type], sender, target, body])
+
+
+def unpack_header(data):
+    """Decode a client frame into (type or None, sender handle, target handle, body)."""
+    try:
+        code, sender, target, body = msgpack.unpackb(data)
+    except (ValueError, TypeError, msgpack.UnpackException):
+        return None, 0, 0, {}
+    # Anything else in the header would be looked up (and hashed) as-is
+    if not isinstance(body, dict) or not all(type(v) is int for v in (code, sender, target)):
+        return None, 0, 0, {}
+    return TYPES.get(code), sender, target, body
+
+
+def unpack(data, handles):
+    """Decode a frame back into the JSON-shaped payload dict, with client ids."""
+    frame_type, sender, target, body = unpack_header(data)
+    sender_field, target_field = ID_FIELDS.get(frame_type, (None, None))
+    payload = {'type': frame_type}
+    if sender_field:
+        payload[sender_field] = handles.id_of(sender)
+    if target_field:
+        payload[target_field] = handles.id_of(target)
+    payload.update(body)
+    if frame_type == 'ice_candidates':
+        payload['frames'] = [
+            {'type': 'ice_candidate', 'sender_id': payload['sender_id'], 'target_id': payload['target_id'], **f}
+            for f in body.get('frames', ())
+        ]
+    return payload
@@ -0,0 +1,110 @@
+# chat_persister.py - Group-commit write-behind queue for chat messages
+#
+# Chat frames from every room are queued here and written in one
+# transaction (executemany) once `batch_size` messages are waiting or
+# `flush_interval` seconds have passed, whichever comes first. A busy
+# server therefore pays a handful of commits per second instead of one
+# fsync per message.
+import asyncio
+import time
+
+
+class ChatPersister:
+    def __init__(self, db, batch_size=200, flush_interval=0.2, max_queue=10000):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._full = asyncio.Event()
+        self._task = None
+
+        # Counters
+        self.queued = 0
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.failed_messages = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, room_id, client_id, username, message):
+        """Queue a message; waits (backpressure) only if the queue is full."""
+        await self._queue.put((room_id, client_id, username, message))
+        self.queued += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._full.set()
+
+    async def flush(self):
+        """Wait until every message queued so far is written."""
+        if self._task is None:
+            return
+        self._full.set()
+        await self._queue.join()
+
+    async def close(self):
+        """Flush everything still queued and stop the flusher task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        self._full.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            row = await self._queue.get()
+            stop = row is None
+            batch = [] if stop else [row]
+
+            # Give the batch a chance to fill up before committing
+            if not stop and self._queue.qsize() + 1 < self.batch_size:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            while not stop and len(batch) < self.batch_size and not self._queue.empty():
+                row = self._queue.get_nowait()
+                if row is None:
+                    stop = True
+                else:
+                    batch.append(row)
+
+            if batch:
+                await self._flush(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            await self.db.add_messages(batch)
+        except Exception as e:
+            self.failed_messages += len(batch)
+            print(f"❌ Error flushing {len(batch)} chat messages: {e}")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed_messages += len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'queue_depth': self._queue.qsize(),
+            'flushes': self.flushes,
+            'flushed_messages': self.flushed_messages,
+            'failed_messages': self.failed_messages,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            'avg_batch_size': round(self.flushed_messages / self.flushes, 2) if self.flushes else 0.0,
+        }
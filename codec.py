@@ -0,0 +1,30 @@
+# codec.py - JSON encoding for websocket frames and HTTP bodies
+#
+# Every signalling frame and REST call is JSON, and SDP offers run to several
+# kilobytes. orjson is used when it is installed (`pip install orjson`);
+# otherwise the stdlib json module is used. Both produce compact text and
+# accept str input, so callers do not need to know which one is active.
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _stdlib_dumps(obj, _encode=json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode):
+    return _encode(obj)
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj).decode()
+
+
+if orjson is not None:
+    NAME = 'orjson'
+    dumps = _orjson_dumps
+    loads = orjson.loads
+else:
+    NAME = 'json'
+    dumps = _stdlib_dumps
+    loads = json.loads
@@ -0,0 +1,144 @@
+# config.py - Server tunables (override with environment variables)
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# Storage backend: 'sqlite' (default) or 'memory' (benchmarks / load tests)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+
+# SQLite database file
+DB_PATH = os.environ.get('DB_PATH', 'video_calls.db')
+
+# Number of read-only connections/threads used for SELECTs
+DB_READ_POOL_SIZE = _env_int('DB_READ_POOL_SIZE', 4)
+
+# SQLite pragmas (WAL lets readers run alongside the writer)
+DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE_KB = _env_int('DB_CACHE_SIZE_KB', 16384)
+
+# Chat write-behind queue: flush after this many messages or this many ms
+CHAT_FLUSH_BATCH_SIZE = _env_int('CHAT_FLUSH_BATCH_SIZE', 200)
+CHAT_FLUSH_INTERVAL_MS = _env_int('CHAT_FLUSH_INTERVAL_MS', 200)
+CHAT_QUEUE_MAX = _env_int('CHAT_QUEUE_MAX', 10000)
+
+# Rooms can be joined for this many hours after creation
+ROOM_TTL_HOURS = _env_int('ROOM_TTL_HOURS', 24)
+
+# Chat history: messages sent inline with join_room, and max page size for /history
+HISTORY_JOIN_LIMIT = _env_int('HISTORY_JOIN_LIMIT', 20)
+HISTORY_PAGE_MAX = _env_int('HISTORY_PAGE_MAX', 100)
+
+# In-memory room metadata cache used by join_room
+ROOM_CACHE_SIZE = _env_int('ROOM_CACHE_SIZE', 1024)
+ROOM_CACHE_TTL_SECONDS = _env_int('ROOM_CACHE_TTL_SECONDS', 30)
+
+# Expired-room sweeper: run every N seconds, delete at most this many rows per
+# transaction, then release up to this many free pages
+SWEEP_INTERVAL_SECONDS = _env_int('SWEEP_INTERVAL_SECONDS', 300)
+SWEEP_BATCH_SIZE = _env_int('SWEEP_BATCH_SIZE', 500)
+SWEEP_VACUUM_PAGES = _env_int('SWEEP_VACUUM_PAGES', 2000)
+
+# Chat of expired rooms is moved into compressed segments here ('' disables)
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'chat_archive')
+ARCHIVE_SEGMENT_MAX_MB = _env_int('ARCHIVE_SEGMENT_MAX_MB', 64)
+
+# A websocket send that takes longer than this disconnects the recipient
+SEND_TIMEOUT_SECONDS = float(os.environ.get('SEND_TIMEOUT_SECONDS') or 5)
+
+# Per-participant outbound queue: start shedding ice_candidate frames above
+# the high-water mark, disconnect above the hard limit or after staying above
+# the mark for max-lag seconds
+OUTBOUND_HIGH_WATER = _env_int('OUTBOUND_HIGH_WATER', 256)
+OUTBOUND_HARD_LIMIT = _env_int('OUTBOUND_HARD_LIMIT', 1024)
+OUTBOUND_MAX_LAG_SECONDS = float(os.environ.get('OUTBOUND_MAX_LAG_SECONDS') or 10)
+
+# Trickled ICE candidates for the same (sender, target) pair arriving within
+# this window are relayed as one frame; 0 relays each one immediately
+ICE_COALESCE_MS = _env_int('ICE_COALESCE_MS', 20)
+ICE_COALESCE_MAX = _env_int('ICE_COALESCE_MAX', 32)
+
+# Offer the MessagePack signalling subprotocol when msgpack is installed
+BINARY_SIGNALING = _env_int('BINARY_SIGNALING', 1)
+
+# permessage-deflate for websocket frames. With WS_COMPRESS_MIN_BYTES = 0
+# every frame is deflated through one shared window per connection; above 0
+# only frames at least that long are deflated (each on its own) and smaller
+# ones are sent plain. WS_COMPRESS_WBITS (9-15) caps the server's deflate
+# window, answered to the client as server_max_window_bits. See
+# benchmarks/ws_compression.py for the trade-offs.
+WS_COMPRESS = _env_int('WS_COMPRESS', 1)
+WS_COMPRESS_WBITS = _env_int('WS_COMPRESS_WBITS', 15)
+WS_COMPRESS_MIN_BYTES = _env_int('WS_COMPRESS_MIN_BYTES', 0)
+
+# Participants quiet for a heartbeat interval are pinged ('protocol' websocket
+# ping or 'app' JSON ping) and dropped after HEARTBEAT_TIMEOUT_SECONDS of
+# silence, freeing their room slot; an interval of 0 disables this
+HEARTBEAT_INTERVAL_SECONDS = _env_int('HEARTBEAT_INTERVAL_SECONDS', 10)
+HEARTBEAT_TIMEOUT_SECONDS = _env_int('HEARTBEAT_TIMEOUT_SECONDS', 25)
+HEARTBEAT_MODE = os.environ.get('HEARTBEAT_MODE', 'protocol')
+
+# A participant whose websocket drops keeps its slot for this long and can
+# resume with its resume token; the last RESUME_REPLAY_FRAMES frames sent to
+# it are replayed if they did not arrive. 0 disables resumption.
+RESUME_GRACE_SECONDS = _env_int('RESUME_GRACE_SECONDS', 30)
+RESUME_REPLAY_FRAMES = _env_int('RESUME_REPLAY_FRAMES', 256)
+
+# Worker processes sharing the server port (SO_REUSEPORT, Linux). Above 1,
+# main.py becomes a supervisor that starts them and coordinates their rooms
+# through a broker on BACKPLANE_SOCKET; needs the sqlite storage backend.
+# WORKER_ID is set by the supervisor for each worker.
+WORKERS = _env_int('WORKERS', 1)
+WORKER_ID = _env_int('WORKER_ID', 0)
+BACKPLANE_SOCKET = os.environ.get('BACKPLANE_SOCKET', 'meeting_app.backplane.sock')
+
+# Room affinity, off (0) by default: with WORKERS > 1 and WORKER_PORT_BASE
+# set, worker N also listens on WORKER_PORT_BASE + N, and join_room points
+# each room's websocket at the worker owning the room on a consistent-hash
+# ring (hash_ring.py), so the members of a room share one process. Clients
+# must be able to reach ports WORKER_PORT_BASE + 1 .. WORKER_PORT_BASE +
+# WORKERS (publish them like 9080). Behind a proxy or TLS terminator, set
+# WORKER_WS_URL to a worker's public websocket URL, with {worker}, {port}
+# and {room_id} filled in, e.g. wss://meet.example.com/w{worker}/ws/{room_id};
+# without it, requests that came through a proxy get no affinity.
+WORKER_PORT_BASE = _env_int('WORKER_PORT_BASE', 0)
+WORKER_WS_URL = os.environ.get('WORKER_WS_URL', '')
+HASH_RING_VNODES = _env_int('HASH_RING_VNODES', 160)
+
+# Join tokens are signed with JOIN_TOKEN_SECRET and expire after
+# JOIN_TOKEN_TTL_SECONDS. Without a secret a random one is made at startup
+# (shared by the supervisor's workers), so tokens do not survive a restart.
+# Redeemed tokens are remembered in two Bloom filters of JOIN_TOKEN_FILTER_BITS.
+JOIN_TOKEN_SECRET = os.environ.get('JOIN_TOKEN_SECRET', '')
+JOIN_TOKEN_TTL_SECONDS = _env_int('JOIN_TOKEN_TTL_SECONDS', 120)
+JOIN_TOKEN_FILTER_BITS = _env_int('JOIN_TOKEN_FILTER_BITS', 1 << 20)
+
+# A room opened in memory with nobody in it is dropped after ROOM_IDLE_SECONDS;
+# a departed participant's binary handle is forgotten after HANDLE_RETAIN_SECONDS
+ROOM_IDLE_SECONDS = _env_int('ROOM_IDLE_SECONDS', 60)
+HANDLE_RETAIN_SECONDS = _env_int('HANDLE_RETAIN_SECONDS', 120)
+
+# SIGTERM drains the server instead of stopping it: no new joins, pending chat
+# is written, and the clients of each room are told to move, rooms spread over
+# DRAIN_STAGGER_SECONDS. The process exits once nobody is left or after
+# DRAIN_TIMEOUT_SECONDS. REUSE_PORT lets a replacement single-process server
+# bind the port while the old one drains (under the supervisor, SIGHUP drains
+# and restarts the workers one at a time).
+DRAIN_TIMEOUT_SECONDS = _env_int('DRAIN_TIMEOUT_SECONDS', 60)
+DRAIN_STAGGER_SECONDS = _env_int('DRAIN_STAGGER_SECONDS', 20)
+REUSE_PORT = _env_int('REUSE_PORT', 0)
+
+# With SFU on and aiortc installed, a room that grows past the mesh size (3)
+# switches to the media relay in the server (sfu.py) and takes up to
+# SFU_MAX_PARTICIPANTS. The server must be reachable over UDP by clients.
+# Under the supervisor this needs room affinity (WORKER_PORT_BASE), so that a
+# room's media all reaches one worker. SFU_STUN_SERVER finds the server's
+# public address behind NAT; empty offers only the host's own addresses.
+SFU = _env_int('SFU', 0)
+SFU_MAX_PARTICIPANTS = _env_int('SFU_MAX_PARTICIPANTS', 8)
+SFU_ANSWER_TIMEOUT_SECONDS = _env_int('SFU_ANSWER_TIMEOUT_SECONDS', 10)
+SFU_STUN_SERVER = os.environ.get('SFU_STUN_SERVER', 'stun:stun.l.google.com:19302')
@@ -0,0 +1,248 @@
+# db.py - SQLite storage backend
+#
+# SQLite calls block, so none of them may run on the aiohttp event loop.
+# Every write goes through one dedicated writer thread (SQLite only allows a
+# single writer anyway) and reads are spread over a small thread pool, each
+# thread holding its own read-only connection. Handlers simply `await` the
+# methods below.
+#
+# The database runs in WAL mode so readers never wait for the writer (and the
+# writer never waits for readers): joins and admin queries proceed while chat
+# batches are being committed.
+import asyncio
+import datetime
+import pathlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import Storage
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path, read_pool_size=4, journal_mode='WAL', synchronous='NORMAL',
+                 cache_size_kb=16384, busy_timeout_ms=5000):
+        self.path = path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix='db-reader')
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        # Open the writer connection up front so the journal mode is switched
+        # before the first read-only connection attaches
+        self._writer.submit(self._thread_conn, False).result()
+
+    # -----------------------------
+    # Connection / executor plumbing
+    # -----------------------------
+    def _connect(self, readonly):
+        if readonly:
+            uri = pathlib.Path(self.path).absolute().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+            conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def _thread_conn(self, readonly):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect(readonly)
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _run_write(self, fn, args):
+        conn = self._thread_conn(readonly=False)
+        with conn:  # commits on success, rolls back on error
+            return fn(conn.cursor(), *args)
+
+    def _run_read(self, fn, args):
+        return fn(self._thread_conn(readonly=True).cursor(), *args)
+
+    async def _write(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run_write, fn, args)
+
+    async def _read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+    # -----------------------------
+    # Rooms
+    # -----------------------------
+    async def create_room(self, room_id, password, ttl_hours=24):
+        return await self._write(_create_room, room_id, password, ttl_hours)
+
+    async def get_room(self, room_id):
+        return await self._read(_get_room, room_id)
+
+    # -----------------------------
+    # Messages
+    # -----------------------------
+    async def add_messages(self, rows):
+        await self._write(_add_messages, rows)
+
+    async def get_history(self, room_id, before_id=None, after_id=None, limit=50):
+        return await self._read(_get_history, room_id, before_id, after_id, limit)
+
+    # -----------------------------
+    # Recordings
+    # -----------------------------
+    async def save_recording(self, room_id, started_at, duration_seconds, participants):
+        await self._write(_save_recording, room_id, started_at, duration_seconds, participants)
+
+    # -----------------------------
+    # Expiry / maintenance
+    # -----------------------------
+    async def purge_expired(self, batch_size=500, rooms_per_batch=50, exclude=(), archive=None):
+        return await self._write(_purge_expired, batch_size, rooms_per_batch, tuple(exclude), archive)
+
+    async def incremental_vacuum(self, pages):
+        return await self._write(_incremental_vacuum, pages)
+
+    # -----------------------------
+    # Admin
+    # -----------------------------
+    async def admin_data(self):
+        return await self._read(_admin_data)
+
+
+# Blocking query bodies, executed on the writer / reader threads
+
+def _create_room(cur, room_id, password, ttl_hours):
+    cur.execute('SELECT 1 FROM rooms WHERE room_id = ?', (room_id,))
+    if cur.fetchone():
+        return False
+    cur.execute("INSERT INTO rooms (room_id, password, expires_at) VALUES (?, ?, datetime('now', ?))",
+                (room_id, password, f'+{int(ttl_hours)} hours'))
+    return True
+
+
+def _get_room(cur, room_id):
+    # Expiry is evaluated by SQLite against the same UTC clock as created_at
+    cur.execute('SELECT password, expires_at, COALESCE(expires_at <= CURRENT_TIMESTAMP, 0) FROM rooms WHERE room_id = ?',
+                (room_id,))
+    row = cur.fetchone()
+    return (row[0], row[1], bool(row[2])) if row else None
+
+
+def _add_messages(cur, rows):
+    cur.executemany('INSERT INTO messages (room_id, client_id, username, message) VALUES (?, ?, ?, ?)', rows)
+
+
+def _get_history(cur, room_id, before_id, after_id, limit):
+    # Both branches walk idx_messages_room_id (room_id, id), so a page costs
+    # O(limit) regardless of how many messages the room has
+    if after_id is not None:
+        cur.execute('SELECT id, username, message, timestamp FROM messages WHERE room_id = ? AND id > ? '
+                    'ORDER BY id ASC LIMIT ?', (room_id, after_id, limit + 1))
+        rows = cur.fetchall()
+    elif before_id is not None:
+        cur.execute('SELECT id, username, message, timestamp FROM messages WHERE room_id = ? AND id < ? '
+                    'ORDER BY id DESC LIMIT ?', (room_id, before_id, limit + 1))
+        rows = cur.fetchall()
+    else:
+        cur.execute('SELECT id, username, message, timestamp FROM messages WHERE room_id = ? '
+                    'ORDER BY id DESC LIMIT ?', (room_id, limit + 1))
+        rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is None:
+        rows.reverse()
+    messages = [{'id': r[0], 'username': r[1], 'message': r[2], 'timestamp': r[3]} for r in rows]
+    return {'messages': messages, 'has_more': has_more}
+
+
+def _save_recording(cur, room_id, started_at, duration_seconds, participants):
+    cur.execute('''
+        INSERT INTO recordings (room_id, started_at, ended_at, duration_seconds, participants)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (room_id, started_at, datetime.datetime.now().isoformat(), duration_seconds, participants))
+
+
+MESSAGE_COLUMNS = ('id', 'room_id', 'client_id', 'username', 'message', 'timestamp')
+
+
+def _purge_expired(cur, batch_size, rooms_per_batch, exclude, archive):
+    placeholders = ','.join('?' * len(exclude))
+    not_excluded = f'AND room_id NOT IN ({placeholders})' if exclude else ''
+    cur.execute(f'SELECT room_id, created_at FROM rooms WHERE expires_at <= CURRENT_TIMESTAMP {not_excluded} '
+                'ORDER BY expires_at LIMIT ?', (*exclude, rooms_per_batch))
+    created = dict(cur.fetchall())
+    room_ids = list(created)
+    result = {'rooms': 0, 'messages': 0, 'recordings': 0, 'done': not room_ids}
+    if not room_ids:
+        return result
+
+    in_rooms = ','.join('?' * len(room_ids))
+    columns = ', '.join(MESSAGE_COLUMNS) if archive else 'id'
+    cur.execute(f'SELECT {columns} FROM messages WHERE room_id IN ({in_rooms}) ORDER BY id LIMIT ?',
+                (*room_ids, batch_size))
+    rows = cur.fetchall()
+    if rows:
+        # Archive inside the transaction: if writing the segment fails, nothing is deleted
+        if archive:
+            archive([dict(zip(MESSAGE_COLUMNS, r), room_created_at=created[r[1]]) for r in rows])
+        cur.execute(f'DELETE FROM messages WHERE room_id IN ({in_rooms}) AND id <= ?', (*room_ids, rows[-1][0]))
+    result['messages'] = len(rows)
+    if result['messages'] >= batch_size:
+        return result
+
+    cur.execute(f'DELETE FROM recordings WHERE id IN (SELECT id FROM recordings WHERE room_id IN ({in_rooms}) LIMIT ?)',
+                (*room_ids, batch_size))
+    result['recordings'] = cur.rowcount
+    if result['recordings'] >= batch_size:
+        return result
+
+    # Nothing left that references these rooms
+    cur.execute(f'DELETE FROM rooms WHERE room_id IN ({in_rooms})', room_ids)
+    result['rooms'] = cur.rowcount
+    return result
+
+
+def _incremental_vacuum(cur, pages):
+    cur.execute('PRAGMA freelist_count')
+    before = cur.fetchone()[0]
+    # executescript steps the pragma to completion; execute() frees one page
+    cur.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+    cur.execute('PRAGMA freelist_count')
+    return before - cur.fetchone()[0]
+
+
+def _admin_data(cur):
+    # Get all rooms
+    cur.execute('SELECT room_id, created_at, password FROM rooms ORDER BY created_at DESC LIMIT 50')
+    rooms_data = [{'room_id': r[0], 'created_at': r[1], 'has_password': bool(r[2])} for r in cur.fetchall()]
+
+    # Get recent messages
+    cur.execute('SELECT room_id, username, message, timestamp FROM messages ORDER BY id DESC LIMIT 100')
+    messages_data = [{'room_id': r[0], 'username': r[1], 'message': r[2], 'timestamp': r[3]} for r in cur.fetchall()]
+
+    # Get recordings
+    cur.execute('SELECT room_id, started_at, ended_at, duration_seconds, participants FROM recordings ORDER BY id DESC LIMIT 50')
+    recordings_data = [{'room_id': r[0], 'started_at': r[1], 'ended_at': r[2], 'duration_seconds': r[3], 'participants': r[4]} for r in cur.fetchall()]
+
+    return {
+        'rooms': rooms_data,
+        'messages': messages_data,
+        'recordings': recordings_data
+    }
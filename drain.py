@@ -0,0 +1,79 @@
+# drain.py - Emptying a server before it stops
+#
+# Stopping the process used to drop every websocket at once, and every
+# client then rejoined at the same moment: a burst of join_room requests,
+# token claims and history queries against SQLite. A drain (SIGTERM) instead:
+#
+#   - turns new rooms and joins away (create_room and join_room answer 503
+#     with a retry delay)
+#   - writes out the chat messages still queued
+#   - tells the clients of each room to move elsewhere, the rooms spread
+#     evenly over `stagger` seconds so that they arrive a few at a time
+#   - returns once nobody is connected here any more, or after `timeout`
+#
+# What "elsewhere" means is up to migrate(): under the supervisor, the worker
+# now owning the room, which takes the session over (backplane.py); alone,
+# wherever join_room sends the client next.
+import asyncio
+import time
+
+
+class Drain:
+    def __init__(self, rooms, remaining, flush, migrate, timeout=60, stagger=20, retry_after=1.0, poll=0.5):
+        self.rooms = rooms  # callable returning [(room_id, room)] with participants connected here
+        self.remaining = remaining  # callable returning how many participants are still connected here
+        self.flush = flush  # coroutine function writing out queued chat messages
+        self.migrate = migrate  # migrate(room_id, room, after_ms): tell a room's clients to move
+        self.timeout = timeout
+        self.stagger = stagger
+        self.retry_after = retry_after
+        self.poll = poll
+        self.started_at = None
+
+        # Metrics
+        self.rooms_migrated = 0
+        self.participants_at_start = 0
+        self.turned_away = 0
+        self.left_behind = None
+        self.duration_s = None
+
+    @property
+    def draining(self):
+        return self.started_at is not None
+
+    def turn_away(self):
+        """Count a refused join; returns how long the client should wait before retrying, in ms."""
+        self.turned_away += 1
+        return int(self.retry_after * 1000)
+
+    async def run(self):
+        """Drain; returns once nobody is connected here or the deadline has passed."""
+        self.started_at = time.monotonic()
+        deadline = self.started_at + self.timeout
+        self.participants_at_start = self.remaining()
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"❌ Drain could not flush chat: {e}")
+
+        rooms = list(self.rooms())
+        step = self.stagger / len(rooms) if rooms else 0
+        for i, (room_id, room) in enumerate(rooms):
+            self.migrate(room_id, room, int(i * step * 1000))
+            self.rooms_migrated += 1
+
+        while self.remaining() and time.monotonic() < deadline:
+            await asyncio.sleep(self.poll)
+        self.left_behind = self.remaining()
+        self.duration_s = round(time.monotonic() - self.started_at, 3)
+
+    def stats(self):
+        return {
+            'draining': self.draining,
+            'elapsed_s': round(time.monotonic() - self.started_at, 3) if self.draining else 0.0,
+            'rooms_migrated': self.rooms_migrated,
+            'participants_at_start': self.participants_at_start,
+            'participants_remaining': self.remaining() if self.draining else None,
+            'turned_away': self.turned_away,
+            'left_behind': self.left_behind,
+        }
@@ -0,0 +1,87 @@
+# fanout.py - Non-blocking websocket fan-out with per-recipient accounting
+#
+# Sending to participants one after another makes every recipient wait for
+# the ones before it, so a single stalled peer delays the whole room. Fanout
+# hands a frame to each recipient's own outbound queue (participants.py)
+# and returns immediately. Every recipient is then written concurrently by
+# its own writer task, and one recipient's failure cannot touch the others.
+# The writers report back here how long each frame spent between fan-out
+# and the socket.
+#
+# A broadcast wraps its payload in a single Frame, so the JSON is encoded
+# once for the whole room rather than once per recipient.
+from frames import as_frame
+
+
+class Fanout:
+    def __init__(self):
+        self.sends = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.dropped = 0
+        self.evictions = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._recipients = {}  # client_id -> {'sends', 'failures', 'timeouts', 'dropped', 'total_ms', 'max_ms', 'last_ms'}
+
+    def send(self, participant, payload):
+        """Queue one frame for one participant; returns False if it is already gone."""
+        return participant.send(as_frame(payload))
+
+    def broadcast(self, recipients, payload):
+        """Queue the same frame for every recipient; returns how many accepted it."""
+        frame = as_frame(payload)
+        return sum(1 for p in recipients if p.send(frame))
+
+    def forget(self, client_id):
+        self._recipients.pop(client_id, None)
+
+    def _entry(self, client_id):
+        entry = self._recipients.get(client_id)
+        if entry is None:
+            entry = self._recipients[client_id] = {
+                'sends': 0, 'failures': 0, 'timeouts': 0, 'dropped': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0
+            }
+        return entry
+
+    def record(self, client_id, elapsed_ms, outcome):
+        entry = self._entry(client_id)
+        entry['sends'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['last_ms'] = elapsed_ms
+        self.sends += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if outcome == 'failure':
+            entry['failures'] += 1
+            self.failures += 1
+        elif outcome == 'timeout':
+            entry['timeouts'] += 1
+            self.timeouts += 1
+
+    def record_drop(self, client_id, count):
+        self._entry(client_id)['dropped'] += count
+        self.dropped += count
+
+    def record_eviction(self, client_id):
+        self.evictions += 1
+
+    def stats(self, slowest=5):
+        by_avg = sorted(((client_id, e) for client_id, e in self._recipients.items() if e['sends']),
+                        key=lambda item: item[1]['total_ms'] / item[1]['sends'], reverse=True)[:slowest]
+        return {
+            'sends': self.sends,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'dropped': self.dropped,
+            'evictions': self.evictions,
+            'avg_send_ms': round(self.total_ms / self.sends, 3) if self.sends else 0.0,
+            'max_send_ms': round(self.max_ms, 3),
+            'slowest_recipients': [
+                {'client_id': client_id, 'sends': e['sends'], 'failures': e['failures'], 'timeouts': e['timeouts'],
+                 'dropped': e['dropped'], 'avg_ms': round(e['total_ms'] / e['sends'], 3),
+                 'max_ms': round(e['max_ms'], 3), 'last_ms': round(e['last_ms'], 3)}
+                for client_id, e in by_avg
+            ],
+        }
@@ -0,0 +1,86 @@
+# frames.py - Outbound websocket frames, serialized at most once
+#
+# A chat line goes to every participant in the room. Calling send_json once
+# per recipient runs json.dumps once per recipient. A Frame instead carries
+# the payload and caches its encoded text: the first writer to need the text
+# encodes it, and every other recipient reuses the same string.
+#
+# Relayed signalling (offer/answer/ice_candidate) is never re-encoded. The
+# server reads only the routing fields off the front of the client's text
+# (see RELAY_ROUTE) and forwards the original text unchanged.
+#
+# Clients on the binary subprotocol (binary_protocol.py) are sent the
+# MessagePack form instead, which is likewise built at most once per frame.
+import re
+
+import binary_protocol
+import codec
+
+# Browsers send JSON.stringify({type, sender_id, target_id, ...}), so the
+# routing fields always come first and in this order. Anything else, e.g.
+# escaped quotes in an id or reordered keys, falls back to a full parse.
+RELAY_ROUTE = re.compile(
+    r'^\{"type":"(offer|answer|ice_candidate)","sender_id":"([^"\\]*)","target_id":"([^"\\]*)",'
+)
+RELAY_TYPES = ('offer', 'answer', 'ice_candidate')
+
+
+class Frame:
+    __slots__ = ('type', '_payload', '_text', '_binary', '_handles')
+
+    def __init__(self, payload, text=None):
+        self.type = payload.get('type') if payload is not None else None
+        self._payload = payload
+        self._text = text
+        self._binary = None
+        self._handles = None
+
+    @classmethod
+    def raw(cls, frame_type, text):
+        """Wrap text that is already valid JSON, e.g. a frame being relayed as-is."""
+        frame = cls(None, text)
+        frame.type = frame_type
+        return frame
+
+    @classmethod
+    def raw_binary(cls, frame_type, data, handles):
+        """Wrap a binary_protocol frame received from a client, for relaying as-is."""
+        frame = cls(None)
+        frame.type = frame_type
+        frame._binary = data
+        frame._handles = handles
+        return frame
+
+    @property
+    def is_text(self):
+        return self._text is not None
+
+    @property
+    def size(self):
+        """Bytes of encoded form held so far (0 for a payload nobody has encoded yet)."""
+        return len(self._text if self._text is not None else self._binary or b'')
+
+    @property
+    def payload(self):
+        if self._payload is None:
+            if self._text is not None:
+                self._payload = codec.loads(self._text)
+            else:
+                self._payload = binary_protocol.unpack(self._binary, self._handles)
+        return self._payload
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = codec.dumps(self.payload)
+        return self._text
+
+    def binary(self, handles):
+        """MessagePack form for a binary client; `handles` is the room's ParticipantRegistry."""
+        if self._binary is None:
+            self._binary = binary_protocol.pack(self.payload, handles)
+        return self._binary
+
+
+def as_frame(payload):
+    return payload if isinstance(payload, Frame) else Frame(payload)
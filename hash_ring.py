@@ -0,0 +1,55 @@
+# hash_ring.py - Consistent hashing of room ids onto workers
+#
+# Under the supervisor every worker can serve any room (backplane.py), but a
+# room whose members sit on different workers pays a broker hop for every
+# relayed frame. join_room therefore points the websocket at the room's
+# owner, picked from this ring, so that a room's members all end up in one
+# process.
+#
+# Each node is placed on the ring at `vnodes` pseudo-random points and owns
+# the arc before each of them. When a node joins or leaves, only the rooms
+# on its arcs change owner (about 1/N of them); every other room keeps its
+# worker.
+import bisect
+import hashlib
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    def __init__(self, nodes=(), vnodes=160):
+        self.vnodes = vnodes
+        self.nodes = set()
+        self._points = []  # sorted positions on the ring
+        self._owners = {}  # position -> node
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f'{node}#{i}')
+            if point not in self._owners:
+                self._owners[point] = node
+                bisect.insort(self._points, point)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: self._owners[point] for point in self._points}
+
+    def node_for(self, key):
+        """The node owning `key`, or None while the ring is empty."""
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[i]]
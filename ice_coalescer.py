@@ -0,0 +1,87 @@
+# ice_coalescer.py - Batch trickled ICE candidates per (sender, target) pair
+#
+# Browsers fire onicecandidate once per gathered candidate, and each of them
+# used to become its own relayed websocket frame. When somebody joins a mesh
+# that means a burst of small frames, one wakeup and one write each, in every
+# direction. The coalescer holds candidates for a pair for `window` seconds
+# and then delivers them as one frame:
+#
+#   {"type":"ice_candidates","sender_id":..,"target_id":..,"frames":[<ice_candidate>, ...]}
+#
+# Batched JSON frames are the clients' original text, spliced in without
+# being decoded. A window holding a single candidate forwards it unchanged.
+# Callers must flush() a pair before relaying anything else from the same
+# sender to the same target, so candidates never overtake an offer or answer.
+import asyncio
+
+import codec
+from frames import Frame
+
+
+class IceCoalescer:
+    def __init__(self, send, window=0.02, max_batch=32):
+        self.send = send  # send(participant, frame), e.g. Fanout.send
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # (sender_id, target_id) -> [target, [Frame], timer]
+
+        # Metrics
+        self.candidates = 0
+        self.frames_sent = 0
+        self.batches = 0
+
+    def add(self, sender_id, target, frame):
+        """Queue one ice_candidate Frame from sender_id for target."""
+        self.candidates += 1
+        if self.window <= 0:
+            self._deliver(sender_id, target, [frame])
+            return
+
+        key = (sender_id, target.id)
+        entry = self._pending.get(key)
+        if entry is None:
+            timer = asyncio.get_running_loop().call_later(self.window, self.flush, sender_id, target.id)
+            entry = self._pending[key] = [target, [], timer]
+        entry[1].append(frame)
+        if len(entry[1]) >= self.max_batch:
+            self.flush(sender_id, target.id)
+
+    def flush(self, sender_id, target_id):
+        entry = self._pending.pop((sender_id, target_id), None)
+        if entry is None:
+            return
+        target, frames, timer = entry
+        timer.cancel()
+        self._deliver(sender_id, target, frames)
+
+    def flush_target(self, target_id):
+        """Deliver everything pending for a participant now, e.g. before it moves to another worker."""
+        for key in [key for key in self._pending if key[1] == target_id]:
+            self.flush(*key)
+
+    def _deliver(self, sender_id, target, frames):
+        self.frames_sent += 1
+        if len(frames) == 1:
+            self.send(target, frames[0])
+            return
+        self.batches += 1
+        if all(f.is_text for f in frames):
+            text = (f'{{"type":"ice_candidates","sender_id":{codec.dumps(sender_id)},'
+                    f'"target_id":{codec.dumps(target.id)},"frames":[{",".join(f.text for f in frames)}]}}')
+            self.send(target, Frame.raw('ice_candidates', text))
+        else:
+            self.send(target, Frame({'type': 'ice_candidates', 'sender_id': sender_id, 'target_id': target.id,
+                                     'frames': [f.payload for f in frames]}))
+
+    def forget(self, client_id):
+        """Drop pending candidates from or to a participant who left."""
+        for key in [key for key in self._pending if client_id in key]:
+            self._pending.pop(key)[2].cancel()
+
+    def stats(self):
+        return {
+            'candidates': self.candidates,
+            'frames_sent': self.frames_sent,
+            'batches': self.batches,
+            'pending_pairs': len(self._pending),
+        }
@@ -0,0 +1,125 @@
+# join_tokens.py - Signed, expiring, single-use join tokens
+#
+# join_room used to store a random token in the room's pending_tokens and the
+# websocket handler popped it. That tied the websocket to the process that
+# answered the HTTP join and kept every token that was never redeemed in
+# memory for good. A token now carries what the handler needs:
+#
+#   base64url([room_id, username, expires_at, nonce]) "." base64url(HMAC-SHA256)
+#
+# so any process holding the secret can check it without shared state. A
+# token works once: redeemed signatures go into a ReplayFilter, a pair of
+# Bloom filters that take turns, each covering one token lifetime. Its memory
+# is fixed however many tokens are issued. A false positive turns a fresh
+# token away as already used: the websocket gets an error frame marked
+# 'rejoin' and is closed, and the bundled client asks join_room for a new
+# token once before showing the error. With the default 1 Mbit filters and 7
+# hashes that happens to about 1 in 100 million joins at 10,000 joins per
+# token lifetime, 3 in 10,000 at 50,000 and 1 in 80 at 100,000; raise
+# JOIN_TOKEN_FILTER_BITS past that (broker or /admin/metrics stats show the
+# current false_positive_rate).
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import time
+
+import codec
+
+SIGNATURE_BYTES = 16
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class JoinTokens:
+    def __init__(self, secret, ttl=120):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.ttl = ttl
+
+    def _sign(self, body):
+        return hmac.new(self.secret, body.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+    def issue(self, room_id, username):
+        body = _b64encode(codec.dumps([room_id, username, int(time.time()) + self.ttl,
+                                       _b64encode(os.urandom(8))]).encode())
+        return f'{body}.{_b64encode(self._sign(body))}'
+
+    def verify(self, token, room_id):
+        """Returns (username, signature) for a valid, unexpired token for room_id, else (None, None)."""
+        body, _, signature = (token or '').partition('.')
+        try:
+            signature = _b64decode(signature)
+            if not hmac.compare_digest(signature, self._sign(body)):
+                return None, None
+            token_room, username, expires_at, _ = codec.loads(_b64decode(body))
+        except (ValueError, TypeError, binascii.Error):
+            return None, None
+        if token_room != room_id or expires_at < time.time():
+            return None, None
+        return username, signature
+
+
+class ReplayFilter:
+    """Remembers redeemed token signatures for at least `window` seconds in fixed memory."""
+
+    def __init__(self, bits=1 << 20, hashes=7, window=120):
+        self.bits = bits
+        self.hashes = hashes
+        self.window = window
+        self._current = bytearray(bits // 8)
+        self._previous = bytearray(bits // 8)
+        self._rotated_at = time.monotonic()
+
+        # Metrics
+        self.added = 0
+        self.rejected = 0
+        self.rotations = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=self.hashes * 4).digest()
+        return [int.from_bytes(digest[i:i + 4], 'big') % self.bits for i in range(0, len(digest), 4)]
+
+    @staticmethod
+    def _has(bitmap, positions):
+        return all(bitmap[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _rotate(self):
+        now = time.monotonic()
+        elapsed = now - self._rotated_at
+        if elapsed < self.window:
+            return
+        # Anything older than two windows belongs to an expired token
+        self._previous = self._current if elapsed < 2 * self.window else bytearray(self.bits // 8)
+        self._current = bytearray(self.bits // 8)
+        self._rotated_at = now
+        self.rotations += 1
+
+    def add(self, key):
+        """Record `key`; returns False if it (probably) was recorded before."""
+        self._rotate()
+        positions = self._positions(key)
+        if self._has(self._current, positions) or self._has(self._previous, positions):
+            self.rejected += 1
+            return False
+        for p in positions:
+            self._current[p >> 3] |= 1 << (p & 7)
+        self.added += 1
+        return True
+
+    def stats(self):
+        filled = int.from_bytes(self._current, 'big').bit_count() / self.bits
+        return {
+            'added': self.added,
+            'rejected': self.rejected,
+            'rotations': self.rotations,
+            'bytes': len(self._current) + len(self._previous),
+            'fill_ratio': round(filled, 4),
+            'false_positive_rate': round(filled ** self.hashes, 8),
+        }
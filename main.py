@@ -2,66 +2,264 @@
 
 # server.py - Enhanced Multi-User WebRTC Video Call Server with Admin Panel
 import aiohttp.web as web
-import json
+from aiohttp import hdrs
+from aiohttp.http_websocket import ws_ext_gen
+import asyncio
 import uuid
-from collections import defaultdict
-import sqlite3
 import datetime
+import os
+import secrets
+import signal
+import socket
+import time
 import hashlib
 
-# Global DB connection
-conn = None
+import config
+import codec
+import binary_protocol
+import migrations
+import sfu
+from db import SQLiteStorage
+from storage import MemoryStorage
+from chat_persister import ChatPersister
+from room_cache import RoomCache
+from sweeper import RoomSweeper
+from archive import ChatArchive
+from fanout import Fanout
+from participants import Participant
+from frames import Frame, RELAY_ROUTE, RELAY_TYPES
+from ice_coalescer import IceCoalescer
+from reaper import Reaper
+from backplane import BackplaneClient, RemoteParticipant
+from join_tokens import JoinTokens, ReplayFilter
+from timer_wheel import TimerWheel
+from room_registry import RoomRegistry
+from drain import Drain
+import supervisor
+
+# Global storage backend (see storage.py / db.py)
+db = None
+
+# Buffered chat writer, started with the app (see chat_persister.py)
+chat_persister = None
+
+# Room metadata served to join_room from memory (see room_cache.py)
+room_cache = RoomCache(max_entries=config.ROOM_CACHE_SIZE, ttl=config.ROOM_CACHE_TTL_SECONDS)
+
+# Periodic purge of expired rooms, started with the app (see sweeper.py)
+room_sweeper = None
+
+# Compressed segments holding chat of expired rooms (see archive.py)
+chat_archive = None
+
+# Non-blocking websocket fan-out with per-recipient latency (see fanout.py)
+fanout = Fanout()
+
+# Batches trickled ICE candidates per sender/target pair (see ice_coalescer.py)
+ice_coalescer = IceCoalescer(fanout.send, window=config.ICE_COALESCE_MS / 1000, max_batch=config.ICE_COALESCE_MAX)
+
+# Pings quiet participants and drops dead ones, started with the app (see reaper.py)
+reaper = None
+
+# Second-resolution timers for resume grace, idle rooms and handles, started with the app (see timer_wheel.py)
+timers = TimerWheel(tick=1.0)
+
+# Room state shared with the other workers when run under the supervisor (see backplane.py)
+backplane = None
+
+# Signed join tokens; redeemed ones are remembered here, or by the broker under the supervisor (see join_tokens.py)
+join_tokens = JoinTokens(config.JOIN_TOKEN_SECRET or secrets.token_hex(32), ttl=config.JOIN_TOKEN_TTL_SECONDS)
+replay_filter = ReplayFilter(bits=config.JOIN_TOKEN_FILTER_BITS, window=config.JOIN_TOKEN_TTL_SECONDS)
 
 # Hardcoded admin credentials (NEVER CHANGE)
 ADMIN_USERNAME = "Rohit"
 ADMIN_PASSWORD = "Rohit@9211#@$!1234567"
 
 def init_db():
-    global conn
-    conn = sqlite3.connect('video_calls.db', check_same_thread=False)
-    cur = conn.cursor()
-    
-    # Rooms table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS rooms (
-            room_id TEXT PRIMARY KEY,
-            password TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    global db, chat_archive
+    if config.ARCHIVE_DIR:
+        chat_archive = ChatArchive(config.ARCHIVE_DIR, segment_max_bytes=config.ARCHIVE_SEGMENT_MAX_MB * 1024 * 1024)
     
-    # Messages/Chat table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_id TEXT,
-            client_id TEXT,
-            username TEXT,
-            message TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (room_id) REFERENCES rooms (room_id)
-        )
-    ''')
+    if config.STORAGE_BACKEND == 'memory':
+        db = MemoryStorage()
+        return
     
-    # Call recordings metadata table
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS recordings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_id TEXT,
-            started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            ended_at DATETIME,
-            duration_seconds INTEGER,
-            participants TEXT,
-            FOREIGN KEY (room_id) REFERENCES rooms (room_id)
-        )
-    ''')
+    migrations.migrate(config.DB_PATH)
     
-    conn.commit()
+    db = SQLiteStorage(
+        config.DB_PATH,
+        read_pool_size=config.DB_READ_POOL_SIZE,
+        journal_mode=config.DB_JOURNAL_MODE,
+        synchronous=config.DB_SYNCHRONOUS,
+        cache_size_kb=config.DB_CACHE_SIZE_KB
+    )
+
+async def close_db(app):
+    if db is not None:
+        db.close()
+    if chat_archive is not None:
+        chat_archive.close()
+
+async def start_chat_persister(app):
+    global chat_persister
+    chat_persister = ChatPersister(
+        db,
+        batch_size=config.CHAT_FLUSH_BATCH_SIZE,
+        flush_interval=config.CHAT_FLUSH_INTERVAL_MS / 1000,
+        max_queue=config.CHAT_QUEUE_MAX
+    )
+    chat_persister.start()
+
+async def stop_chat_persister(app):
+    if chat_persister is not None:
+        await chat_persister.close()
+
+def active_room_ids():
+    # Rooms with people still in a call are never purged, even past expiry
+    active = [room_id for room_id, room in rooms.items() if room['participants']]
+    if backplane is not None:
+        active.extend(backplane.active_rooms)
+    return active
+
+async def start_room_sweeper(app):
+    global room_sweeper
+    if config.WORKER_ID > 1:
+        return  # the first worker sweeps for all of them
+    room_sweeper = RoomSweeper(
+        db,
+        interval=config.SWEEP_INTERVAL_SECONDS,
+        batch_size=config.SWEEP_BATCH_SIZE,
+        vacuum_pages=config.SWEEP_VACUUM_PAGES,
+        active_rooms=active_room_ids,
+        archive=chat_archive
+    )
+    room_sweeper.start()
+
+async def stop_room_sweeper(app):
+    if room_sweeper is not None:
+        await room_sweeper.close()
+
+def all_participants():
+    # Connected to this process; members on other workers are theirs to look after
+    return [p for room in rooms.values() for p in room['participants'] if not p.remote]
+
+async def start_reaper(app):
+    global reaper
+    if not config.HEARTBEAT_INTERVAL_SECONDS:
+        return
+    reaper = Reaper(
+        all_participants,
+        interval=config.HEARTBEAT_INTERVAL_SECONDS,
+        timeout=config.HEARTBEAT_TIMEOUT_SECONDS,
+        mode=config.HEARTBEAT_MODE
+    )
+    reaper.start()
+
+async def stop_reaper(app):
+    if reaper is not None:
+        await reaper.close()
+
+async def start_timers(app):
+    timers.start()
+
+async def stop_timers(app):
+    await timers.close()
+
+async def start_backplane(app):
+    global backplane
+    if not config.WORKER_ID:
+        return
+    backplane = BackplaneClient(config.BACKPLANE_SOCKET, config.WORKER_ID, on_backplane_message,
+                                vnodes=config.HASH_RING_VNODES)
+    await backplane.connect(on_lost=backplane_lost)
+
+async def stop_backplane(app):
+    if backplane is not None:
+        await backplane.close()
+
+def backplane_lost():
+    # Without the broker this worker cannot see the rest of its rooms
+    print(f"❌ Worker {config.WORKER_ID} lost the backplane; shutting down")
+    os.kill(os.getpid(), signal.SIGINT)
+
+# Set once SIGTERM has started draining this process (see drain.py)
+drain = None
+
+# Media relay for rooms too big for a mesh, when enabled and aiortc is installed (see sfu.py)
+sfu_relay = None
+
+async def start_sfu(app):
+    global sfu_relay
+    if not config.SFU:
+        return
+    if not sfu.available():
+        print('⚠️ SFU=1 but aiortc is not installed; rooms stay mesh-only')
+        return
+    if config.WORKER_ID and not config.WORKER_PORT_BASE:
+        print('⚠️ SFU needs room affinity (WORKER_PORT_BASE) under the supervisor; rooms stay mesh-only')
+        return
+    sfu_relay = sfu.Sfu(answer_timeout=config.SFU_ANSWER_TIMEOUT_SECONDS, stun_server=config.SFU_STUN_SERVER or None)
 
-# Store active room information in memory
-rooms = defaultdict(lambda: {'participants': [], 'pending_tokens': {}, 'recording_id': None})
+async def stop_sfu(app):
+    if sfu_relay is not None:
+        await sfu_relay.close()
 
-MAX_PARTICIPANTS = 3
+async def handle_drain_signal(app):
+    # Replaces aiohttp's SIGTERM handler; SIGINT still stops at once
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, start_drain)
+
+def start_drain():
+    global drain
+    if drain is not None:
+        return
+    drain = Drain(
+        local_rooms,
+        lambda: len(all_participants()),
+        chat_persister.flush,
+        migrate_room,
+        timeout=config.DRAIN_TIMEOUT_SECONDS,
+        stagger=config.DRAIN_STAGGER_SECONDS
+    )
+    asyncio.create_task(drain_and_exit())
+
+async def drain_and_exit():
+    print(f"🚰 Draining {len(all_participants())} participants within {config.DRAIN_TIMEOUT_SECONDS}s...")
+    if backplane is not None:
+        # Hand this worker's rooms to the others on the hash ring
+        try:
+            await backplane.request('drain')
+        except ConnectionError:
+            pass
+    await drain.run()
+    print(f"🚰 Drained in {drain.duration_s}s; {drain.left_behind} participants left behind")
+    os.kill(os.getpid(), signal.SIGINT)
+
+def local_rooms():
+    return [(room_id, room) for room_id, room in list(rooms.items())
+            if any(not p.remote for p in room['participants'])]
+
+def migrate_frame(room_id, after_ms):
+    # Under the supervisor, the port of the room's new owner, where the
+    # session can be resumed; otherwise the client joins again
+    owner = backplane.room_owner(room_id) if backplane is not None and config.WORKER_PORT_BASE else None
+    if owner in (None, config.WORKER_ID):
+        return {'type': 'migrate', 'after_ms': after_ms, 'port': None, 'ws_url': None}
+    return {'type': 'migrate', 'after_ms': after_ms, 'port': config.WORKER_PORT_BASE + owner,
+            'ws_url': worker_ws_url(room_id, owner)}
+
+def migrate_room(room_id, room, after_ms):
+    fanout.broadcast([p for p in room['participants'] if not p.remote], migrate_frame(room_id, after_ms))
+
+# Store active room information in memory (see room_registry.py)
+rooms = RoomRegistry(timers, idle_ttl=config.ROOM_IDLE_SECONDS)
+
+MAX_PARTICIPANTS = 3  # in a mesh
+
+def room_limit():
+    return config.SFU_MAX_PARTICIPANTS if sfu_relay is not None else MAX_PARTICIPANTS
+
+def json_response(data):
+    return web.json_response(data, dumps=codec.dumps)
 
 async def index(request):
     html = """
@@ -455,6 +653,17 @@ async def index(request):
             animation: slideIn 0.3s;
         }
         
+        .load-earlier {
+            margin: 12px 20px 0;
+            padding: 8px;
+            background: none;
+            border: 1px solid #5f6368;
+            border-radius: 16px;
+            color: #8ab4f8;
+            font-size: 13px;
+            cursor: pointer;
+        }
+        
         @keyframes slideIn {
             from {
                 opacity: 0;
@@ -778,6 +987,7 @@ async def index(request):
                 <h3>Messages</h3>
                 <button class="close-chat" onclick="toggleChat()">×</button>
             </div>
+            <button id="loadEarlierBtn" class="load-earlier hidden" onclick="loadEarlierMessages()">Load earlier messages</button>
             <div id="chatMessages" class="chat-messages"></div>
             <div class="chat-input-area">
                 <div class="chat-input-group">
@@ -857,7 +1067,17 @@ async def index(request):
         let myClientId;
         let myUsername;
         let currentRoomId;
+        let currentRoomPassword = '';
+        let oldestMessageId = null;
         let ws;
+        let roomWsUrl = null;
+        let resumeToken = null;
+        let receivedFrames = 0;
+        let reconnectAttempts = 0;
+        let tokenRetried = false;
+        let migrateTimer = null;
+        let mediaMode = 'mesh';
+        let sfuPc = null;
         let permissionsGranted = false;
         let recordingStartTime = null;
         
@@ -946,6 +1166,13 @@ async def index(request):
                 });
                 const data = await res.json();
                 
+                if (res.status === 503 && data.retry_after_ms) {
+                    // Draining for a restart, as in performJoin
+                    showStatus(data.error + ', retrying...', 'info');
+                    setTimeout(createRoom, data.retry_after_ms * (1 + Math.random()));
+                    return;
+                }
+                
                 if (!data.success) {
                     showStatus(data.error, 'error');
                     return;
@@ -979,7 +1206,7 @@ async def index(request):
             await performJoin(roomId, password, name);
         }
         
-        async function performJoin(roomId, password, username) {
+        async function performJoin(roomId, password, username, attempt = 0) {
             try {
                 const res = await fetch('/join_room', {
                     method: 'POST',
@@ -988,6 +1215,14 @@ async def index(request):
                 });
                 const data = await res.json();
                 
+                if (res.status === 503 && data.retry_after_ms) {
+                    // The server is draining for a restart; spread our retry so we don't all come back together
+                    showStatus(data.error + ', retrying...', 'info');
+                    setTimeout(() => performJoin(roomId, password, username, attempt + 1),
+                               data.retry_after_ms * (1 + Math.random()));
+                    return;
+                }
+                
                 if (!data.success) {
                     showStatus(data.error, 'error');
                     return;
@@ -995,10 +1230,11 @@ async def index(request):
                 
                 myUsername = username;
                 currentRoomId = roomId;
+                currentRoomPassword = password;
                 recordingStartTime = new Date();
                 
-                displayChatHistory(data.history);
-                connectWebSocket(currentRoomId, data.token);
+                displayChatHistory(data.history, data.history_has_more);
+                connectWebSocket(currentRoomId, data.token, data.ws_url);
                 
                 document.getElementById('lobby').style.display = 'none';
                 document.getElementById('callInterface').classList.add('active');
@@ -1006,18 +1242,51 @@ async def index(request):
                 document.getElementById('localLabel').textContent = `You (${myUsername})`;
                 document.getElementById('localVideo').srcObject = localStream;
             } catch (err) {
+                if (currentRoomId === roomId && attempt < 10) {
+                    // Rejoining after a migration while the server restarts
+                    setTimeout(() => performJoin(roomId, password, username, attempt + 1),
+                               Math.min(500 * 2 ** attempt, 8000) * (1 + Math.random()));
+                    return;
+                }
                 showStatus('Failed to join: ' + err.message, 'error');
             }
         }
         
-        function displayChatHistory(history) {
+        function displayChatHistory(history, hasMore) {
             const messagesEl = document.getElementById('chatMessages');
             messagesEl.innerHTML = '';
             history.forEach(msg => appendChatMessage(msg, false));
+            oldestMessageId = history.length ? history[0].id : null;
+            document.getElementById('loadEarlierBtn').classList.toggle('hidden', !hasMore);
         }
         
-        function appendChatMessage(msg, isNew = true) {
-            const messagesEl = document.getElementById('chatMessages');
+        async function loadEarlierMessages() {
+            if (oldestMessageId === null) return;
+            
+            try {
+                const res = await fetch('/history', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ room_id: currentRoomId, password: currentRoomPassword, before_id: oldestMessageId })
+                });
+                const data = await res.json();
+                
+                if (!data.success) {
+                    showToast('Error: ' + data.error);
+                    return;
+                }
+                
+                const messagesEl = document.getElementById('chatMessages');
+                const firstEl = messagesEl.firstChild;
+                data.messages.forEach(msg => messagesEl.insertBefore(createMessageElement(msg), firstEl));
+                if (data.messages.length) oldestMessageId = data.messages[0].id;
+                document.getElementById('loadEarlierBtn').classList.toggle('hidden', !data.has_more);
+            } catch (err) {
+                console.error('Error loading history:', err);
+            }
+        }
+        
+        function createMessageElement(msg) {
             const div = document.createElement('div');
             div.className = 'message';
             div.innerHTML = `
@@ -1025,7 +1294,12 @@ async def index(request):
                 <div class="text">${escapeHtml(msg.message)}</div>
                 <div class="time">${new Date(msg.timestamp).toLocaleTimeString()}</div>
             `;
-            messagesEl.appendChild(div);
+            return div;
+        }
+        
+        function appendChatMessage(msg, isNew = true) {
+            const messagesEl = document.getElementById('chatMessages');
+            messagesEl.appendChild(createMessageElement(msg));
             messagesEl.scrollTop = messagesEl.scrollHeight;
         }
         
@@ -1048,31 +1322,110 @@ async def index(request):
             document.getElementById('chatSidebar').classList.toggle('open');
         }
         
-        function connectWebSocket(roomId, token) {
+        function connectWebSocket(roomId, token, wsUrl) {
+            // The server may point us at the process hosting this room
+            roomWsUrl = wsUrl || null;
+            receivedFrames = 0;
+            openSocket(roomId, `token=${token}`);
+        }
+        
+        function resumeSession() {
+            if (!currentRoomId || !resumeToken) return;
+            // The server replays whatever we missed after frame number receivedFrames
+            openSocket(currentRoomId, `resume=${resumeToken}&last_seq=${receivedFrames}`);
+        }
+        
+        async function rejoinRoom() {
+            // Our slot is gone: drop the stale peer connections and join afresh
+            const roomId = currentRoomId;
+            ws = null;
+            resumeToken = null;
+            reconnectAttempts = 0;
+            Object.keys(remoteVideos).forEach(removeParticipant);
+            peerConnections.forEach(pc => pc.close());
+            peerConnections.clear();
+            stopSfu();
+            await performJoin(roomId, currentRoomPassword, myUsername);
+        }
+        
+        function migrateSession(socket, port, wsUrl) {
+            migrateTimer = null;
+            if (socket !== ws || !currentRoomId) return;
+            // Only follow a bare port if join_room already sent us to a worker's own port
+            if ((wsUrl || (port && roomWsUrl)) && resumeToken) {
+                // Resume on the server now hosting the room; it takes our session over
+                if (wsUrl) {
+                    roomWsUrl = wsUrl;
+                } else {
+                    const url = new URL(socket.url);
+                    url.port = port;
+                    url.search = '';
+                    roomWsUrl = url.toString();
+                }
+                resumeSession();
+                return;
+            }
+            rejoinRoom();
+            socket.close(1000);
+        }
+        
+        function openSocket(roomId, query) {
             const wsProtocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
-            const wsUrl = `${wsProtocol}//${location.host}/ws/${roomId}?token=${token}`;
-            ws = new WebSocket(wsUrl);
+            const wsUrl = `${roomWsUrl || `${wsProtocol}//${location.host}/ws/${roomId}`}?${query}`;
+            const socket = new WebSocket(wsUrl);
+            ws = socket;
             
             ws.onopen = () => {
                 console.log('Connected to room:', roomId);
-                ws.send(JSON.stringify({ type: 'join', username: myUsername }));
+                socket.send(JSON.stringify({ type: 'join', username: myUsername }));
             };
             
             ws.onmessage = async (event) => {
+                if (socket !== ws) return;
+                receivedFrames++;
                 const data = JSON.parse(event.data);
                 console.log('Received:', data.type);
                 
                 switch (data.type) {
                     case 'room_ready':
                         myClientId = data.my_id;
+                        resumeToken = data.resume_token;
+                        tokenRetried = false;
+                        updateParticipants(data.participants_count);
+                        setMediaMode(data.media);
+                        break;
+                    case 'resumed':
+                        reconnectAttempts = 0;
                         updateParticipants(data.participants_count);
+                        // A server that took our session over has no media connection from us yet
+                        setMediaMode(data.media, !data.sfu_peer);
+                        showToast('Reconnected');
+                        break;
+                    case 'media_mode':
+                        setMediaMode(data.mode);
+                        break;
+                    case 'sfu_offer':
+                        await handleSfuOffer(data.offer, data.tracks);
+                        break;
+                    case 'sfu_answer':
+                        await handleSfuAnswer(data.answer, data.tracks);
+                        break;
+                    case 'resume_failed':
+                        await rejoinRoom();
+                        break;
+                    case 'migrate':
+                        // The server is restarting and moves its rooms one after another
+                        clearTimeout(migrateTimer);
+                        migrateTimer = setTimeout(() => migrateSession(socket, data.port, data.ws_url), data.after_ms);
                         break;
                     case 'new_participant':
                         usernames[data.new_id] = data.new_username;
                         showToast(`${data.new_username} joined the call`);
-                        createRemoteVideoElement(data.new_id);
-                        createPeerConnection(data.new_id);
-                        createOffer(data.new_id);
+                        if (mediaMode === 'mesh') {
+                            createRemoteVideoElement(data.new_id);
+                            createPeerConnection(data.new_id);
+                            createOffer(data.new_id);
+                        }
                         updateParticipants(data.participants_count);
                         break;
                     case 'participant_left':
@@ -1083,7 +1436,7 @@ async def index(request):
                         updateParticipants(data.participants_count);
                         break;
                     case 'offer':
-                        if (data.target_id === myClientId) {
+                        if (data.target_id === myClientId && mediaMode === 'mesh') {
                             await handleOffer(data.sender_id, data.offer);
                         }
                         break;
@@ -1097,6 +1450,16 @@ async def index(request):
                             await handleIceCandidate(data.sender_id, data.candidate);
                         }
                         break;
+                    case 'ice_candidates':
+                        if (data.target_id === myClientId) {
+                            for (const frame of data.frames) {
+                                await handleIceCandidate(data.sender_id, frame.candidate);
+                            }
+                        }
+                        break;
+                    case 'ping':
+                        ws.send(JSON.stringify({ type: 'pong' }));
+                        break;
                     case 'chat':
                         appendChatMessage(data);
                         if (!document.getElementById('chatSidebar').classList.contains('open')) {
@@ -1108,6 +1471,12 @@ async def index(request):
                         setTimeout(hangup, 2000);
                         break;
                     case 'error':
+                        if (data.rejoin && !tokenRetried) {
+                            // Our token was taken for a used one (a rare filter false positive): get a new one, once
+                            tokenRetried = true;
+                            await rejoinRoom();
+                            break;
+                        }
                         showToast('Error: ' + data.message);
                         break;
                 }
@@ -1120,6 +1489,17 @@ async def index(request):
             
             ws.onclose = () => {
                 console.log('WebSocket closed');
+                if (socket !== ws || !currentRoomId || !resumeToken || migrateTimer) return;
+                
+                // Unexpected drop: reclaim our slot before the server's grace window ends
+                if (reconnectAttempts >= 6) {
+                    rejoinRoom();
+                    return;
+                }
+                const delay = Math.min(500 * 2 ** reconnectAttempts, 8000);
+                reconnectAttempts++;
+                showToast('Connection lost, reconnecting...');
+                setTimeout(resumeSession, delay);
             };
         }
         
@@ -1254,6 +1634,105 @@ async def index(request):
             }
         }
         
+        function setMediaMode(mode, restart = false) {
+            if (mode !== 'sfu' || (mediaMode === 'sfu' && !restart)) return;
+            // The room outgrew the mesh: one connection to the server replaces the peer connections
+            mediaMode = 'sfu';
+            peerConnections.forEach(pc => pc.close());
+            peerConnections.clear();
+            startSfu();
+        }
+        
+        function stopSfu() {
+            if (sfuPc) sfuPc.close();
+            sfuPc = null;
+            mediaMode = 'mesh';
+        }
+        
+        function waitForIceGathering(pc) {
+            // The server takes no trickled candidates, so they all go with the description
+            if (pc.iceGatheringState === 'complete') return Promise.resolve();
+            return new Promise(resolve => {
+                pc.addEventListener('icegatheringstatechange', () => {
+                    if (pc.iceGatheringState === 'complete') resolve();
+                });
+                setTimeout(resolve, 3000);
+            });
+        }
+        
+        async function startSfu() {
+            if (sfuPc) sfuPc.close();
+            const pc = new RTCPeerConnection(config);
+            sfuPc = pc;
+            
+            localStream.getTracks().forEach(track => pc.addTrack(track, localStream));
+            
+            pc.onconnectionstatechange = () => {
+                console.log('SFU connection state:', pc.connectionState);
+                if (pc === sfuPc && pc.connectionState === 'failed' && ws) startSfu();
+            };
+            
+            try {
+                await pc.setLocalDescription(await pc.createOffer());
+                await waitForIceGathering(pc);
+                if (pc !== sfuPc || !ws) return;
+                ws.send(JSON.stringify({ type: 'sfu_offer', offer: pc.localDescription }));
+            } catch (err) {
+                console.error('Error starting SFU connection:', err);
+            }
+        }
+        
+        async function handleSfuAnswer(answer, tracks) {
+            if (!sfuPc) return;
+            
+            try {
+                await sfuPc.setRemoteDescription(new RTCSessionDescription(answer));
+                showSfuTracks(tracks);
+            } catch (err) {
+                console.error('Error handling SFU answer:', err);
+            }
+        }
+        
+        async function handleSfuOffer(offer, tracks) {
+            // The server adds the tracks of members who joined after us
+            const pc = sfuPc;
+            if (!pc) return;
+            
+            try {
+                await pc.setRemoteDescription(new RTCSessionDescription(offer));
+                await pc.setLocalDescription(await pc.createAnswer());
+                await waitForIceGathering(pc);
+                if (pc !== sfuPc || !ws) return;
+                showSfuTracks(tracks);
+                ws.send(JSON.stringify({ type: 'sfu_answer', answer: pc.localDescription }));
+            } catch (err) {
+                console.error('Error handling SFU offer:', err);
+            }
+        }
+        
+        function showSfuTracks(tracks) {
+            // Group what the server relays by the participant it comes from
+            const streams = {};
+            sfuPc.getTransceivers().forEach(t => {
+                const owner = tracks[t.mid];
+                if (!owner || !t.receiver.track) return;
+                const [clientId, username] = owner;
+                usernames[clientId] = username;
+                (streams[clientId] = streams[clientId] || new MediaStream()).addTrack(t.receiver.track);
+            });
+            
+            Object.entries(streams).forEach(([clientId, stream]) => {
+                createRemoteVideoElement(clientId);
+                const rv = remoteVideos[clientId];
+                rv.label.textContent = usernames[clientId];
+                const trackIds = stream.getTracks().map(track => track.id).sort().join();
+                if (rv.trackIds === trackIds) return;
+                rv.trackIds = trackIds;
+                rv.video.srcObject = stream;
+                if (!audioContexts.has(clientId)) startSpeakingDetection(stream, clientId);
+            });
+        }
+        
         async function handleIceCandidate(senderId, candidate) {
             const pc = peerConnections.get(senderId);
             if (!pc || !candidate) return;
@@ -1348,6 +1827,7 @@ async def index(request):
             
             peerConnections.forEach(pc => pc.close());
             peerConnections.clear();
+            stopSfu();
             
             audioContexts.forEach(ac => ac.context.close());
             audioContexts.clear();
@@ -1356,14 +1836,26 @@ async def index(request):
             remoteVideos = {};
             
             if (ws) {
-                ws.close();
+                const socket = ws;
                 ws = null;
+                if (socket.readyState === WebSocket.OPEN) {
+                    socket.send(JSON.stringify({ type: 'leave' }));
+                }
+                socket.close();
             }
             
             permissionsGranted = false;
             myClientId = null;
             myUsername = null;
             currentRoomId = null;
+            currentRoomPassword = '';
+            oldestMessageId = null;
+            roomWsUrl = null;
+            resumeToken = null;
+            receivedFrames = 0;
+            reconnectAttempts = 0;
+            clearTimeout(migrateTimer);
+            migrateTimer = null;
             recordingStartTime = null;
             usernames = {};
             
@@ -1371,6 +1863,7 @@ async def index(request):
             document.getElementById('callInterface').classList.remove('active');
             document.getElementById('chatSidebar').classList.remove('open');
             document.getElementById('chatMessages').innerHTML = '';
+            document.getElementById('loadEarlierBtn').classList.add('hidden');
             
             // Reset form
             document.getElementById('nameInput').value = '';
@@ -1464,178 +1957,593 @@ async def index(request):
     """
     return web.Response(text=html, content_type='text/html')
 
+def restarting_response():
+    # While draining, new rooms and joins are sent back to retry on the next server
+    return web.json_response({'success': False, 'error': 'Server is restarting',
+                              'retry_after_ms': drain.turn_away()}, status=503, dumps=codec.dumps)
+
 async def create_room(request):
-    data = await request.json()
+    data = await request.json(loads=codec.loads)
     room_id = data.get('room_id')
     if not room_id:
         room_id = f"room-{uuid.uuid4().hex[:8]}"
     password = data.get('password', '')
     
     if len(password) > 100:
-        return web.json_response({'success': False, 'error': 'Password too long'})
+        return json_response({'success': False, 'error': 'Password too long'})
+    
+    if drain is not None:
+        return restarting_response()
+    
+    if not await db.create_room(room_id, password, config.ROOM_TTL_HOURS):
+        return json_response({'success': False, 'error': 'Room ID already exists'})
+    room_cache.invalidate(room_id)
+    
+    return json_response({'success': True, 'room_id': room_id})
+
+async def check_room_access(room_id, password):
+    """Returns an error message, or None if the room can be entered with this password."""
+    row = await room_cache.get_or_load(room_id, db.get_room)
+    
+    if not row:
+        return 'Room not found. Create it first'
+    
+    db_pass, expires_at, expired = row
     
-    cur = conn.cursor()
-    cur.execute('SELECT 1 FROM rooms WHERE room_id = ?', (room_id,))
-    if cur.fetchone():
-        return web.json_response({'success': False, 'error': 'Room ID already exists'})
+    # Check if room is older than its TTL
+    if expired:
+        return f'This room is no longer supported (older than {config.ROOM_TTL_HOURS} hours)'
     
-    cur.execute('INSERT INTO rooms (room_id, password) VALUES (?, ?)', (room_id, password))
-    conn.commit()
+    if db_pass and db_pass != password:
+        return 'Incorrect password'
     
-    return web.json_response({'success': True, 'room_id': room_id})
+    return None
 
 async def join_room(request):
-    data = await request.json()
+    data = await request.json(loads=codec.loads)
     room_id = data.get('room_id')
     password = data.get('password', '')
     username = data.get('username', '').strip()
     
     if not room_id or not username or len(username) > 50:
-        return web.json_response({'success': False, 'error': 'Invalid room ID or username'})
+        return json_response({'success': False, 'error': 'Invalid room ID or username'})
     
-    cur = conn.cursor()
-    cur.execute('SELECT password, created_at FROM rooms WHERE room_id = ?', (room_id,))
-    row = cur.fetchone()
+    if drain is not None:
+        return restarting_response()
     
-    if not row:
-        return web.json_response({'success': False, 'error': 'Room not found. Create it first'})
+    error = await check_room_access(room_id, password)
+    if error:
+        return json_response({'success': False, 'error': error})
     
-    db_pass, created_at = row
+    token = join_tokens.issue(room_id, username)
     
-    # Check if room is older than 24 hours
-    created_time = datetime.datetime.fromisoformat(created_at)
-    if datetime.datetime.now() - created_time > datetime.timedelta(hours=24):
-        return web.json_response({'success': False, 'error': 'This room is no longer supported (older than 24 hours)'})
+    # Only the latest few messages; older ones are paged in through /history
+    page = await load_history(room_id, limit=config.HISTORY_JOIN_LIMIT)
     
-    if db_pass and db_pass != password:
-        return web.json_response({'success': False, 'error': 'Incorrect password'})
+    return json_response({
+        'success': True,
+        'room_id': room_id,
+        'token': token,
+        'ws_url': room_ws_url(request, room_id),
+        'history': page['messages'],
+        'history_has_more': page['has_more']
+    })
+
+def room_ws_url(request, room_id):
+    # The websocket of the worker owning the room, so everyone in it shares one process
+    if backplane is None or not config.WORKER_PORT_BASE:
+        return None
+    owner = backplane.room_owner(room_id)
+    if owner is None:
+        return None
+    return worker_ws_url(room_id, owner, request)
+
+PROXY_HEADERS = ('Forwarded', 'X-Forwarded-For', 'X-Forwarded-Proto', 'X-Forwarded-Host')
+
+def worker_ws_url(room_id, worker, request=None):
+    port = config.WORKER_PORT_BASE + worker
+    if config.WORKER_WS_URL:
+        return config.WORKER_WS_URL.format(worker=worker, port=port, room_id=room_id)
+    # Behind a proxy the request's scheme and host are not what the client sees
+    if request is None or any(header in request.headers for header in PROXY_HEADERS):
+        return None
+    url = request.url.with_scheme('wss' if request.secure else 'ws')
+    return str(url.with_port(port).with_path(f'/ws/{room_id}'))
+
+async def load_history(room_id, before_id=None, after_id=None, limit=50, include_archive=False):
+    page = await db.get_history(room_id, before_id=before_id, after_id=after_id, limit=limit)
+    
+    # Paging backwards past the hot data: read through to the archive. Only
+    # the admin does: chat is archived once its room has expired, and expired
+    # rooms (or new ones reusing the ID) are not theirs to read
+    if (include_archive and chat_archive is not None and after_id is None and not page['has_more']
+            and len(page['messages']) < limit):
+        older_than = page['messages'][0]['id'] if page['messages'] else before_id
+        loop = asyncio.get_running_loop()
+        archived = await loop.run_in_executor(None, chat_archive.read, room_id, older_than,
+                                              limit - len(page['messages']))
+        page = {'messages': archived['messages'] + page['messages'], 'has_more': archived['has_more']}
+    
+    return page
+
+async def chat_history(request):
+    data = await request.json(loads=codec.loads)
+    room_id = data.get('room_id')
+    password = data.get('password', '')
+    before_id = data.get('before_id')
+    after_id = data.get('after_id')
+    limit = data.get('limit', config.HISTORY_JOIN_LIMIT)
+    
+    if not room_id:
+        return json_response({'success': False, 'error': 'Invalid room ID'})
+    
+    for value in (before_id, after_id, limit):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return json_response({'success': False, 'error': 'Invalid cursor'})
     
-    token = str(uuid.uuid4())
-    room = rooms[room_id]
-    room['pending_tokens'][token] = username
+    error = await check_room_access(room_id, password)
+    if error:
+        return json_response({'success': False, 'error': error})
     
-    cur.execute('SELECT username, message, timestamp FROM messages WHERE room_id = ? ORDER BY id ASC LIMIT 100', (room_id,))
-    history = [{'username': r[0], 'message': r[1], 'timestamp': r[2]} for r in cur.fetchall()]
+    limit = max(1, min(limit, config.HISTORY_PAGE_MAX))
+    page = await load_history(room_id, before_id=before_id, after_id=after_id, limit=limit)
     
-    return web.json_response({'success': True, 'room_id': room_id, 'token': token, 'history': history})
+    return json_response({'success': True, 'messages': page['messages'], 'has_more': page['has_more']})
 
 async def save_recording(request):
-    data = await request.json()
+    data = await request.json(loads=codec.loads)
     room_id = data.get('room_id')
     started_at = data.get('started_at')
     duration_seconds = data.get('duration_seconds')
     participants = data.get('participants')
     
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO recordings (room_id, started_at, ended_at, duration_seconds, participants)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (room_id, started_at, datetime.datetime.now().isoformat(), duration_seconds, participants))
-    conn.commit()
+    await db.save_recording(room_id, started_at, duration_seconds, participants)
     
-    return web.json_response({'success': True})
+    return json_response({'success': True})
 
 async def admin_data(request):
-    cur = conn.cursor()
+    data = await db.admin_data()
     
-    # Get all rooms
-    cur.execute('SELECT room_id, created_at, password FROM rooms ORDER BY created_at DESC LIMIT 50')
-    rooms_data = [{'room_id': r[0], 'created_at': r[1], 'has_password': bool(r[2])} for r in cur.fetchall()]
+    # Optional: full chat of one (possibly expired and archived) room
+    archive_room = request.query.get('archive_room')
+    if archive_room:
+        page = await load_history(archive_room, limit=config.HISTORY_PAGE_MAX, include_archive=True)
+        data['archived_messages'] = page['messages']
     
-    # Get recent messages
-    cur.execute('SELECT room_id, username, message, timestamp FROM messages ORDER BY id DESC LIMIT 100')
-    messages_data = [{'room_id': r[0], 'username': r[1], 'message': r[2], 'timestamp': r[3]} for r in cur.fetchall()]
+    return json_response(data)
+
+def outbound_queue_stats():
+    participants = all_participants()
+    depths = [p.queue_depth for p in participants]
+    return {
+        'participants': len(depths),
+        'binary_participants': sum(1 for p in participants if p.binary),
+        'compressed_participants': sum(1 for p in participants if p.ws is not None and p.ws.compress),
+        'suspended_participants': sum(1 for p in participants if p.suspended),
+        'queued_frames': sum(depths),
+        'max_depth': max(depths, default=0)
+    }
+
+async def backplane_stats():
+    if backplane is None:
+        return None
+    return {**backplane.stats(), 'broker': await backplane.request('stats')}
+
+async def admin_metrics(request):
+    return json_response({
+        'chat_persister': chat_persister.stats(),
+        'room_cache': room_cache.stats(),
+        'room_sweeper': room_sweeper.stats() if room_sweeper is not None else None,
+        'chat_archive': chat_archive.stats() if chat_archive is not None else None,
+        'fanout': fanout.stats(),
+        'ice_coalescer': ice_coalescer.stats(),
+        'heartbeat': reaper.stats() if reaper is not None else None,
+        'outbound_queues': outbound_queue_stats(),
+        'rooms': rooms.stats(),
+        'timers': timers.stats(),
+        'backplane': await backplane_stats(),
+        'join_tokens': replay_filter.stats() if backplane is None else None,
+        'drain': drain.stats() if drain is not None else None,
+        'sfu': sfu_relay.stats() if sfu_relay is not None else None,
+        'json_codec': codec.NAME
+    })
+
+# Binary signalling is offered only when msgpack is installed (see binary_protocol.py)
+WS_PROTOCOLS = (binary_protocol.SUBPROTOCOL,) if config.BINARY_SIGNALING and binary_protocol.available() else ()
+# zlib's raw deflate takes window bits 9 to 15
+WS_COMPRESS = max(9, min(15, config.WS_COMPRESS_WBITS)) if config.WS_COMPRESS else False
+
+class WindowedWebSocketResponse(web.WebSocketResponse):
+    # aiohttp deflates with whatever window the client offers (15 unless it
+    # asks for less); answer with server_max_window_bits to hold it to ours
+    def _handshake(self, request):
+        headers, protocol, compress, notakeover = super()._handshake(request)
+        if compress > WS_COMPRESS:
+            compress = WS_COMPRESS
+            headers[hdrs.SEC_WEBSOCKET_EXTENSIONS] = ws_ext_gen(compress=compress, isserver=True,
+                                                                 server_notakeover=notakeover)
+        return headers, protocol, compress, notakeover
+
+compress_fallback_logged = False
+
+def compress_large_frames_only(ws):
+    # Keep permessage-deflate negotiated but stop aiohttp deflating every
+    # frame; Participant then asks for compression per frame above the
+    # threshold. aiohttp has no public switch for this, hence the private
+    # writer (checked against the versions in requirements.txt).
+    global compress_fallback_logged
+    writer = getattr(ws, '_writer', None)
+    if not hasattr(writer, 'compress'):
+        if not compress_fallback_logged:
+            compress_fallback_logged = True
+            print("⚠️ This aiohttp version cannot compress large frames only; every frame is deflated")
+        return 0
+    writer.compress = 0
+    return ws.compress
+
+def relay(room, sender_id, target_id, frame):
+    target = room['participants'].get(target_id)
+    if target is None:
+        return
+    if frame.type == 'ice_candidate':
+        ice_coalescer.add(sender_id, target, frame)
+        return
+    # Candidates already queued for this pair must not overtake a new offer/answer
+    ice_coalescer.flush(sender_id, target_id)
+    fanout.send(target, frame)
+
+async def chat(room_id, room, client_id, username, message):
+    message = message.strip()[:500]
+    if not message:
+        return
     
-    # Get recordings
-    cur.execute('SELECT room_id, started_at, ended_at, duration_seconds, participants FROM recordings ORDER BY id DESC LIMIT 50')
-    recordings_data = [{'room_id': r[0], 'started_at': r[1], 'ended_at': r[2], 'duration_seconds': r[3], 'participants': r[4]} for r in cur.fetchall()]
+    timestamp = datetime.datetime.now().isoformat()
+    await chat_persister.put(room_id, client_id, username, message)
     
-    return web.json_response({
-        'rooms': rooms_data,
-        'messages': messages_data,
-        'recordings': recordings_data
+    broadcast_data = {'type': 'chat', 'username': username, 'message': message, 'timestamp': timestamp}
+    fanout.broadcast(room['participants'], broadcast_data)
+
+# Closes that mean the user is gone for good; anything else may be a blip
+CLEAN_CLOSE_CODES = (1000, 1001)
+
+def leave_room(room_id, room, participant):
+    participant.close()
+    if room['participants'].get(participant.id) is not participant:
+        return
+    room['participants'].remove(participant.id)
+    room['resume_tokens'].pop(participant.resume_token, None)
+    if sfu_relay is not None:
+        sfu_relay.leave(room_id, participant.id)
+    if backplane is not None:
+        backplane.notify('leave', room=room_id, client_id=participant.id)
+    print(f"⬅️ {participant.username} left room {room_id}. Remaining: {len(room['participants'])}")
+    
+    fanout.forget(participant.id)
+    ice_coalescer.forget(participant.id)
+    timers.schedule(config.HANDLE_RETAIN_SECONDS, room['participants'].release_handle, participant.id)
+    fanout.broadcast(room['participants'], {
+        'type': 'participant_left',
+        'left_id': participant.id,
+        'participants_count': len(room['participants'])
     })
+    
+    close_room_if_empty(room_id, room)
 
-async def websocket_handler(request):
-    room_id = request.match_info['room_id']
-    token = request.query.get('token')
-    ws = web.WebSocketResponse()
-    await ws.prepare(request)
+def close_room_if_empty(room_id, room):
+    # Members connected to other workers do not keep the room open here
+    if any(not p.remote for p in room['participants']) or rooms.get(room_id) is not room:
+        return
+    rooms.close(room_id)
+    print(f"🗑️ Room {room_id} deleted")
+
+def update_media_mode(room_id, room, exclude=None):
+    # A room that outgrows the mesh moves to the SFU, and stays there until it empties
+    if room['media'] != 'mesh' or sfu_relay is None or len(room['participants']) <= MAX_PARTICIPANTS:
+        return
+    room['media'] = 'sfu'
+    print(f"📡 Room {room_id} switched to the SFU with {len(room['participants'])} participants")
+    fanout.broadcast([p for p in room['participants'] if not p.remote and p.id != exclude],
+                     {'type': 'media_mode', 'mode': 'sfu'})
+
+def suspend_participant(room_id, room, participant):
+    # Hold the slot, identity and outgoing frames while the client reconnects
+    participant.suspend()
+    participant.grace_timer = timers.schedule(config.RESUME_GRACE_SECONDS, leave_room, room_id, room, participant)
+    participant.on_evicted = lambda: leave_room(room_id, room, participant)
+    print(f"⏸️ {participant.username} dropped from room {room_id}; holding slot for {config.RESUME_GRACE_SECONDS}s")
+
+def resume_session(room_id, resume_token, last_seq, ws, request, compress_wbits):
+    room = rooms.get(room_id)
+    client_id = room['resume_tokens'].get(resume_token) if room else None
+    participant = room['participants'].get(client_id) if client_id else None
+    if participant is None or participant.closed:
+        return room, None
     
-    room = rooms[room_id]
+    binary = ws.ws_protocol == binary_protocol.SUBPROTOCOL
+    if last_seq < 0 or not participant.resume(ws, request.transport, last_seq, binary=binary, compress_wbits=compress_wbits):
+        # Missed too much to replay: free the slot, the client joins afresh
+        leave_room(room_id, room, participant)
+        return room, None
     
-    if not token or token not in room.get('pending_tokens', {}):
-        await ws.send_json({'type': 'error', 'message': 'Invalid token'})
-        await ws.close()
-        return ws
+    return room, participant
+
+async def adopt_session(room_id, resume_token, last_seq, ws, request, compress_wbits):
+    # The session is held by another worker: take it over with the frames the client missed
+    reply = await backplane.request('resume', room=room_id, resume_token=resume_token, last_seq=last_seq)
+    if reply.get('error'):
+        return None, None
     
-    username = room['pending_tokens'].pop(token)
+    room = rooms.open(room_id)
+    add_remote_members(room_id, room, reply['members'])
+    client_id = reply['client_id']
+    participant = new_participant(client_id, reply['username'], ws, request, room, compress_wbits, resume_token)
+    participant.seq = last_seq
+    for frame_type, text in reply['frames']:
+        participant.send(Frame.raw(frame_type, text))
+    participant.start()
+    room['participants'].add(participant, reply['handle'])
+    room['resume_tokens'][resume_token] = client_id
+    update_media_mode(room_id, room, exclude=client_id)
+    return room, participant
+
+def hand_off_session(room_id, room, client_id, last_seq):
+    # Another worker accepted this participant's reconnect; give it what the client is missing
+    participant = room['participants'].get(client_id) if room else None
+    if participant is None or participant.remote or participant.closed:
+        return {'error': 'unknown_session'}
     
-    if len(room['participants']) >= MAX_PARTICIPANTS:
-        await ws.send_json({'type': 'room_full'})
-        await ws.close()
-        return ws
+    ice_coalescer.flush_target(client_id)
+    if sfu_relay is not None:
+        sfu_relay.leave(room_id, client_id)
+    frames = participant.handoff(last_seq)
+    if frames is None:
+        leave_room(room_id, room, participant)
+        return {'error': 'replay_gone'}
     
-    client_id = str(uuid.uuid4())
-    participant = {'id': client_id, 'ws': ws, 'username': username}
-    room['participants'].append(participant)
+    room['resume_tokens'].pop(participant.resume_token, None)
+    room['participants'].add(RemoteParticipant(backplane, room_id, client_id, participant.username))
+    print(f"↪️ {participant.username} moved to another worker with {len(frames)} frames pending")
+    close_room_if_empty(room_id, room)
+    return {'frames': [[frame.type, frame.text] for frame in frames]}
+
+def add_remote_members(room_id, room, members):
+    for client_id, username, handle in members:
+        if client_id not in room['participants']:
+            room['participants'].add(RemoteParticipant(backplane, room_id, client_id, username), handle)
+
+def remote_member_left(room_id, room, client_id, lost):
+    member = room['participants'].get(client_id)
+    if member is None or not member.remote:
+        return
+    room['participants'].remove(client_id)
+    fanout.forget(client_id)
+    ice_coalescer.forget(client_id)
+    timers.schedule(config.HANDLE_RETAIN_SECONDS, room['participants'].release_handle, client_id)
     
-    print(f"✅ {username} ({client_id[:8]}) joined room {room_id}. Total: {len(room['participants'])}")
+    if lost:
+        # Its worker died before it could tell the room
+        print(f"💀 {member.username} lost with their worker from room {room_id}")
+        fanout.broadcast([p for p in room['participants'] if not p.remote], {
+            'type': 'participant_left',
+            'left_id': client_id,
+            'participants_count': len(room['participants'])
+        })
+
+def on_backplane_message(header, body):
+    op = header['op']
+    room = rooms.get(header['room'])
+    if op == 'handoff':
+        return hand_off_session(header['room'], room, header['client_id'], header['last_seq'])
+    if room is None:
+        return None
     
-    await ws.send_json({
-        'type': 'room_ready',
-        'my_id': client_id,
-        'participants_count': len(room['participants'])
-    })
+    if op == 'deliver':
+        target = room['participants'].get(header['to'])
+        if target is not None:
+            fanout.send(target, Frame.raw(header['type'], body.decode()))
+    elif op == 'joined':
+        member = RemoteParticipant(backplane, header['room'], header['client_id'], header['username'])
+        room['participants'].add(member, header['handle'])
+        update_media_mode(header['room'], room)
+    elif op == 'left':
+        remote_member_left(header['room'], room, header['client_id'], header['lost'])
+    return None
+
+async def claim_slot(room_id, token, client_id, resume_token):
+    """Take a place in a room with a join token; returns (room, username, handle, error frame)."""
+    username, signature = join_tokens.verify(token, room_id)
+    if username is None:
+        return None, None, None, {'type': 'error', 'message': 'Invalid token'}
+    # Used before, or a Bloom false positive; the client may ask for a new token
+    used = {'type': 'error', 'message': 'Token already used', 'rejoin': True}
+    
+    if backplane is not None:
+        # Used tokens and room sizes are shared by all workers
+        reply = await backplane.request('claim', room=room_id, signature=signature.hex(), username=username,
+                                        client_id=client_id, resume_token=resume_token, limit=room_limit())
+        if reply.get('error') == 'room_full':
+            return None, None, None, {'type': 'room_full'}
+        if reply.get('error'):
+            return None, None, None, used
+        room = rooms.open(room_id)
+        add_remote_members(room_id, room, reply['members'])
+        return room, reply['username'], reply['handle'], None
+    
+    if not replay_filter.add(signature):
+        return None, None, None, used
+    
+    room = rooms.get(room_id)
+    if room is not None and len(room['participants']) >= room_limit():
+        return room, None, None, {'type': 'room_full'}
+    room = rooms.open(room_id)
+    
+    return room, username, None, None
+
+def new_participant(client_id, username, ws, request, room, compress_wbits, resume_token=None):
+    return Participant(
+        client_id, username, ws,
+        transport=request.transport,
+        stats=fanout,
+        high_water=config.OUTBOUND_HIGH_WATER,
+        hard_limit=config.OUTBOUND_HARD_LIMIT,
+        max_lag=config.OUTBOUND_MAX_LAG_SECONDS,
+        send_timeout=config.SEND_TIMEOUT_SECONDS,
+        binary=ws.ws_protocol == binary_protocol.SUBPROTOCOL,
+        handles=room['participants'],
+        compress_wbits=compress_wbits,
+        compress_min_bytes=config.WS_COMPRESS_MIN_BYTES,
+        replay_size=config.RESUME_REPLAY_FRAMES,
+        resume_token=resume_token
+    )
+
+async def sfu_signal(room_id, room, participant, data_type, data):
+    if sfu_relay is None or room['media'] != 'sfu':
+        return
+    if data_type == 'sfu_offer' and isinstance(data.get('offer'), dict):
+        await sfu_relay.offer(room_id, participant.id, participant.username, participant.send, data['offer'])
+    elif data_type == 'sfu_answer' and isinstance(data.get('answer'), dict):
+        sfu_relay.answer(room_id, participant.id, data['answer'])
+
+async def send_now(ws, payload):
+    # For frames sent before the client has an outbound queue
+    if ws.ws_protocol == binary_protocol.SUBPROTOCOL:
+        await ws.send_bytes(binary_protocol.pack(payload))
+    else:
+        await ws.send_json(payload, dumps=codec.dumps)
+
+async def websocket_handler(request):
+    room_id = request.match_info['room_id']
+    token = request.query.get('token')
+    # autoping is off so that pongs reach the loop below and count as signs of life
+    ws = WindowedWebSocketResponse(protocols=WS_PROTOCOLS, compress=WS_COMPRESS, autoping=False)
+    await ws.prepare(request)
+    compress_wbits = 0
+    if ws.compress and config.WS_COMPRESS_MIN_BYTES:
+        compress_wbits = compress_large_frames_only(ws)
     
-    for p in room['participants']:
-        if p['id'] != client_id:
-            try:
-                await p['ws'].send_json({
-                    'type': 'new_participant',
-                    'new_id': client_id,
-                    'participants_count': len(room['participants']),
-                    'new_username': username
-                })
-            except Exception as e:
-                print(f"❌ Error notifying participant: {e}")
+    resume_token = request.query.get('resume')
+    if resume_token:
+        try:
+            last_seq = int(request.query.get('last_seq'))
+        except (TypeError, ValueError):
+            last_seq = -1
+        room, participant = resume_session(room_id, resume_token, last_seq, ws, request, compress_wbits)
+        if participant is None and drain is not None:
+            # Held by another worker: stay there rather than come back here
+            await send_now(ws, migrate_frame(room_id, 0))
+            await ws.close()
+            return ws
+        if participant is None and backplane is not None and last_seq >= 0:
+            room, participant = await adopt_session(room_id, resume_token, last_seq, ws, request, compress_wbits)
+        if participant is None:
+            await send_now(ws, {'type': 'resume_failed'})
+            await ws.close()
+            return ws
+        client_id, username = participant.id, participant.username
+        
+        print(f"🔁 {username} resumed in room {room_id} after frame {last_seq}")
+        participant.send({
+            'type': 'resumed',
+            'my_id': client_id,
+            'participants_count': len(room['participants']),
+            'media': room['media'],
+            # A session taken over from another worker has to publish to this one's SFU
+            'sfu_peer': sfu_relay is not None and sfu_relay.has_peer(room_id, client_id)
+        })
+        if drain is not None:
+            participant.send(migrate_frame(room_id, 0))
+    else:
+        if drain is not None:
+            await send_now(ws, migrate_frame(room_id, 0))
+            await ws.close()
+            return ws
+        client_id = str(uuid.uuid4())
+        resume_token = secrets.token_urlsafe(16)
+        room, username, handle, error = await claim_slot(room_id, token, client_id, resume_token)
+        if error:
+            await send_now(ws, error)
+            await ws.close()
+            return ws
+        
+        participant = new_participant(client_id, username, ws, request, room, compress_wbits, resume_token)
+        participant.start()
+        room['participants'].add(participant, handle)
+        room['resume_tokens'][resume_token] = client_id
+        
+        print(f"✅ {username} ({client_id[:8]}) joined room {room_id}. Total: {len(room['participants'])}")
+        
+        # Before new_participant, so that nobody starts a mesh offer to the newcomer
+        update_media_mode(room_id, room, exclude=client_id)
+        participant.send({
+            'type': 'room_ready',
+            'my_id': client_id,
+            'participants_count': len(room['participants']),
+            'resume_token': participant.resume_token,
+            'media': room['media']
+        })
+        
+        fanout.broadcast(room['participants'].others(client_id), {
+            'type': 'new_participant',
+            'new_id': client_id,
+            'participants_count': len(room['participants']),
+            'new_username': username
+        })
     
+    left = False
     try:
         async for msg in ws:
-            if msg.type == web.WSMsgType.TEXT:
-                data = json.loads(msg.data)
+            participant.last_seen = time.monotonic()
+            
+            if msg.type == web.WSMsgType.PING:
+                await ws.pong(msg.data)
+            
+            elif msg.type == web.WSMsgType.TEXT:
+                # Signalling fast path: route on the leading fields, forward the text untouched
+                route = RELAY_ROUTE.match(msg.data)
+                if route:
+                    relay(room, client_id, route.group(3), Frame.raw(route.group(1), msg.data))
+                    continue
+                
+                data = codec.loads(msg.data)
                 data_type = data.get('type')
                 
                 if data_type == 'chat':
-                    message = data.get('message', '').strip()[:500]
-                    if not message:
+                    await chat(room_id, room, client_id, username, data.get('message', ''))
+                
+                elif data_type in RELAY_TYPES:
+                    target_id = data.get('target_id')
+                    if not target_id:
                         continue
                     
-                    timestamp = datetime.datetime.now().isoformat()
-                    cur = conn.cursor()
-                    cur.execute('INSERT INTO messages (room_id, client_id, username, message) VALUES (?, ?, ?, ?)',
-                                (room_id, client_id, username, message))
-                    conn.commit()
-                    
-                    broadcast_data = {'type': 'chat', 'username': username, 'message': message, 'timestamp': timestamp}
-                    for p in room['participants']:
-                        try:
-                            await p['ws'].send_json(broadcast_data)
-                        except Exception as e:
-                            print(f"❌ Error broadcasting: {e}")
+                    relay(room, client_id, target_id, Frame.raw(data_type, msg.data))
                 
-                elif data_type in ['offer', 'answer', 'ice_candidate']:
-                    target_id = data.get('target_id')
+                elif data_type in ('sfu_offer', 'sfu_answer'):
+                    await sfu_signal(room_id, room, participant, data_type, data)
+                
+                elif data_type == 'leave':
+                    left = True
+                    break
+            
+            elif msg.type == web.WSMsgType.BINARY and participant.binary:
+                # Routing needs only the header; the frame is forwarded as received
+                data_type, _, target, body = binary_protocol.unpack_header(msg.data)
+                
+                if data_type == 'chat':
+                    await chat(room_id, room, client_id, username, str(body.get('message', '')))
+                
+                elif data_type in RELAY_TYPES:
+                    target_id = room['participants'].id_of(target)
                     if not target_id:
                         continue
                     
-                    for p in room['participants']:
-                        if p['id'] == target_id:
-                            try:
-                                await p['ws'].send_json(data)
-                            except Exception as e:
-                                print(f"❌ Error sending to target: {e}")
-                            break
+                    relay(room, client_id, target_id, Frame.raw_binary(data_type, msg.data, room['participants']))
+                
+                elif data_type in ('sfu_offer', 'sfu_answer'):
+                    await sfu_signal(room_id, room, participant, data_type, body)
+                
+                elif data_type == 'leave':
+                    left = True
+                    break
             
             elif msg.type == web.WSMsgType.ERROR:
                 print(f'❌ WebSocket error: {ws.exception()}')
@@ -1644,22 +2552,12 @@ async def websocket_handler(request):
         print(f"❌ WS loop error: {e}")
     
     finally:
-        room['participants'] = [p for p in room['participants'] if p['id'] != client_id]
-        print(f"⬅️ {username} left room {room_id}. Remaining: {len(room['participants'])}")
-        
-        for p in room['participants']:
-            try:
-                await p['ws'].send_json({
-                    'type': 'participant_left',
-                    'left_id': client_id,
-                    'participants_count': len(room['participants'])
-                })
-            except Exception as e:
-                print(f"❌ Error notifying left: {e}")
-        
-        if len(room['participants']) == 0:
-            del rooms[room_id]
-            print(f"🗑️ Room {room_id} deleted")
+        # A resumed connection may already have taken this participant over
+        if participant.ws is ws:
+            if left or ws.close_code in CLEAN_CLOSE_CODES or participant.closed or not config.RESUME_GRACE_SECONDS:
+                leave_room(room_id, room, participant)
+            else:
+                suspend_participant(room_id, room, participant)
         
         await ws.close()
     
@@ -1669,17 +2567,47 @@ app = web.Application()
 app.router.add_get('/', index)
 app.router.add_post('/create_room', create_room)
 app.router.add_post('/join_room', join_room)
+app.router.add_post('/history', chat_history)
 app.router.add_post('/save_recording', save_recording)
 app.router.add_get('/admin/data', admin_data)
+app.router.add_get('/admin/metrics', admin_metrics)
 app.router.add_get('/ws/{room_id}', websocket_handler)
+app.on_startup.append(handle_drain_signal)
+app.on_startup.append(start_timers)
+app.on_startup.append(start_sfu)
+app.on_startup.append(start_backplane)
+app.on_startup.append(start_chat_persister)
+app.on_startup.append(start_room_sweeper)
+app.on_startup.append(start_reaper)
+app.on_cleanup.append(stop_reaper)
+app.on_cleanup.append(stop_room_sweeper)
+app.on_cleanup.append(stop_chat_persister)
+app.on_cleanup.append(stop_sfu)
+app.on_cleanup.append(stop_backplane)
+app.on_cleanup.append(stop_timers)
+app.on_cleanup.append(close_db)
 
 if __name__ == '__main__':
-    init_db()
-    print('🚀 Video Call Server Starting...')
-    print('📍 URL: http://127.0.0.1:9080')
-    print('🔧 Admin: a.... / u.....')
-    print('✨ Features: Max 3 users, 24hr room expiry, chat history, recordings')
-    web.run_app(app, host='0.0.0.0', port=9080)
+    if config.WORKERS > 1 and not config.WORKER_ID:
+        # Supervisor: start the workers, each of which runs this file again
+        supervisor.run(os.path.abspath(__file__), config.WORKERS)
+    else:
+        init_db()
+        if config.WORKER_ID:
+            print(f'👷 Worker {config.WORKER_ID} (pid {os.getpid()}) starting...')
+        else:
+            print('🚀 Video Call Server Starting...')
+            print('📍 URL: http://127.0.0.1:9080')
+            print('🔧 Admin: a.... / u.....')
+            print('✨ Features: Max 3 users, 24hr room expiry, chat history, recordings')
+        own_port = None
+        if config.WORKER_ID and config.WORKER_PORT_BASE:
+            # This worker's own port, handed out by join_room for the rooms it owns
+            own_port = socket.socket()
+            own_port.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            own_port.bind(('0.0.0.0', config.WORKER_PORT_BASE + config.WORKER_ID))
+        web.run_app(app, host='0.0.0.0', port=9080, reuse_port=bool(config.WORKER_ID or config.REUSE_PORT),
+                    sock=own_port, print=None if config.WORKER_ID else print)
 
 
 
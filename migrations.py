@@ -0,0 +1,121 @@
+# migrations.py - Versioned schema migrations
+#
+# Each migration runs once, in its own transaction, and records its version
+# in `schema_version`. `migrate()` is called at startup, so an existing
+# video_calls.db is upgraded in place. Append new migrations to MIGRATIONS;
+# never edit one that has already shipped.
+import sqlite3
+
+
+def _create_base_tables(cur):
+    # Rooms table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS rooms (
+            room_id TEXT PRIMARY KEY,
+            password TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Messages/Chat table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id TEXT,
+            client_id TEXT,
+            username TEXT,
+            message TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (room_id) REFERENCES rooms (room_id)
+        )
+    ''')
+
+    # Call recordings metadata table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS recordings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id TEXT,
+            started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            ended_at DATETIME,
+            duration_seconds INTEGER,
+            participants TEXT,
+            FOREIGN KEY (room_id) REFERENCES rooms (room_id)
+        )
+    ''')
+
+
+def _add_hot_query_indexes(cur):
+    # Chat history: WHERE room_id = ? ORDER BY id
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_messages_room_id ON messages (room_id, id)')
+    # Admin room listing: ORDER BY created_at DESC
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_rooms_created_at ON rooms (created_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recordings_room_id ON recordings (room_id, id)')
+
+
+def _add_room_expiry(cur):
+    cur.execute('PRAGMA table_info(rooms)')
+    if 'expires_at' not in [r[1] for r in cur.fetchall()]:
+        cur.execute('ALTER TABLE rooms ADD COLUMN expires_at DATETIME')
+    # Rooms always lived for 24 hours; backfill existing rows accordingly
+    cur.execute("UPDATE rooms SET expires_at = datetime(created_at, '+24 hours') WHERE expires_at IS NULL")
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_rooms_expires_at ON rooms (expires_at)')
+
+
+# (version, description, function)
+MIGRATIONS = [
+    (1, 'create rooms, messages and recordings tables', _create_base_tables),
+    (2, 'index messages(room_id, id), rooms(created_at), recordings(room_id, id)', _add_hot_query_indexes),
+    (3, 'add rooms.expires_at', _add_room_expiry),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def enable_incremental_vacuum(conn):
+    """Switch the file to auto_vacuum=INCREMENTAL so the sweeper can return freed pages.
+
+    The mode can only change on an empty database or through a full VACUUM,
+    so an existing file is rebuilt once here; afterwards this is a no-op.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    has_tables = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' LIMIT 1").fetchone()
+    if has_tables:
+        print("🛠️ Rebuilding database for incremental vacuum (one-time)")
+        conn.execute('VACUUM')
+
+
+def migrate(path):
+    """Bring the database at `path` up to the latest schema version."""
+    conn = sqlite3.connect(path, isolation_level=None)  # explicit transactions below
+    try:
+        enable_incremental_vacuum(conn)
+        version = current_version(conn)
+        for target, description, fn in MIGRATIONS:
+            if target <= version:
+                continue
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                fn(cur)
+                cur.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)', (target, description))
+                cur.execute('COMMIT')
+            except Exception:
+                cur.execute('ROLLBACK')
+                raise
+            version = target
+            print(f"🛠️ Applied migration {target}: {description}")
+        return version
+    finally:
+        conn.close()
@@ -0,0 +1,355 @@
+# participants.py - Connected participants and their outbound queues
+#
+# Nobody writes to a participant's websocket directly. Frames go into the
+# participant's own bounded outbound queue, and a dedicated writer task drains
+# that queue to the socket. A client whose TCP window is full then only
+# backs up its own queue, not the sender or the rest of the room. Frames are
+# serialized at most once however many queues they sit in (frames.py).
+#
+# When a queue passes its high-water mark, queued ICE candidate frames
+# (single or batched) are dropped first. Those are the cheapest to lose:
+# trickle ICE keeps producing candidates, and the connection already has
+# others. A consumer that stays above the mark for `max_lag` seconds, or whose
+# queue hits `hard_limit`, is disconnected so it cannot hold server memory.
+#
+# A participant outlives a dropped websocket. suspend() detaches the socket
+# and keeps queueing; resume() attaches the client's new socket. The client
+# counts the frames it has received, and every frame written is kept with
+# its sequence number in a bounded replay ring. Frames the client never got
+# are resent from the ring before anything newer.
+import asyncio
+import collections
+import secrets
+import time
+
+from frames import as_frame
+
+SHEDDABLE_TYPES = ('ice_candidate', 'ice_candidates')
+
+
+class Participant:
+    remote = False  # see backplane.RemoteParticipant
+
+    def __init__(self, client_id, username, ws, transport=None, stats=None,
+                 high_water=256, hard_limit=1024, max_lag=10.0, send_timeout=5.0,
+                 binary=False, handles=None, compress_wbits=0, compress_min_bytes=0, replay_size=256,
+                 resume_token=None):
+        self.id = client_id
+        self.username = username
+        self.ws = ws
+        self.binary = binary  # speaks binary_protocol instead of JSON
+        self.handles = handles  # the room's ParticipantRegistry, for binary handles
+        self.handle = 0
+        # Per-frame deflate for frames of at least compress_min_bytes; 0 leaves it to the ws
+        self.compress_wbits = compress_wbits
+        self.compress_min_bytes = compress_min_bytes
+        self.transport = transport
+        self.stats = stats  # sink with record()/record_drop()/record_eviction(), e.g. Fanout
+        self.high_water = high_water
+        self.hard_limit = hard_limit
+        self.max_lag = max_lag
+        self.send_timeout = send_timeout
+
+        self._queue = collections.deque()  # (enqueued_at, Frame)
+        self._inflight = None  # (enqueued_at, Frame) the writer is sending right now
+        self._wakeup = asyncio.Event()
+        self._writer = None
+        self.closed = False
+        self.behind_since = None
+        self.max_depth = 0
+        self.last_seen = time.monotonic()  # last frame received from the client (see reaper.py)
+
+        # Resumption
+        self.resume_token = resume_token or secrets.token_urlsafe(16)
+        self.suspended = False
+        self.grace_timer = None
+        self.on_evicted = None  # called once an eviction closes it while suspended
+        self.seq = 0  # frames written to the client so far
+        self._replay = collections.deque(maxlen=replay_size)  # (seq, Frame)
+
+    def __repr__(self):
+        return f'<Participant {self.id[:8]} {self.username!r}>'
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def replay_depth(self):
+        return len(self._replay)
+
+    @property
+    def buffered_bytes(self):
+        # Text length stands in for bytes; close enough for a memory gauge
+        return sum(frame.size for _, frame in self._queue) + sum(frame.size for _, frame in self._replay)
+
+    def start(self):
+        self._writer = asyncio.create_task(self._drain())
+
+    def send(self, frame):
+        """Queue a Frame (or payload dict) for this participant; never blocks. Returns False once closed."""
+        if self.closed:
+            return False
+        self._queue.append((time.perf_counter(), as_frame(frame)))
+        depth = len(self._queue)
+        self.max_depth = max(self.max_depth, depth)
+        if depth > self.high_water:
+            self._shed()
+        self._wakeup.set()
+        return not self.closed
+
+    def _shed(self):
+        before = len(self._queue)
+        self._queue = collections.deque(item for item in self._queue if item[1].type not in SHEDDABLE_TYPES)
+        dropped = before - len(self._queue)
+        if dropped and self.stats:
+            self.stats.record_drop(self.id, dropped)
+
+        now = time.monotonic()
+        if len(self._queue) <= self.high_water:
+            return
+        if self.behind_since is None:
+            self.behind_since = now
+        if len(self._queue) >= self.hard_limit or now - self.behind_since > self.max_lag:
+            self.evict(f'slow consumer ({len(self._queue)} frames queued)')
+
+    def evict(self, reason):
+        if self.closed:
+            return
+        print(f"🐢 Disconnecting {self.username} ({self.id[:8]}): {reason}")
+        if self.stats:
+            self.stats.record_eviction(self.id)
+        suspended = self.suspended
+        self.close()
+        if self.ws is not None:
+            asyncio.create_task(self._close_socket())
+        elif suspended and self.on_evicted is not None:
+            # No websocket handler is left to notice; leave once the current send is done
+            asyncio.get_running_loop().call_soon(self.on_evicted)
+
+    async def _close_socket(self):
+        # The close frame may itself be stuck behind a full TCP window
+        try:
+            await asyncio.wait_for(self.ws.close(code=4008, message=b'Too slow'), self.send_timeout)
+        except Exception:
+            if self.transport is not None:
+                self.transport.abort()
+
+    def ping(self, mode='protocol'):
+        if mode == 'app':
+            self.send({'type': 'ping'})
+        else:
+            asyncio.create_task(self._ping())
+
+    async def _ping(self):
+        try:
+            await asyncio.wait_for(self.ws.ping(), self.send_timeout)
+        except Exception:
+            pass  # a dead peer is the reaper's business
+
+    def abort(self, reason):
+        """Drop a connection that went silent; no close handshake, nobody is listening."""
+        if self.closed:
+            return
+        print(f"👻 Dropping {self.username} ({self.id[:8]}): {reason}")
+        self.close()
+        if self.transport is not None:
+            self.transport.abort()
+        else:
+            asyncio.create_task(self.ws.close(code=4001, message=b'Heartbeat timeout'))
+
+    def suspend(self):
+        """Detach a dropped socket but keep the slot; frames queue until resume()."""
+        self.suspended = True
+        self.ws = None
+        self.transport = None
+        self.behind_since = None
+        self._stop_writer()
+
+    def resume(self, ws, transport, last_seq, binary=False, compress_wbits=0):
+        """Attach a reconnected socket whose client has received `last_seq` frames.
+
+        Returns False if frames it missed have already left the replay ring.
+        """
+        if not self._rewind(last_seq):
+            return False
+
+        self.ws = ws
+        self.transport = transport
+        self.binary = binary
+        self.compress_wbits = compress_wbits
+        self.suspended = False
+        self.last_seen = time.monotonic()
+        if self.grace_timer is not None:
+            self.grace_timer.cancel()
+            self.grace_timer = None
+        self.start()
+        self._wakeup.set()
+        return True
+
+    def handoff(self, last_seq):
+        """Give the session up to another worker (see backplane.py).
+
+        Returns the frames the client has not received, oldest first, or None
+        if some of them have already left the replay ring.
+        """
+        if not self._rewind(last_seq):
+            return None
+        frames = [frame for _, frame in self._queue]
+        self.close()
+        return frames
+
+    def _rewind(self, last_seq):
+        # Requeue what a client that has received `last_seq` frames is missing
+        oldest = self._replay[0][0] if self._replay else self.seq + 1
+        unsent = len(self._queue) + (self._inflight is not None)
+        if last_seq < oldest - 1 or last_seq > self.seq + unsent:
+            return False
+
+        if self.ws is not None:
+            # The old connection was half-open; the client has already moved on
+            transport_to_drop = self.transport
+            self.suspend()
+            if transport_to_drop is not None:
+                transport_to_drop.abort()
+
+        # Frames the client got that we never counted (cancelled mid-write)
+        while self.seq < last_seq:
+            self.seq += 1
+            self._replay.append((self.seq, self._queue.popleft()[1]))
+        # Frames written that never arrived go out again, ahead of the rest
+        now = time.perf_counter()
+        while self._replay and self._replay[-1][0] > last_seq:
+            self._queue.appendleft((now, self._replay.pop()[1]))
+        self.seq = last_seq
+        return True
+
+    def _stop_writer(self):
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            # The cancellation lands later; the frame it interrupts goes back
+            # to the head of the queue now, so _rewind() counts it in order
+            self._requeue_inflight()
+        self._writer = None
+
+    def _requeue_inflight(self):
+        if self._inflight is not None:
+            self._queue.appendleft(self._inflight)
+            self._inflight = None
+
+    def close(self):
+        """Stop the writer and drop anything still queued."""
+        self.closed = True
+        if self.grace_timer is not None:
+            self.grace_timer.cancel()
+            self.grace_timer = None
+        self._stop_writer()
+        self._queue.clear()
+        self._wakeup.set()
+
+    async def _drain(self):
+        while not self.closed:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._inflight = self._queue.popleft()
+            enqueued_at, frame = self._inflight
+            outcome = 'ok'
+            try:
+                if self.binary:
+                    data, send = frame.binary(self.handles), self.ws.send_bytes
+                else:
+                    data, send = frame.text, self.ws.send_str
+                compress = self.compress_wbits if self.compress_wbits and len(data) >= self.compress_min_bytes else None
+                await asyncio.wait_for(send(data, compress=compress), self.send_timeout)
+            except asyncio.CancelledError:
+                # Suspended or closed mid-write; resume() sorts out whether it arrived.
+                # _stop_writer() has requeued the frame already, and a new
+                # writer may be sending it by now
+                if self._writer is asyncio.current_task():
+                    self._requeue_inflight()
+                raise
+            except asyncio.TimeoutError:
+                outcome = 'timeout'
+            except ConnectionError:
+                # The socket is gone; keep the frame for a resumed connection
+                self._requeue_inflight()
+                return
+            except Exception as e:
+                outcome = 'failure'
+                print(f"❌ Error sending to {self.username} ({self.id[:8]}): {e}")
+            self._inflight = None
+            if self.stats:
+                self.stats.record(self.id, (time.perf_counter() - enqueued_at) * 1000, outcome)
+
+            if outcome == 'timeout':
+                self.evict(f'send blocked for {self.send_timeout}s')
+            elif outcome == 'ok':
+                self.seq += 1
+                self._replay.append((self.seq, frame))
+            if self.behind_since is not None and len(self._queue) <= self.high_water // 2:
+                self.behind_since = None
+
+
+class ParticipantRegistry:
+    """Participants of one room, keyed by client id, in join order.
+
+    Signalling is routed to a single target many times per second during ICE
+    trickle; get() makes that a dict lookup instead of a scan of the room.
+
+    Also hands out the small integer handles binary_protocol uses in place of
+    client ids. A handle is never reused while the room exists, so frames
+    still queued about someone who left keep their meaning; it is released
+    a while after they leave (release_handle).
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._handles = {}  # client_id -> handle
+        self._ids = {}  # handle -> client_id
+        self._next_handle = 1
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __contains__(self, client_id):
+        return client_id in self._by_id
+
+    @property
+    def handle_count(self):
+        return len(self._handles)
+
+    def get(self, client_id):
+        return self._by_id.get(client_id)
+
+    def add(self, participant, handle=None):
+        """Add a participant; `handle` is given when another process assigns them (backplane.py)."""
+        self._by_id[participant.id] = participant
+        if participant.id not in self._handles:
+            handle = handle or self._next_handle
+            self._handles[participant.id] = handle
+            self._ids[handle] = participant.id
+            self._next_handle = max(self._next_handle, handle + 1)
+        participant.handle = self._handles[participant.id]
+
+    def handle_of(self, client_id):
+        return self._handles.get(client_id, 0)
+
+    def id_of(self, handle):
+        return self._ids.get(handle)
+
+    def remove(self, client_id):
+        return self._by_id.pop(client_id, None)
+
+    def release_handle(self, client_id):
+        """Forget the handle of someone who left, once no queued frame should still mention them."""
+        if client_id not in self._by_id:
+            self._ids.pop(self._handles.pop(client_id, None), None)
+
+    def others(self, client_id):
+        return [p for p in self._by_id.values() if p.id != client_id]
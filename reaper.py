@@ -0,0 +1,83 @@
+# reaper.py - Heartbeats and eviction of silent participants
+#
+# A browser that vanishes without a close frame (laptop lid, lost Wi-Fi)
+# keeps its room slot until TCP gives up, which can take minutes, and with
+# three slots per room that locks a real user out. Every `interval` seconds
+# the reaper pings participants that have been quiet for half an interval:
+#
+#   protocol   a websocket PING; browsers answer with a PONG by themselves
+#   app        a {"type": "ping"} frame; the web client answers {"type": "pong"}
+#
+# Any frame from the client counts as a sign of life (Participant.last_seen).
+# A participant that has not answered the previous ping counts as a ghost
+# slot. One silent for longer than `timeout` is dropped without a close
+# handshake; its websocket handler then removes it and broadcasts
+# participant_left as usual.
+import asyncio
+import time
+
+
+class Reaper:
+    def __init__(self, participants, interval=10, timeout=25, mode='protocol'):
+        self.participants = participants  # callable returning every connected Participant
+        self.interval = interval
+        self.timeout = timeout
+        self.mode = mode
+        self._task = None
+
+        # Metrics
+        self.scans = 0
+        self.pings = 0
+        self.reaped = 0
+        self.ghost_slots = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"❌ Heartbeat scan failed: {e}")
+
+    def scan(self):
+        now = time.monotonic()
+        ghosts = 0
+        for p in list(self.participants()):
+            if p.closed or p.suspended:
+                continue
+            silent = now - p.last_seen
+            if silent > self.timeout:
+                self.reaped += 1
+                p.abort(f'no heartbeat for {silent:.0f}s')
+                continue
+            if silent >= 2 * self.interval:
+                # Did not answer the last ping: holding a slot, possibly for nobody
+                ghosts += 1
+            if silent >= self.interval / 2:
+                self.pings += 1
+                p.ping(self.mode)
+        self.scans += 1
+        self.ghost_slots = ghosts
+        return ghosts
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'scans': self.scans,
+            'pings': self.pings,
+            'reaped': self.reaped,
+            'ghost_slots': self.ghost_slots,
+        }
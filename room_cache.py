@@ -0,0 +1,97 @@
+# room_cache.py - LRU + TTL cache of room metadata for join_room
+#
+# Everyone joining a meeting at the same time asks for the same room row.
+# Entries live for at most `ttl` seconds and never past the room's own
+# expiry, so a cached row is always a joinable room. Concurrent misses for
+# the same room share a single database lookup.
+import asyncio
+import datetime
+import time
+from collections import OrderedDict
+
+
+class RoomCache:
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # room_id -> (deadline, row)
+        self._inflight = {}  # room_id -> Future for the pending DB lookup
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, room_id):
+        entry = self._entries.get(room_id)
+        if entry is None:
+            return None
+        deadline, row = entry
+        if time.time() >= deadline:
+            del self._entries[room_id]
+            self.expired += 1
+            return None
+        self._entries.move_to_end(room_id)
+        return row
+
+    def put(self, room_id, row):
+        """Cache a (password, expires_at, expired) row; expired rooms are not cached."""
+        password, expires_at, expired = row
+        if expired:
+            return
+        deadline = time.time() + self.ttl
+        if expires_at:
+            room_deadline = datetime.datetime.fromisoformat(expires_at).replace(
+                tzinfo=datetime.timezone.utc).timestamp()
+            deadline = min(deadline, room_deadline)
+        self._entries[room_id] = (deadline, row)
+        self._entries.move_to_end(room_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, room_id):
+        self._entries.pop(room_id, None)
+
+    async def get_or_load(self, room_id, loader):
+        """Return the cached row, or await `loader(room_id)` once for all concurrent callers."""
+        row = self.get(room_id)
+        if row is not None:
+            self.hits += 1
+            return row
+        self.misses += 1
+
+        future = self._inflight.get(room_id)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[room_id] = future
+        try:
+            row = await loader(room_id)
+            if row is not None:
+                self.put(room_id, row)
+            future.set_result(row)
+            return row
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[room_id]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'expired': self.expired,
+        }
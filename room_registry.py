@@ -0,0 +1,95 @@
+# room_registry.py - Rooms held in memory, and what they cost
+#
+# Rooms used to live in a defaultdict, so any lookup of an unknown room id
+# (a websocket with a bad token, a stray resume) quietly created an entry
+# that only a departing participant would ever delete. Rooms are now created
+# only by open(), when a participant is admitted. A room that is opened but
+# has nobody of this process in it `idle_ttl` seconds later is closed by a
+# timer on the wheel (timer_wheel.py), so no path can leave one behind.
+#
+# stats() is the memory gauge for /admin/metrics: counts of everything the
+# rooms hold, the bytes of frames waiting in outbound queues and replay
+# rings, and the process's resident set size.
+import os
+import resource
+
+from participants import ParticipantRegistry
+
+
+def _new_room():
+    return {'participants': ParticipantRegistry(), 'resume_tokens': {}, 'recording_id': None, 'media': 'mesh'}
+
+
+def rss_bytes():
+    """Current resident set size; the peak where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RoomRegistry:
+    def __init__(self, timers, idle_ttl=60):
+        self.timers = timers  # TimerWheel
+        self.idle_ttl = idle_ttl
+        self._rooms = {}
+
+        # Metrics
+        self.opened = 0
+        self.closed = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __contains__(self, room_id):
+        return room_id in self._rooms
+
+    def get(self, room_id):
+        return self._rooms.get(room_id)
+
+    def items(self):
+        return self._rooms.items()
+
+    def values(self):
+        return self._rooms.values()
+
+    def open(self, room_id):
+        """The room, created if this process has none yet."""
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = _new_room()
+            self.opened += 1
+            self.timers.schedule(self.idle_ttl, self._expire_if_idle, room_id, room)
+        return room
+
+    def close(self, room_id):
+        if self._rooms.pop(room_id, None) is not None:
+            self.closed += 1
+
+    def _expire_if_idle(self, room_id, room):
+        if self._rooms.get(room_id) is not room or any(not p.remote for p in room['participants']):
+            return
+        self.expired += 1
+        self.close(room_id)
+        print(f"🧹 Room {room_id} expired with nobody in it")
+
+    def stats(self):
+        participants = [p for room in self._rooms.values() for p in room['participants']]
+        local = [p for p in participants if not p.remote]
+        return {
+            'rooms': len(self._rooms),
+            'opened': self.opened,
+            'closed': self.closed,
+            'expired': self.expired,
+            'participants': len(local),
+            'remote_participants': len(participants) - len(local),
+            'suspended_participants': sum(1 for p in local if p.suspended),
+            'resume_tokens': sum(len(room['resume_tokens']) for room in self._rooms.values()),
+            'handles': sum(room['participants'].handle_count for room in self._rooms.values()),
+            'queued_frames': sum(p.queue_depth for p in local),
+            'replay_frames': sum(p.replay_depth for p in local),
+            'buffered_bytes': sum(p.buffered_bytes for p in local),
+            'rss_bytes': rss_bytes(),
+        }
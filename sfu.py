@@ -0,0 +1,214 @@
+# sfu.py - Media relay in the server for rooms larger than a mesh
+#
+# In a mesh every client sends its camera to every other client: one
+# encoder and one uplink stream per peer, which is why rooms stop at three.
+# A room that grows past that switches to this relay (a selective
+# forwarding unit). Each client keeps a single peer connection, to the
+# server. It publishes its audio and video there once, and the server
+# relays the other members' tracks back down the same connection, so a
+# client's uplink and encoding work stay the same however big the room is.
+#
+# Signalling runs over the room websocket:
+#
+#   sfu_offer    client -> server   the client's offer, with its own tracks
+#   sfu_answer   server -> client
+#   sfu_offer    server -> client   when tracks are added for the client
+#   sfu_answer   client -> server
+#
+# Every server message carries `tracks`, {mid: [client_id, username]}, which
+# says whose media each transceiver brings. Renegotiations with one client
+# run one at a time; changes made meanwhile are folded into the next one.
+# aiortc does not trickle ICE: its descriptions hold every candidate, and the
+# client gathers its own before sending.
+#
+# Needs `pip install aiortc`; without it rooms stay mesh-only. aiortc hands
+# received media over decoded, so each published track is decoded once
+# (MediaRelay) and encoded again for every subscriber. The server takes on
+# the CPU the clients save.
+import asyncio
+import time
+
+try:
+    from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCSessionDescription
+    from aiortc.contrib.media import MediaRelay
+except ImportError:
+    RTCPeerConnection = None
+
+
+def available():
+    return RTCPeerConnection is not None
+
+
+def _description(desc):
+    return {'sdp': desc.sdp, 'type': desc.type}
+
+
+class SfuPeer:
+    """One client's connection to the relay."""
+
+    def __init__(self, client_id, username, send, configuration):
+        self.client_id = client_id
+        self.username = username
+        self.send = send  # send(payload) to the client's websocket
+        self.pc = RTCPeerConnection(configuration)
+        self.published = []  # tracks received from this client
+        self.relays = {}  # RTCRtpSender -> (client_id, track) of the member whose media it relays
+        self.ready = False  # the client's own offer has been answered
+        self.closed = False
+        self.dirty = False  # tracks changed since the last negotiation
+        self.answer = None  # Future for the client's answer to a server offer
+        self.negotiating = None  # Task
+
+
+class Sfu:
+    def __init__(self, answer_timeout=10, stun_server=None):
+        self.answer_timeout = answer_timeout
+        self._rooms = {}  # room_id -> {client_id: SfuPeer}
+        self._relay = MediaRelay()
+        # Without a STUN server only the host's own addresses are offered
+        self._configuration = RTCConfiguration(iceServers=[RTCIceServer(stun_server)] if stun_server else [])
+
+        # Metrics
+        self.peers_opened = 0
+        self.peers_failed = 0
+        self.negotiations = 0
+        self.failed_negotiations = 0
+        self.total_negotiation_ms = 0.0
+        self.max_negotiation_ms = 0.0
+
+    def has_peer(self, room_id, client_id):
+        return client_id in self._rooms.get(room_id, {})
+
+    async def offer(self, room_id, client_id, username, send, offer):
+        """Answer a client's offer, replacing any connection it had before."""
+        self.leave(room_id, client_id)
+        room = self._rooms.setdefault(room_id, {})
+        peer = room[client_id] = SfuPeer(client_id, username, send, self._configuration)
+        self.peers_opened += 1
+
+        @peer.pc.on('track')
+        def on_track(track):
+            self._publish(room_id, peer, track)
+
+        @peer.pc.on('connectionstatechange')
+        def on_state():
+            if peer.pc.connectionState == 'failed' and not peer.closed:
+                self.peers_failed += 1
+                print(f"❌ SFU connection to {username} in room {room_id} failed")
+                self.leave(room_id, client_id)
+
+        try:
+            await peer.pc.setRemoteDescription(RTCSessionDescription(sdp=offer['sdp'], type=offer['type']))
+            await peer.pc.setLocalDescription(await peer.pc.createAnswer())
+        except Exception as e:
+            print(f"❌ SFU could not answer {username} in room {room_id}: {e}")
+            self.leave(room_id, client_id)
+            return
+        if peer.closed:
+            return
+        peer.ready = True
+        send({'type': 'sfu_answer', 'answer': _description(peer.pc.localDescription), 'tracks': {}})
+        # The other members' tracks follow in an offer of our own
+        self._renegotiate(room_id, peer)
+
+    def answer(self, room_id, client_id, answer):
+        peer = self._rooms.get(room_id, {}).get(client_id)
+        if peer is not None and peer.answer is not None and not peer.answer.done():
+            peer.answer.set_result(answer)
+
+    def leave(self, room_id, client_id):
+        room = self._rooms.get(room_id)
+        peer = room.pop(client_id, None) if room else None
+        if peer is None:
+            return
+        peer.closed = True
+        if peer.negotiating is not None:
+            peer.negotiating.cancel()
+        asyncio.ensure_future(peer.pc.close())
+        # Free the transceivers that carried its media; later tracks reuse them
+        for other in room.values():
+            for sender in [s for s, (owner, _) in other.relays.items() if owner == client_id]:
+                sender.replaceTrack(None)
+                del other.relays[sender]
+        if not room:
+            del self._rooms[room_id]
+
+    async def close(self):
+        peers = [peer for room in self._rooms.values() for peer in room.values()]
+        for room_id, room in list(self._rooms.items()):
+            for client_id in list(room):
+                self.leave(room_id, client_id)
+        await asyncio.gather(*(peer.pc.close() for peer in peers), return_exceptions=True)
+
+    def _publish(self, room_id, peer, track):
+        peer.published.append(track)
+        # Members still waiting for their answer get it in their first renegotiation
+        for other in list(self._rooms.get(room_id, {}).values()):
+            if other is not peer and other.ready:
+                self._renegotiate(room_id, other)
+
+    def _attach(self, subscriber, publisher, track):
+        if any(source is track for _, source in subscriber.relays.values()):
+            return False
+        sender = subscriber.pc.addTrack(self._relay.subscribe(track))
+        subscriber.relays[sender] = (publisher.client_id, track)
+        return True
+
+    def _tracks(self, room, peer):
+        tracks = {}
+        for transceiver in peer.pc.getTransceivers():
+            owner = room.get(peer.relays.get(transceiver.sender, (None,))[0])
+            if transceiver.mid is not None and owner is not None:
+                tracks[transceiver.mid] = [owner.client_id, owner.username]
+        return tracks
+
+    def _renegotiate(self, room_id, peer):
+        peer.dirty = True
+        if peer.negotiating is None or peer.negotiating.done():
+            peer.negotiating = asyncio.create_task(self._negotiate(room_id, peer))
+
+    async def _negotiate(self, room_id, peer):
+        while peer.dirty and not peer.closed:
+            peer.dirty = False
+            room = self._rooms.get(room_id, {})
+            # Tracks are only added here, while no offer or answer is pending
+            added = [self._attach(peer, other, track)
+                     for other in list(room.values()) if other is not peer for track in other.published]
+            if not any(added):
+                continue
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            try:
+                await peer.pc.setLocalDescription(await peer.pc.createOffer())
+                peer.answer = loop.create_future()
+                peer.send({'type': 'sfu_offer', 'offer': _description(peer.pc.localDescription),
+                           'tracks': self._tracks(room, peer)})
+                answer = await asyncio.wait_for(peer.answer, self.answer_timeout)
+                await peer.pc.setRemoteDescription(RTCSessionDescription(sdp=answer['sdp'], type=answer['type']))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_negotiations += 1
+                print(f"❌ SFU renegotiation with {peer.username} failed: {e!r}")
+                return
+            finally:
+                peer.answer = None
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.negotiations += 1
+            self.total_negotiation_ms += elapsed_ms
+            self.max_negotiation_ms = max(self.max_negotiation_ms, elapsed_ms)
+
+    def stats(self):
+        peers = [peer for room in self._rooms.values() for peer in room.values()]
+        return {
+            'rooms': len(self._rooms),
+            'peers': len(peers),
+            'published_tracks': sum(len(peer.published) for peer in peers),
+            'relayed_tracks': sum(len(peer.relays) for peer in peers),
+            'peers_opened': self.peers_opened,
+            'peers_failed': self.peers_failed,
+            'negotiations': self.negotiations,
+            'failed_negotiations': self.failed_negotiations,
+            'avg_negotiation_ms': round(self.total_negotiation_ms / self.negotiations, 3) if self.negotiations else 0.0,
+            'max_negotiation_ms': round(self.max_negotiation_ms, 3),
+        }
@@ -0,0 +1,227 @@
+# storage.py - Pluggable persistence backends
+#
+# Handlers, the chat persister and the sweeper only talk to the `Storage`
+# interface below. `SQLiteStorage` (db.py) is the production backend;
+# `MemoryStorage` keeps everything in process memory, which is handy for
+# benchmarks and load tests that should not measure the disk. Any backend
+# must pass benchmarks/storage_conformance.py.
+import abc
+import bisect
+import datetime
+
+
+class Storage(abc.ABC):
+    # -----------------------------
+    # Rooms
+    # -----------------------------
+    @abc.abstractmethod
+    async def create_room(self, room_id, password, ttl_hours=24):
+        """Insert a room; returns False if the room ID is already taken."""
+
+    @abc.abstractmethod
+    async def get_room(self, room_id):
+        """Returns (password, expires_at, expired) or None."""
+
+    # -----------------------------
+    # Messages
+    # -----------------------------
+    @abc.abstractmethod
+    async def add_messages(self, rows):
+        """Insert (room_id, client_id, username, message) rows in one transaction."""
+
+    @abc.abstractmethod
+    async def get_history(self, room_id, before_id=None, after_id=None, limit=50):
+        """Keyset-paginated chat history, newest page first by default.
+
+        Returns {'messages': [...], 'has_more': bool}; messages are in
+        chronological order and `has_more` tells whether another page exists
+        in the direction being paged (older for before_id, newer for after_id).
+        """
+
+    # -----------------------------
+    # Recordings
+    # -----------------------------
+    @abc.abstractmethod
+    async def save_recording(self, room_id, started_at, duration_seconds, participants):
+        """Store call metadata sent by the client on hangup."""
+
+    # -----------------------------
+    # Expiry / maintenance
+    # -----------------------------
+    @abc.abstractmethod
+    async def purge_expired(self, batch_size=500, rooms_per_batch=50, exclude=(), archive=None):
+        """Delete one batch of data belonging to expired rooms.
+
+        Each call touches at most `batch_size` rows per table. Returns a dict
+        of deleted row counts plus 'done', which is True once no expired rooms
+        (outside `exclude`) remain. If `archive` is given it is called with the
+        message dicts (id, room_id, client_id, username, message, timestamp,
+        plus the room's created_at as room_created_at) about to be deleted;
+        if it raises, they are kept.
+        """
+
+    async def incremental_vacuum(self, pages):
+        """Return up to `pages` free pages to the filesystem; returns pages freed."""
+        return 0
+
+    # -----------------------------
+    # Admin
+    # -----------------------------
+    @abc.abstractmethod
+    async def admin_data(self):
+        """Latest rooms, messages and recordings for the admin panel."""
+
+    def close(self):
+        pass
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def _sql_timestamp(dt):
+    # Same text format SQLite's CURRENT_TIMESTAMP produces
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self._rooms = {}  # room_id -> {'password', 'created_at', 'expires_at'}
+        self._messages = {}  # room_id -> [message dict], ordered by id
+        self._message_ids = {}  # room_id -> [id], parallel to _messages for bisecting
+        self._recordings = []
+        self._next_message_id = 1
+        self._next_recording_id = 1
+
+    # -----------------------------
+    # Rooms
+    # -----------------------------
+    async def create_room(self, room_id, password, ttl_hours=24):
+        if room_id in self._rooms:
+            return False
+        now = _utc_now()
+        self._rooms[room_id] = {
+            'password': password,
+            'created_at': _sql_timestamp(now),
+            'expires_at': _sql_timestamp(now + datetime.timedelta(hours=ttl_hours)),
+        }
+        return True
+
+    async def get_room(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            return None
+        expired = room['expires_at'] <= _sql_timestamp(_utc_now())
+        return (room['password'], room['expires_at'], expired)
+
+    # -----------------------------
+    # Messages
+    # -----------------------------
+    async def add_messages(self, rows):
+        timestamp = _sql_timestamp(_utc_now())
+        for room_id, client_id, username, message in rows:
+            self._message_ids.setdefault(room_id, []).append(self._next_message_id)
+            self._messages.setdefault(room_id, []).append({
+                'id': self._next_message_id,
+                'room_id': room_id,
+                'client_id': client_id,
+                'username': username,
+                'message': message,
+                'timestamp': timestamp,
+            })
+            self._next_message_id += 1
+
+    async def get_history(self, room_id, before_id=None, after_id=None, limit=50):
+        messages = self._messages.get(room_id, [])
+        ids = self._message_ids.get(room_id, [])
+        if after_id is not None:
+            start = bisect.bisect_right(ids, after_id)
+            page = messages[start:start + limit]
+            has_more = start + limit < len(messages)
+        else:
+            end = bisect.bisect_left(ids, before_id) if before_id is not None else len(messages)
+            start = max(0, end - limit)
+            page = messages[start:end]
+            has_more = start > 0
+        return {
+            'messages': [{'id': m['id'], 'username': m['username'], 'message': m['message'],
+                          'timestamp': m['timestamp']} for m in page],
+            'has_more': has_more,
+        }
+
+    # -----------------------------
+    # Recordings
+    # -----------------------------
+    async def save_recording(self, room_id, started_at, duration_seconds, participants):
+        self._recordings.append({
+            'id': self._next_recording_id,
+            'room_id': room_id,
+            'started_at': started_at,
+            'ended_at': datetime.datetime.now().isoformat(),
+            'duration_seconds': duration_seconds,
+            'participants': participants,
+        })
+        self._next_recording_id += 1
+
+    # -----------------------------
+    # Expiry / maintenance
+    # -----------------------------
+    async def purge_expired(self, batch_size=500, rooms_per_batch=50, exclude=(), archive=None):
+        now = _sql_timestamp(_utc_now())
+        exclude = set(exclude)
+        expired = sorted((room['expires_at'], room_id) for room_id, room in self._rooms.items()
+                         if room['expires_at'] <= now and room_id not in exclude)
+        room_ids = [room_id for _, room_id in expired[:rooms_per_batch]]
+        result = {'rooms': 0, 'messages': 0, 'recordings': 0, 'done': not room_ids}
+        if not room_ids:
+            return result
+
+        for room_id in room_ids:
+            messages = self._messages.get(room_id)
+            if not messages:
+                continue
+            take = min(len(messages), batch_size - result['messages'])
+            if archive:
+                archive([dict(m, room_created_at=self._rooms[room_id]['created_at']) for m in messages[:take]])
+            del messages[:take]
+            del self._message_ids[room_id][:take]
+            result['messages'] += take
+            if not messages:
+                del self._messages[room_id]
+                del self._message_ids[room_id]
+            if result['messages'] >= batch_size:
+                return result
+
+        doomed = set(room_ids)
+        keep, dropped = [], 0
+        for recording in self._recordings:
+            if recording['room_id'] in doomed and dropped < batch_size:
+                dropped += 1
+            else:
+                keep.append(recording)
+        self._recordings = keep
+        result['recordings'] = dropped
+        if dropped >= batch_size:
+            return result
+
+        for room_id in room_ids:
+            del self._rooms[room_id]
+        result['rooms'] = len(room_ids)
+        return result
+
+    # -----------------------------
+    # Admin
+    # -----------------------------
+    async def admin_data(self):
+        rooms = sorted(self._rooms.items(), key=lambda item: item[1]['created_at'], reverse=True)[:50]
+        messages = sorted((m for ms in self._messages.values() for m in ms), key=lambda m: m['id'], reverse=True)[:100]
+        recordings = list(reversed(self._recordings))[:50]
+        return {
+            'rooms': [{'room_id': room_id, 'created_at': r['created_at'], 'has_password': bool(r['password'])}
+                      for room_id, r in rooms],
+            'messages': [{'room_id': m['room_id'], 'username': m['username'], 'message': m['message'],
+                          'timestamp': m['timestamp']} for m in messages],
+            'recordings': [{'room_id': r['room_id'], 'started_at': r['started_at'], 'ended_at': r['ended_at'],
+                            'duration_seconds': r['duration_seconds'], 'participants': r['participants']}
+                           for r in recordings],
+        }
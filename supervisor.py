@@ -0,0 +1,115 @@
+# supervisor.py - Run the server as several worker processes on one port
+#
+# One Python process serves every room on a single core. With WORKERS > 1
+# `python main.py` starts this supervisor instead, which:
+#
+#   - runs the schema migrations once, before any worker opens the database
+#   - starts the backplane broker (backplane.py) on a Unix socket and gives
+#     the workers a common join token secret (join_tokens.py)
+#   - starts WORKERS copies of main.py with WORKER_ID set; each binds the same
+#     port with SO_REUSEPORT, so the kernel spreads connections across them
+#   - restarts a worker that dies; the broker tells its rooms who was lost
+#   - on SIGHUP, restarts the workers one at a time: each is drained
+#     (drain.py), so its rooms move to the others, and the next one is only
+#     drained once its replacement has joined the broker
+#   - on SIGTERM, drains all workers and then stops the broker; on SIGINT,
+#     stops them at once
+#
+# Workers share the SQLite database (WAL). Only worker 1 runs the room sweeper,
+# with the active rooms of every worker as reported by the broker.
+import asyncio
+import os
+import secrets
+import signal
+import socket
+import sys
+
+import config
+import migrations
+from backplane import Broker
+from join_tokens import ReplayFilter
+
+RESTART_DELAY_SECONDS = 1
+
+
+async def _keep_running(script, worker_id, procs, stopping, restarting):
+    env = dict(os.environ, WORKER_ID=str(worker_id), BACKPLANE_SOCKET=config.BACKPLANE_SOCKET)
+    while not stopping.is_set():
+        proc = await asyncio.create_subprocess_exec(sys.executable, script, env=env)
+        procs[worker_id] = proc
+        code = await proc.wait()
+        if worker_id in restarting:
+            restarting.discard(worker_id)
+            print(f"♻️ Worker {worker_id} drained; restarting")
+            continue
+        await asyncio.sleep(RESTART_DELAY_SECONDS)
+        if not stopping.is_set():
+            print(f"💥 Worker {worker_id} exited with code {code}; restarting")
+
+
+async def _rolling_restart(procs, broker, stopping, restarting):
+    for worker_id in sorted(procs):
+        proc = procs[worker_id]
+        if stopping.is_set():
+            return
+        if proc.returncode is not None:
+            continue
+        print(f"♻️ Draining worker {worker_id}...")
+        restarting.add(worker_id)
+        proc.send_signal(signal.SIGTERM)
+        await proc.wait()
+        # Its rooms are moving to the others; keep them up until it is back
+        while not stopping.is_set() and (procs[worker_id] is proc or not broker.ready(worker_id)):
+            await asyncio.sleep(0.1)
+    print('♻️ Rolling restart done')
+
+
+async def _supervise(script, workers):
+    replay_filter = ReplayFilter(bits=config.JOIN_TOKEN_FILTER_BITS, window=config.JOIN_TOKEN_TTL_SECONDS)
+    broker = Broker(config.BACKPLANE_SOCKET, replay_filter)
+    await broker.start()
+
+    stopping = asyncio.Event()
+    stop_signal = [signal.SIGTERM]
+    rolling = [None]
+    procs = {}
+    restarting = set()
+
+    def stop(sig):
+        stop_signal[0] = sig
+        stopping.set()
+
+    def restart():
+        if rolling[0] is None or rolling[0].done():
+            rolling[0] = asyncio.create_task(_rolling_restart(procs, broker, stopping, restarting))
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop, sig)
+    loop.add_signal_handler(signal.SIGHUP, restart)
+
+    tasks = [asyncio.create_task(_keep_running(script, worker_id, procs, stopping, restarting))
+             for worker_id in range(1, workers + 1)]
+    print(f'🚀 Video Call Server Starting with {workers} workers...')
+    print('📍 URL: http://127.0.0.1:9080')
+
+    await stopping.wait()
+    # SIGTERM lets the workers drain; the broker serves them until they are done
+    print('🛑 Draining workers...' if stop_signal[0] == signal.SIGTERM else '🛑 Stopping workers...')
+    for proc in procs.values():
+        if proc.returncode is None:
+            proc.send_signal(stop_signal[0])
+    await asyncio.gather(*tasks)
+    await broker.close()
+
+
+def run(script, workers):
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        sys.exit('❌ WORKERS > 1 needs SO_REUSEPORT, which this platform does not have')
+    if config.STORAGE_BACKEND == 'memory':
+        sys.exit('❌ WORKERS > 1 needs the sqlite storage backend; memory storage is per process')
+
+    migrations.migrate(config.DB_PATH)
+    # Every worker must accept the join tokens the others sign
+    os.environ['JOIN_TOKEN_SECRET'] = config.JOIN_TOKEN_SECRET or secrets.token_hex(32)
+    asyncio.run(_supervise(script, workers))
@@ -0,0 +1,104 @@
+# sweeper.py - Background purge of expired rooms, chat and recordings
+#
+# Rooms stop being joinable after ROOM_TTL_HOURS but their rows used to stay
+# forever. Every `interval` seconds the sweeper deletes expired rooms in small
+# batches (one short write transaction each, yielding to the event loop in
+# between), skips rooms that still have people in a call, and then returns
+# freed pages to the filesystem with an incremental vacuum. When an archive is
+# configured, chat is moved into compressed segments (archive.py) rather than
+# dropped.
+import asyncio
+import time
+
+
+class RoomSweeper:
+    def __init__(self, db, interval=300, batch_size=500, rooms_per_batch=50, vacuum_pages=2000,
+                 active_rooms=lambda: (), archive=None):
+        self.db = db
+        self.archive = archive
+        self.interval = interval
+        self.batch_size = batch_size
+        self.rooms_per_batch = rooms_per_batch
+        self.vacuum_pages = vacuum_pages
+        self.active_rooms = active_rooms
+        self._task = None
+
+        # Metrics
+        self.sweeps = 0
+        self.batches = 0
+        self.rooms_purged = 0
+        self.messages_purged = 0
+        self.recordings_purged = 0
+        self.pages_vacuumed = 0
+        self.last_sweep_ms = 0.0
+        self.max_sweep_ms = 0.0
+        self.last_sweep_at = None
+        self.errors = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Room sweep failed: {e}")
+
+    async def sweep(self):
+        started = time.perf_counter()
+        purged = {'rooms': 0, 'messages': 0, 'recordings': 0}
+
+        while True:
+            result = await self.db.purge_expired(self.batch_size, self.rooms_per_batch,
+                                                 exclude=list(self.active_rooms()),
+                                                 archive=self.archive.append if self.archive else None)
+            self.batches += 1
+            for key in purged:
+                purged[key] += result[key]
+            if result['done']:
+                break
+            await asyncio.sleep(0)  # let websocket traffic through between batches
+
+        if any(purged.values()):
+            self.pages_vacuumed += await self.db.incremental_vacuum(self.vacuum_pages)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.sweeps += 1
+        self.rooms_purged += purged['rooms']
+        self.messages_purged += purged['messages']
+        self.recordings_purged += purged['recordings']
+        self.last_sweep_ms = elapsed_ms
+        self.max_sweep_ms = max(self.max_sweep_ms, elapsed_ms)
+        self.last_sweep_at = time.time()
+
+        if purged['rooms']:
+            print(f"🧹 Purged {purged['rooms']} expired rooms, {purged['messages']} messages, "
+                  f"{purged['recordings']} recordings in {elapsed_ms:.0f}ms")
+        return purged
+
+    def stats(self):
+        return {
+            'sweeps': self.sweeps,
+            'batches': self.batches,
+            'rooms_purged': self.rooms_purged,
+            'messages_purged': self.messages_purged,
+            'recordings_purged': self.recordings_purged,
+            'pages_vacuumed': self.pages_vacuumed,
+            'last_sweep_ms': round(self.last_sweep_ms, 3),
+            'max_sweep_ms': round(self.max_sweep_ms, 3),
+            'last_sweep_at': self.last_sweep_at,
+            'errors': self.errors,
+        }
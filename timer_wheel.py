@@ -0,0 +1,92 @@
+# timer_wheel.py - Coarse timers for expiring room state
+#
+# Every dropped websocket arms a resume grace timer, and every departure
+# arms one to forget the participant's binary handle. With asyncio's
+# call_later each of those is an entry in the event loop's heap, and every
+# cancellation leaves a dead entry behind until its deadline. These timers
+# only need second resolution, so they go into a hashed timing wheel
+# instead: `slots` buckets, one per tick. Scheduling and cancelling are O(1),
+# and a single task advances the wheel once per tick and fires what is due.
+# A timer further out than one turn of the wheel waits in its bucket for
+# later turns.
+import asyncio
+import math
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'args', '_slot')
+
+    def __init__(self, deadline, callback, args, slot):
+        self.deadline = deadline  # in ticks
+        self.callback = callback
+        self.args = args
+        self._slot = slot
+
+    def cancel(self):
+        if self._slot is not None:
+            self._slot.discard(self)
+            self._slot = None
+
+
+class TimerWheel:
+    def __init__(self, tick=1.0, slots=512):
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._now = 0  # ticks advanced so far
+        self._task = None
+
+        # Metrics
+        self.scheduled = 0
+        self.fired = 0
+
+    def __len__(self):
+        return sum(len(slot) for slot in self._slots)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) after about `delay` seconds (rounded up to whole ticks)."""
+        deadline = self._now + max(1, math.ceil(delay / self.tick))
+        slot = self._slots[deadline % len(self._slots)]
+        timer = Timer(deadline, callback, args, slot)
+        slot.add(timer)
+        self.scheduled += 1
+        return timer
+
+    def advance(self):
+        self._now += 1
+        slot = self._slots[self._now % len(self._slots)]
+        for timer in [t for t in slot if t.deadline <= self._now]:
+            timer.cancel()
+            self.fired += 1
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"❌ Timer {timer.callback.__name__} failed: {e}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            await asyncio.sleep(max(0.0, started + (self._now + 1) * self.tick - loop.time()))
+            # Catch up on ticks missed while the loop was busy
+            while started + (self._now + 1) * self.tick <= loop.time():
+                self.advance()
+
+    def stats(self):
+        return {
+            'pending': len(self),
+            'scheduled': self.scheduled,
+            'fired': self.fired,
+        }